@@ -0,0 +1,64 @@
+"""
+Compare the line classification with the previous implementation, that was running all the regular
+expressions on every line.
+
+Run with: python -m benchmarks.classifier [--lines=1000000]
+"""
+
+import argparse
+import re
+import time
+from typing import Callable, List
+
+from benchmarks.corpus import NEW_KERNEL_OOM, OLD_KERNEL_OOM, Corpus
+from es_oom_exporter.dmesg import CLASSIFIER, CONTAINER_RE, OOM_KILL_RE, OOM_RE, START_RE
+
+TIMESTAMP_RE = re.compile(r"\[\s*(\d+\.\d+)\].*")
+
+
+def _get_lines(nb_lines: int, oom_rate: float) -> List[str]:
+    corpus = Corpus(nb_pods=1000, oom_rate=oom_rate, noise_ratio=0)
+    return [
+        f"[{i / 1000:12.6f}] {message}"
+        for i, message in enumerate(corpus.get_messages(nb_lines, OLD_KERNEL_OOM + NEW_KERNEL_OOM))
+    ]
+
+
+def _previous(lines: List[str]) -> int:
+    nb_matches = 0
+    for line in lines:
+        TIMESTAMP_RE.match(line)
+        start_match = START_RE.match(line)
+        pod_match = CONTAINER_RE.match(line)
+        oom_match = OOM_RE.match(line)
+        oom_kill_match = OOM_KILL_RE.match(line)
+        if start_match or pod_match or oom_match or oom_kill_match:
+            nb_matches += 1
+    return nb_matches
+
+
+def _current(lines: List[str]) -> int:
+    return sum(1 for _ in CLASSIFIER.classify_all(lines))
+
+
+def _run(name: str, function: Callable[[List[str]], int], lines: List[str]) -> None:
+    start = time.perf_counter()
+    nb_matches = function(lines)
+    duration = time.perf_counter() - start
+    print(f"{name}: {len(lines) / duration:,.0f} lines/s ({nb_matches} matches)")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=1000000, help="Number of lines")
+    parser.add_argument("--oom-ratio", type=float, default=0.001, help="Ratio of OOM events per line")
+    args = parser.parse_args()
+
+    lines = _get_lines(args.lines, args.oom_ratio)
+    _run("before", _previous, lines)
+    _run("after", _current, lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Generate synthetic kernel logs and Elasticsearch hits."""
+
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from es_oom_exporter.pod_index import PodIndex, PodInfo
+
+NOISE = [
+    "IPv6: ADDRCONF(NETDEV_CHANGE): veth{id:x}: link becomes ready",
+    "cni0: port {id}(veth{id:x}) entered forwarding state",
+    'audit: type=1400 audit({id}.123:42): apparmor="STATUS" operation="profile_load" name="docker-default"',
+    "eth0: renamed from tmp{id:x}",
+    "EXT4-fs (nvme0n1p1): mounted filesystem with ordered data mode. Opts: (null)",
+]
+# OOM of a cgroup that is not a POD, pass the line pre-filter
+OOM_NOISE = [
+    "Task in /system.slice/docker.service killed as a result of limit of /system.slice/docker.service",
+    "Memory cgroup stats for /system.slice/docker.service: cache:0KB rss:36KB rss_huge:0KB shmem:0KB",
+    "Memory cgroup out of memory: Killed process {id} (dockerd) total-vm:1024kB, anon-rss:36kB",
+]
+STATS = (
+    "cache:{cache}KB rss:{rss}KB rss_huge:0KB shmem:0KB mapped_file:0KB dirty:0KB writeback:0KB swap:0KB "
+    "inactive_anon:0KB active_anon:{rss}KB inactive_file:0KB active_file:{cache}KB unevictable:0KB"
+)
+OLD_KERNEL_OOM = [
+    "Task in /kubepods/burstable/pod{pod}/{container} killed as a result of limit of "
+    "/kubepods/burstable/pod{pod}",
+    "Memory cgroup stats for /kubepods/burstable/pod{pod}: " + STATS,
+    "Memory cgroup stats for /kubepods/burstable/pod{pod}/{container}: " + STATS,
+    "Memory cgroup out of memory: Kill process {id} (java) score 1894 or sacrifice child",
+]
+NEW_KERNEL_OOM = [
+    "oom-kill:constraint=CONSTRAINT_MEMCG,nodemask=(null),cpuset={container},mems_allowed=0,"
+    "oom_memcg=/kubepods/burstable/pod{pod}/{container},task_memcg=/kubepods/burstable/pod{pod}/{container},"
+    "task=java,pid={id},uid=1000",
+]
+ES_OOM = [
+    "Task in /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod{es_pod}.slice/"
+    "docker-{container}.scope killed as a result of limit of "
+    "/kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod{es_pod}.slice",
+    "Memory cgroup stats for /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod{es_pod}.slice/"
+    "docker-{container}.scope: " + STATS,
+    "Memory cgroup out of memory: Kill process {id} (java) score 1534 or sacrifice child",
+]
+
+
+class Corpus:
+    """
+    Synthetic kernel logs.
+
+    For each line, an OOM event is started with the `oom_rate` probability. The other lines are noise,
+    with a `noise_ratio` share of OOM-like noise (cgroups that are not PODs, that pass the pre-filter), the
+    rest being unrelated messages.
+    """
+
+    def __init__(self, nb_pods: int, oom_rate: float, noise_ratio: float, seed: int = 42) -> None:
+        self.rand = random.Random(seed)  # nosec
+        self.oom_rate = oom_rate
+        self.noise_ratio = noise_ratio
+        self.pods: List[Tuple[str, str]] = [
+            (f"{self.rand.getrandbits(32):08x}-5fc5-4617-ae95-{self.rand.getrandbits(48):012x}", f"{i:064x}")
+            for i in range(nb_pods)
+        ]
+
+    def get_pod_infos(self) -> PodIndex:
+        index = PodIndex(grace_period=600)
+        index.replace(
+            {
+                pod: PodInfo(
+                    namespace=f"ns{i % 100}",
+                    release="release",
+                    service="service",
+                    pod_name=f"pod{i}",
+                    containers=((container, "container"),),
+                )
+                for i, (pod, container) in enumerate(self.pods)
+            }
+        )
+        return index
+
+    def get_event(self, events: List[str]) -> List[str]:
+        """Get the messages of an OOM event of a random POD."""
+        pod, container = self.rand.choice(self.pods)
+        values = {
+            "pod": pod,
+            "es_pod": pod.replace("-", "_"),
+            "container": container,
+            "id": self.rand.randint(1, 100000),
+            "rss": self.rand.randint(1, 1000000),
+            "cache": self.rand.randint(0, 1000),
+        }
+        return [line.format(**values) for line in events]
+
+    def get_messages(self, nb_lines: int, events: List[str], hosts: Optional[List[str]] = None) -> List[str]:
+        """Get the messages, with a syslog prefix if we have hosts."""
+        messages: List[str] = []
+        while len(messages) < nb_lines:
+            prefix = f"Sep 19 08:35:40 {self.rand.choice(hosts)} kernel: " if hosts else ""
+            if self.rand.random() < self.oom_rate:
+                messages += [prefix + line for line in self.get_event(events)]
+            elif self.rand.random() < self.noise_ratio:
+                messages.append(prefix + self.rand.choice(OOM_NOISE).format(id=len(messages)))
+            else:
+                messages.append(prefix + self.rand.choice(NOISE).format(id=len(messages)))
+        return messages
+
+    def get_dmesg_lines(self, nb_lines: int, new_kernel: bool = False) -> List[bytes]:
+        """Get an output of the dmesg command."""
+        messages = self.get_messages(nb_lines, NEW_KERNEL_OOM if new_kernel else OLD_KERNEL_OOM)
+        return [f"[{i / 1000:12.6f}] {message}\n".encode() for i, message in enumerate(messages)]
+
+    def get_es_pages(self, nb_hits: int, page_size: int, nb_hosts: int) -> List[List[Dict[str, Any]]]:
+        """Get the hits of the Elasticsearch search requests."""
+        hosts = [f"ip-10-10-10-{i}" for i in range(nb_hosts)]
+        hits = []
+        for i, message in enumerate(self.get_messages(nb_hits, ES_OOM, hosts)):
+            timestamp = 1568882140000 + i
+            hits.append(
+                {
+                    "_source": {"message": message},
+                    "fields": {"@timestamp": [str(timestamp)]},
+                    "sort": [timestamp, i],
+                }
+            )
+        return [hits[i : i + page_size] for i in range(0, len(hits), page_size)]
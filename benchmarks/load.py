@@ -0,0 +1,367 @@
+"""
+End-to-end load test: run the exporter against local stand-ins of Elasticsearch and of the Kubernetes API
+server, and scrape its metrics.
+
+The fake Elasticsearch generates OOM events at the given rate on the given number of hosts, for the PODs
+served by the fake API server. The report contains the scrape latency percentiles, the requests and bytes
+served by the stand-ins, and the CPU and memory used by the exporter (from its process metrics).
+
+Run with: python -m benchmarks.load [--pods=5000] [--event-rate=50] [--duration=60]
+"""
+
+import argparse
+import bisect
+import gzip
+import json
+import os
+import statistics
+import subprocess  # nosec
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.corpus import ES_OOM, Corpus
+
+_ENV = {
+    "LOG_CONFIG": "production.ini",
+    "LOG_TYPE": "console",
+    "LOG_LEVEL": "ERROR",
+    "OTHER_LOG_LEVEL": "ERROR",
+    "C2CWSGIUTILS_LOG_LEVEL": "WARN",
+}
+
+
+class _StandIn(ThreadingHTTPServer):
+    """Count the requests and the bytes, and add some latency."""
+
+    daemon_threads = True
+
+    def __init__(self, handler: type, latency: float) -> None:
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.requests: Dict[str, int] = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # The exporter is terminated with its connections open
+        pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StandIn
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, kind: str, body: bytes, status: int = 200) -> None:
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests[kind] += 1
+            self.server.bytes_sent += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        pass
+
+
+class FakeElasticSearch(_StandIn):
+    """Generate the hits of OOM events at a constant rate, answer the search_after queries."""
+
+    def __init__(self, corpus: Corpus, event_rate: float, nb_hosts: int, latency: float) -> None:
+        super().__init__(_ElasticSearchHandler, latency)
+        self.corpus = corpus
+        self.event_rate = event_rate
+        self.hosts = [f"ip-10-10-{i // 256}-{i % 256}" for i in range(nb_hosts)]
+        self.hits: List[Dict[str, Any]] = []
+        self.timestamps: List[int] = []
+        self.nb_events = 0
+        self._start = time.monotonic()
+
+    def _generate(self) -> None:
+        expected = int((time.monotonic() - self._start) * self.event_rate)
+        while self.nb_events < expected:
+            host = self.corpus.rand.choice(self.hosts)
+            timestamp = int(time.time() * 1000)
+            for message in self.corpus.get_event(ES_OOM):
+                self.hits.append(
+                    {
+                        "_source": {"message": f"Sep 19 08:35:40 {host} kernel: {message}"},
+                        "fields": {"@timestamp": [str(timestamp)]},
+                        "sort": [timestamp, len(self.hits)],
+                    }
+                )
+                self.timestamps.append(timestamp)
+            self.nb_events += 1
+
+    def search(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with self.lock:
+            self._generate()
+            if "search_after" in query:
+                start = query["search_after"][1] + 1
+            else:
+                time_range = query["query"]["bool"]["filter"][-1]["range"]["@timestamp"]
+                start = bisect.bisect_left(self.timestamps, int(time_range["gte"]))
+            return self.hits[start : start + query["size"]]
+
+
+class _ElasticSearchHandler(_Handler):
+    server: FakeElasticSearch
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        hits = self.server.search(json.loads(body))
+        self._send("search", json.dumps({"hits": {"hits": hits}} if hits else {}).encode())
+
+
+class FakeKubernetes(_StandIn):
+    """The endpoints used by the exporter, with the PODs of the corpus."""
+
+    def __init__(self, corpus: Corpus, nb_namespaces: int, openshift: bool, latency: float) -> None:
+        super().__init__(_KubernetesHandler, latency)
+        self.openshift = openshift
+        self.namespaces = [f"ns{i}" for i in range(nb_namespaces)]
+        pods: Dict[str, List[Dict[str, Any]]] = {namespace: [] for namespace in self.namespaces}
+        for i, (pod_uid, container_id) in enumerate(corpus.pods):
+            namespace = self.namespaces[i % nb_namespaces]
+            pods[namespace].append(_get_pod(namespace, f"pod{i}", pod_uid, container_id))
+        # Serialized once, the stand-in must not be the bottleneck
+        self.namespace_pods = {namespace: _get_list("PodList", items) for namespace, items in pods.items()}
+        self.all_pods = _get_list("PodList", [pod for items in pods.values() for pod in items])
+        self.namespace_list = _get_list(
+            "ProjectList" if openshift else "NamespaceList",
+            [{"metadata": {"name": namespace}} for namespace in self.namespaces],
+        )
+
+
+def _get_pod(namespace: str, name: str, pod_uid: str, container_id: str) -> Dict[str, Any]:
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "uid": pod_uid,
+            "labels": {"release": f"release-{name}", "service": "service"},
+        },
+        "status": {
+            "containerStatuses": [
+                {
+                    "name": "container",
+                    "containerID": f"docker://{container_id}",
+                    "image": "image",
+                    "imageID": "image",
+                    "ready": True,
+                    "restartCount": 0,
+                    "state": {"running": {}},
+                    "lastState": {},
+                }
+            ]
+        },
+    }
+
+
+def _get_list(kind: str, items: List[Dict[str, Any]]) -> bytes:
+    return json.dumps(
+        {"kind": kind, "apiVersion": "v1", "metadata": {"resourceVersion": "1"}, "items": items}
+    ).encode()
+
+
+def _get_version(git_version: str) -> Dict[str, str]:
+    return {
+        "major": "1",
+        "minor": "26",
+        "gitVersion": git_version,
+        "gitCommit": "0",
+        "gitTreeState": "clean",
+        "buildDate": "2023-01-01T00:00:00Z",
+        "goVersion": "go1.19",
+        "compiler": "gc",
+        "platform": "linux/amd64",
+    }
+
+
+class _KubernetesHandler(_Handler):
+    server: FakeKubernetes
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        path = url.path.rstrip("/")
+        parts = path.strip("/").split("/")
+        if path == "/version":
+            git_version = "v1.26.0" if self.server.openshift else "v1.26.0-eks-1234"
+            self._send("version", json.dumps(_get_version(git_version)).encode())
+        elif path in ("/api/v1/namespaces", "/apis/project.openshift.io/v1/projects"):
+            self._send("namespaces", self.server.namespace_list)
+        elif path == "/api/v1/pods" and params.get("watch", "").lower() == "true":
+            # Nothing changes, the watch ends after its timeout
+            time.sleep(float(params.get("timeoutSeconds", "300")))
+            self._send("watch", b"")
+        elif path == "/api/v1/pods":
+            self._send("list_all_pods", self.server.all_pods)
+        elif len(parts) == 5 and parts[:3] == ["api", "v1", "namespaces"] and parts[4] == "pods":
+            self._send(
+                "list_namespaced_pod", self.server.namespace_pods.get(parts[3], _get_list("PodList", []))
+            )
+        else:
+            self._send("not_found", b"{}", status=404)
+
+
+def _write_kubeconfig(directory: str, url: str) -> str:
+    path = os.path.join(directory, "kubeconfig")
+    config = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": "fake", "cluster": {"server": url}}],
+        "users": [{"name": "fake", "user": {"token": "fake"}}],
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake"}}],
+        "current-context": "fake",
+    }
+    with open(path, "w", encoding="utf-8") as config_file:
+        # JSON is valid YAML
+        json.dump(config, config_file)
+    return path
+
+
+def _get(url: str) -> Tuple[int, bytes]:
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:  # nosec
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+
+
+def _wait_ready(url: str, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if _get(f"{url}/ready")[0] == 200:
+                return time.perf_counter() - start
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError("The exporter is not ready")
+
+
+def _scrape(url: str, duration: float, interval: float, results: List[Tuple[float, int]]) -> None:
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        _, body = _get(f"{url}/metrics")
+        results.append((time.perf_counter() - start, len(body)))
+        time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def _get_samples(url: str) -> Dict[str, float]:
+    samples: Dict[str, float] = defaultdict(float)
+    text = _get(f"{url}/metrics")[1].decode()
+    for family in text_string_to_metric_families(text):  # type: ignore
+        for sample in family.samples:
+            samples[sample.name] += sample.value
+    return samples
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the load test, get the report."""
+    corpus = Corpus(args.pods, oom_rate=0, noise_ratio=0)
+    elastic_search = FakeElasticSearch(corpus, args.event_rate, args.hosts, args.es_latency)
+    kubernetes = FakeKubernetes(corpus, args.namespaces, args.flavor == "openshift", args.kube_latency)
+    elastic_search.start()
+    kubernetes.start()
+    url = "http://127.0.0.1:8080"
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            **_ENV,
+            "ES_URL": elastic_search.url,
+            "KUBECONFIG": _write_kubeconfig(directory, kubernetes.url),
+            "POD_SOURCE": args.pod_source,
+            "POLL_INTERVAL": str(args.poll_interval),
+        }
+        with subprocess.Popen([sys.executable, "-m", "es_oom_exporter.main"], env=env) as exporter:  # nosec
+            try:
+                ready_seconds = _wait_ready(url, timeout=60)
+                results: List[Tuple[float, int]] = []
+                scrapers = [
+                    threading.Thread(target=_scrape, args=(url, args.duration, args.scrape_interval, results))
+                    for _ in range(args.scrapers)
+                ]
+                for scraper in scrapers:
+                    scraper.start()
+                for scraper in scrapers:
+                    scraper.join()
+                samples = _get_samples(url)
+            finally:
+                exporter.terminate()
+    latencies = [latency * 1000 for latency, _ in results]
+    return {
+        "ready_seconds": round(ready_seconds, 3),
+        "scrapes": len(results),
+        "scrape_ms": {
+            "p50": round(_percentile(latencies, 50), 2),
+            "p90": round(_percentile(latencies, 90), 2),
+            "p99": round(_percentile(latencies, 99), 2),
+            "max": round(max(latencies), 2),
+        },
+        "scrape_bytes": round(statistics.mean(size for _, size in results)),
+        "apiserver_requests": dict(kubernetes.requests),
+        "apiserver_bytes": kubernetes.bytes_sent,
+        "es_requests": dict(elastic_search.requests),
+        "es_bytes": elastic_search.bytes_sent,
+        "events_generated": elastic_search.nb_events,
+        "ooms_exported": samples["pod_process_oom"],
+        "exporter_cpu_seconds": round(samples["process_cpu_seconds_total"], 2),
+        "exporter_rss_mib": round(samples["process_resident_memory_bytes"] / 1024 / 1024, 1),
+    }
+
+
+def main() -> None:
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--pods", type=int, default=5000, help="Number of PODs")
+    parser.add_argument("--namespaces", type=int, default=100, help="Number of namespaces")
+    parser.add_argument("--hosts", type=int, default=200, help="Number of hosts")
+    parser.add_argument("--event-rate", type=float, default=50, help="OOM events per second")
+    parser.add_argument("--es-latency", type=float, default=0.0, help="Added latency of ES, in seconds")
+    parser.add_argument("--kube-latency", type=float, default=0.0, help="Added latency of the API server")
+    parser.add_argument("--flavor", choices=("openshift", "eks"), default="eks", help="Cluster flavor")
+    parser.add_argument("--pod-source", choices=("watch", "list"), default="watch", help="POD_SOURCE")
+    parser.add_argument("--poll-interval", type=float, default=1, help="POLL_INTERVAL of the exporter")
+    parser.add_argument("--duration", type=float, default=60, help="Duration of the scrapes, in seconds")
+    parser.add_argument("--scrapers", type=int, default=2, help="Number of concurrent scrapers")
+    parser.add_argument("--scrape-interval", type=float, default=1, help="Interval between the scrapes")
+    parser.add_argument("--output", help="Write the report in this JSON file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"args": vars(args), "report": report}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
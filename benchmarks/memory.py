@@ -0,0 +1,123 @@
+"""
+Compare the memory used by the POD index and the OOM objects with the previous representation, that was
+using one nested dictionary per POD and OOM objects with a `__dict__`.
+
+Run with: python -m benchmarks.memory [--pods=12000]
+"""
+
+import argparse
+import gc
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from kubernetes.client import V1ContainerState, V1ContainerStatus, V1ObjectMeta, V1Pod, V1PodStatus
+
+from es_oom_exporter.kube import get_pod_info
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodIndex
+
+
+def _get_pods(nb_pods: int) -> List[V1Pod]:
+    # Like the deserialized PODs, every string is a different object
+    return [
+        V1Pod(
+            metadata=V1ObjectMeta(
+                uid=f"{i:08x}-5fc5-4617-ae95-9160d576eb49",
+                name=f"release{i % 500}-service{i % 20}-{i:x}",
+                namespace=f"namespace{i % 100}",
+                labels={"release": f"release{i % 500}", "service": f"service{i % 20}"},
+            ),
+            status=V1PodStatus(
+                container_statuses=[
+                    V1ContainerStatus(
+                        name=f"container{j}",
+                        container_id=f"docker://{i:032x}{j:032x}",
+                        image="image",
+                        image_id="image",
+                        ready=True,
+                        restart_count=0,
+                        last_state=V1ContainerState(),
+                        state=V1ContainerState(),
+                    )
+                    for j in range(2)
+                ]
+            ),
+        )
+        for i in range(nb_pods)
+    ]
+
+
+def _previous_pod_info(pod: V1Pod) -> Dict[str, Any]:
+    md = pod.metadata
+    labels = md.labels or {}
+    return {
+        "namespace": md.namespace,
+        "release": labels.get("release", labels.get("app.kubernetes.io/instance")),
+        "service": labels.get("service", labels.get("app.kubernetes.io/name")),
+        "pod_name": md.name,
+        "containers": {
+            status.container_id.replace("docker://", ""): status.name
+            for status in pod.status.container_statuses
+        },
+    }
+
+
+def _previous_index(nb_pods: int) -> Any:
+    pods = {pod.metadata.uid: _previous_pod_info(pod) for pod in _get_pods(nb_pods)}
+    containers = {
+        container_id: pod_uid for pod_uid, pod_info in pods.items() for container_id in pod_info["containers"]
+    }
+    return pods, containers
+
+
+def _current_index(nb_pods: int) -> Any:
+    index = PodIndex(grace_period=600)
+    index.replace({pod.metadata.uid: get_pod_info(pod) for pod in _get_pods(nb_pods)})
+    return index
+
+
+class _PreviousOom:
+    def __init__(self, host: str) -> None:
+        self._host = host
+        self._pod_uid: Optional[str] = None
+        self._process: Optional[str] = None
+        self._container_uid: Optional[str] = None
+        self._containers_stats: Dict[str, Dict[str, int]] = {}
+        self._pod_name: Optional[str] = None
+        self._namespace: Optional[str] = None
+        self._release: Optional[str] = None
+        self._service: Optional[str] = None
+        self._container: Optional[str] = None
+
+
+def _get_ooms(oom_class: Callable[[str], Any], nb_ooms: int) -> List[Any]:
+    return [oom_class("host") for _ in range(nb_ooms)]
+
+
+def _measure(function: Callable[[int], Any], nb: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = function(nb)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pods", type=int, default=12000, help="Number of PODs, with 2 containers each")
+    parser.add_argument("--ooms", type=int, default=10000, help="Number of OOM objects")
+    args = parser.parse_args()
+
+    for name, function in (("before", _previous_index), ("after", _current_index)):
+        print(f"POD index {name}: {_measure(function, args.pods) / args.pods:,.0f} bytes/POD")
+    for name, oom_class in (("before", _PreviousOom), ("after", Oom)):
+        size = _measure(lambda nb, oom_class=oom_class: _get_ooms(oom_class, nb), args.ooms)  # type: ignore
+        print(f"OOM {name}: {size / args.ooms:,.0f} bytes/OOM")
+
+
+if __name__ == "__main__":
+    main()
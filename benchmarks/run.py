@@ -0,0 +1,197 @@
+"""
+Run the micro-benchmarks of the parsing and aggregation hot paths.
+
+Run with: python -m benchmarks.run [--output=results.json] [--compare=previous.json]
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from prometheus_client import CollectorRegistry
+
+from benchmarks.corpus import OLD_KERNEL_OOM, Corpus
+from es_oom_exporter import dmesg, es
+from es_oom_exporter.dmesg import CHUNK_SIZE
+from es_oom_exporter.exposition import MetricsExposition, RequestHeaders
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodIndex
+from es_oom_exporter.store import OomStore
+from es_oom_exporter.utils import split_lines
+
+
+class _Kubernetes:
+    def __init__(self, pod_infos: PodIndex) -> None:
+        self.pod_infos = pod_infos
+
+    def get_pod_infos(self) -> PodIndex:
+        return self.pod_infos
+
+
+def _get_chunks(lines: List[bytes]) -> List[bytes]:
+    # Like the reads of the dmesg output
+    data = b"".join(lines)
+    return [data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def _measure(function: Callable[[], int], repeat: int) -> Dict[str, Any]:
+    durations = []
+    nb_items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        nb_items = function()
+        durations.append(time.perf_counter() - start)
+    return {
+        "items": nb_items,
+        "seconds": durations,
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "items_per_second": nb_items / min(durations),
+    }
+
+
+def _get_benchmarks(args: argparse.Namespace) -> Dict[str, Callable[[], int]]:
+    corpus = Corpus(args.pods, args.oom_rate, args.noise_ratio)
+    kube = _Kubernetes(corpus.get_pod_infos())
+    old_kernel_lines = _get_chunks(corpus.get_dmesg_lines(args.lines))
+    new_kernel_lines = _get_chunks(corpus.get_dmesg_lines(args.lines, new_kernel=True))
+    new_kernel_messages = split_lines(new_kernel_lines)
+    oom_kill_texts = [match.group(2) for _, match in dmesg.CLASSIFIER.classify_all(new_kernel_messages)]
+    events = [
+        list(
+            dmesg.CLASSIFIER.classify_all(
+                f"[{i:6d}.000000] {message}" for message in corpus.get_event(OLD_KERNEL_OOM)
+            )
+        )
+        for i in range(args.events)
+    ]
+    es_pages = corpus.get_es_pages(args.lines, es.ES_PAGE_SIZE, args.hosts)
+    # Read all the pages in one poll
+    es.ES_MAX_PAGES = len(es_pages) + 1
+
+    def get_lines() -> int:
+        return sum(1 for _ in split_lines(old_kernel_lines))
+
+    def process_ooms(chunks: List[bytes]) -> Callable[[], int]:
+        nb_lines = sum(chunk.count(b"\n") for chunk in chunks)
+
+        def process() -> int:
+            reader = dmesg.Dmesg(node_name="node")
+            # Without the dmesg command
+            reader._process_ooms(chunks, kube)  # type: ignore # pylint: disable=protected-access
+            return nb_lines
+
+        return process
+
+    def split_oom_kill() -> int:
+        for text in oom_kill_texts:
+            dmesg._split_oom_kill(text)  # pylint: disable=protected-access
+        return len(oom_kill_texts)
+
+    def get_ooms() -> List[Oom]:
+        ooms = []
+        pod_infos = kube.get_pod_infos()
+        # The POD level stats line is not matched
+        for (_, start), (_, container), (_, oom_match) in events:
+            oom = Oom("node")
+            oom.add_start_info(start, pod_infos)
+            oom.add_pod_info(container)
+            oom.add_oom_info(oom_match)
+            ooms.append(oom)
+        return ooms
+
+    def create_ooms() -> int:
+        return len(get_ooms())
+
+    ooms = get_ooms()
+
+    def aggregate() -> int:
+        OomStore(retention=300).add(ooms)
+        return len(ooms)
+
+    store = OomStore(retention=300)
+    store.add(ooms)
+    exposition = MetricsExposition(store, CollectorRegistry())
+
+    def scrape_cached() -> int:
+        exposition.get_response("/metrics", RequestHeaders(accept_encoding="gzip"))
+        return len(store.get_snapshot())
+
+    def scrape_render() -> int:
+        # Like a change of the OOMs between each scrape
+        MetricsExposition(store, CollectorRegistry()).get_response(
+            "/metrics", RequestHeaders(accept_encoding="gzip")
+        )
+        return len(store.get_snapshot())
+
+    def es_get_ooms() -> int:
+        reader = es.ElasticSearch(url="http://localhost:9200")
+        pages = iter(es_pages + [[]])
+        # Without the requests
+        reader._search = lambda: next(pages)  # type: ignore # pylint: disable=protected-access
+        reader.get_ooms(kube)  # type: ignore
+        return sum(len(page) for page in es_pages)
+
+    return {
+        "split_lines": get_lines,
+        "dmesg_process_ooms_old_kernel": process_ooms(old_kernel_lines),
+        "dmesg_process_ooms_new_kernel": process_ooms(new_kernel_lines),
+        "dmesg_split_oom_kill": split_oom_kill,
+        "oom_create": create_ooms,
+        "store_aggregate": aggregate,
+        "scrape_cached": scrape_cached,
+        "scrape_render": scrape_render,
+        "es_get_ooms": es_get_ooms,
+    }
+
+
+def main() -> None:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000, help="Number of log lines or hits")
+    parser.add_argument("--pods", type=int, default=12000, help="Number of PODs")
+    parser.add_argument("--hosts", type=int, default=100, help="Number of hosts, for Elasticsearch")
+    parser.add_argument("--events", type=int, default=20000, help="Number of OOM events, for the OOM objects")
+    parser.add_argument("--oom-rate", type=float, default=0.001, help="Probability of a line to start an OOM")
+    parser.add_argument("--noise-ratio", type=float, default=0.01, help="Share of OOM-like noise")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs of each benchmark")
+    parser.add_argument("--filter", help="Only run the benchmarks containing this text")
+    parser.add_argument("--output", help="Write the results in this JSON file")
+    parser.add_argument("--compare", help="Compare with the results of this JSON file")
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)["results"]
+
+    results = {}
+    for name, function in _get_benchmarks(args).items():
+        if args.filter and args.filter not in name:
+            continue
+        result = _measure(function, args.repeat)
+        results[name] = result
+        comparison = ""
+        if name in previous:
+            comparison = f" ({result['items_per_second'] / previous[name]['items_per_second']:.2f}x)"
+        print(f"{name}: {result['items_per_second']:,.0f} items/s{comparison}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "time": time.time(),
+                    "parameters": vars(args),
+                    "results": results,
+                },
+                output_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
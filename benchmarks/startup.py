@@ -0,0 +1,86 @@
+"""
+Measure the startup of the exporter: the import time and memory of the main module, compared with the
+import of the kubernetes client it used to do, and the time until the metrics are served.
+
+Run with: python -m benchmarks.startup [--repeat=5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess  # nosec
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Tuple
+
+_IMPORT_SCRIPT = """
+import resource, sys, time
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+duration = time.perf_counter() - start
+print(duration, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+_ENV = {
+    "LOG_CONFIG": "production.ini",
+    "LOG_TYPE": "console",
+    "LOG_LEVEL": "CRITICAL",
+    "OTHER_LOG_LEVEL": "CRITICAL",
+    "C2CWSGIUTILS_LOG_LEVEL": "WARN",
+    # Nothing listens there, the polls fail but the metrics are served
+    "ES_URL": "http://127.0.0.1:9/",
+}
+
+
+def _measure_import(modules: List[str]) -> Tuple[float, int]:
+    output = subprocess.run(  # nosec
+        [sys.executable, "-c", _IMPORT_SCRIPT, *modules], check=True, capture_output=True, text=True
+    ).stdout
+    duration, max_rss = output.split()
+    return float(duration), int(max_rss)
+
+
+def _measure_first_scrape(port: int, timeout: float = 30) -> float:
+    start = time.perf_counter()
+    with subprocess.Popen(  # nosec
+        [sys.executable, "-m", "es_oom_exporter.main"], env={**os.environ, **_ENV}
+    ) as process:
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics"):  # nosec
+                        return time.perf_counter() - start
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.01)
+            raise TimeoutError("The metrics are not served")
+        finally:
+            process.terminate()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs")
+    args = parser.parse_args()
+
+    cases: Dict[str, List[str]] = {
+        "main": ["es_oom_exporter.main"],
+        "main + kubernetes client (before)": [
+            "es_oom_exporter.main",
+            "kubernetes.client",
+            "kubernetes.watch",
+        ],
+    }
+    for name, modules in cases.items():
+        results = [_measure_import(modules) for _ in range(args.repeat)]
+        duration = statistics.median(result[0] for result in results)
+        max_rss = statistics.median(result[1] for result in results)
+        print(f"Import {name}: {duration * 1000:.0f} ms, max RSS {max_rss / 1024:.1f} MiB")
+    durations = [_measure_first_scrape(8080) for _ in range(args.repeat)]
+    print(f"First scrape: {statistics.median(durations) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+The asyncio mode: the logs are polled, the PODs are resolved and the metrics are served from one event loop.
+
+The blocking parts (kubernetes client, dmesg command) are run in the default thread pool executor.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from es_oom_exporter.es import ES_TIMEOUT, FILTER_PATH, ElasticSearch, SearchPages
+from es_oom_exporter.exposition import MetricsExposition, RequestHeaders
+from es_oom_exporter.journal import Journal
+from es_oom_exporter.kmsg import Kmsg
+from es_oom_exporter.kube import Kubernetes
+from es_oom_exporter.message_reader import MessageReader
+from es_oom_exporter.metrics import ES_SEARCH_SECONDS, GET_OOMS_SECONDS
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodIndex
+from es_oom_exporter.poller import PollerOptions, add_ooms, end_poll
+
+LOG = logging.getLogger(__name__)
+# Minimum time between two polls, when the reader is waked up by new messages
+MIN_POLL_INTERVAL = 1.0
+
+
+class AsyncKubernetes:
+    """Resolve the PODs without blocking the event loop."""
+
+    def __init__(self, kube: Kubernetes) -> None:
+        self.kube = kube
+
+    @property
+    def loaded(self) -> threading.Event:
+        return self.kube.loaded
+
+    def start(self) -> None:
+        """Load the POD index in a thread."""
+        self.kube.start()
+
+    async def get_pod_infos(self) -> PodIndex:
+        # With the watch, the index is kept up to date by a thread, and this doesn't do any request
+        return await asyncio.get_running_loop().run_in_executor(None, self.kube.get_pod_infos)
+
+
+class AsyncMessageReader:
+    """Run a synchronous message reader in the default executor."""
+
+    def __init__(self, reader: MessageReader) -> None:
+        self.reader = reader
+
+    async def get_ooms(self, kube: AsyncKubernetes) -> List[Oom]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.reader.get_ooms, kube.kube)
+
+    async def backfill(self, kube: AsyncKubernetes) -> List[Oom]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.reader.backfill, kube.kube)
+
+    def get_state(self) -> Dict[str, Any]:
+        return self.reader.get_state()
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        self.reader.set_state(state, max_age)
+
+    async def wait(self, timeout: float) -> None:
+        """Wait for new messages, at most timeout seconds."""
+        await asyncio.sleep(timeout)
+
+    async def close(self) -> None:
+        self.reader.close()
+
+
+class AsyncKmsg(AsyncMessageReader):
+    """Read /dev/kmsg, the poller is waked up as soon as there are new records."""
+
+    reader: Kmsg
+
+    def __init__(self, reader: Kmsg) -> None:
+        super().__init__(reader)
+
+    async def wait(self, timeout: float) -> None:
+        await _wait_readable(self.reader.fileno(), timeout)
+
+
+class AsyncJournal(AsyncMessageReader):
+    """Read the journal, the poller is waked up as soon as there are new entries."""
+
+    reader: Journal
+
+    def __init__(self, reader: Journal) -> None:
+        super().__init__(reader)
+
+    async def wait(self, timeout: float) -> None:
+        await _wait_readable(self.reader.fileno(), timeout)
+
+
+async def _wait_readable(fd: Optional[int], timeout: float) -> None:
+    """Wait until the file descriptor is readable, at most timeout seconds."""
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    try:
+        if fd is None:
+            raise ValueError("No file descriptor")
+        loop.add_reader(fd, _wake_up, readable)
+    except (OSError, ValueError):
+        # dmesg command or regular file (cannot be polled)
+        await asyncio.sleep(timeout)
+        return
+    try:
+        await asyncio.wait_for(readable, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        loop.remove_reader(fd)
+
+
+def _wake_up(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncElasticSearch(AsyncMessageReader):
+    """Read the messages from Elasticsearch with aiohttp."""
+
+    reader: ElasticSearch
+
+    def __init__(self, reader: ElasticSearch) -> None:
+        super().__init__(reader)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _search(self) -> List[Dict[str, Any]]:
+        session = self._session
+        if session is None:
+            # Must be created in the event loop
+            headers = {
+                name: value for name, value in self.reader.session.headers.items() if isinstance(value, str)
+            }
+            session = aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=ES_TIMEOUT))
+            self._session = session
+        with ES_SEARCH_SECONDS.time():
+            response = await session.post(
+                self.reader.search_url,
+                params={"filter_path": FILTER_PATH},
+                data=self.reader.get_request_body(),
+            )
+            async with response:
+                response.raise_for_status()
+                body = await response.read()
+        return self.reader.parse_response(body)
+
+    async def get_ooms(self, kube: AsyncKubernetes) -> List[Oom]:
+        pages = SearchPages(self.reader)
+        while pages.has_next():
+            if pages.add_hits(await self._search()):
+                pages.pod_infos = await kube.get_pod_infos()
+            pages.process_hits()
+        return pages.ooms
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        await super().close()
+
+
+def get_async_reader(reader: MessageReader) -> AsyncMessageReader:
+    if isinstance(reader, ElasticSearch):
+        return AsyncElasticSearch(reader)
+    if isinstance(reader, Kmsg):
+        return AsyncKmsg(reader)
+    if isinstance(reader, Journal):
+        return AsyncJournal(reader)
+    return AsyncMessageReader(reader)
+
+
+class AsyncPoller:
+    """Same as Poller, in the event loop."""
+
+    def __init__(self, kube: AsyncKubernetes, message_reader: AsyncMessageReader, options: PollerOptions):
+        self.kube = kube
+        self.message_reader = message_reader
+        self.store = options.store
+        self.interval = options.interval
+        self.checkpoint = options.checkpoint
+        self.ready = options.ready if options.ready is not None else threading.Event()
+
+    async def poll(self) -> None:
+        with GET_OOMS_SECONDS.time():
+            ooms = await self.message_reader.get_ooms(self.kube)
+        ready = self.ready if self.kube.loaded.is_set() else None
+        end_poll(ooms, self.store, ready, self.checkpoint, self.message_reader.get_state)
+
+    async def backfill(self) -> None:
+        try:
+            ooms = await self.message_reader.backfill(self.kube)
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception("Error during the backfill")
+            return
+        add_ooms(ooms, self.store)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.kube.start()
+        await self.backfill()
+        while True:
+            start = loop.time()
+            try:
+                await self.poll()
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Error while collecting the OOMs")
+            await asyncio.sleep(max(0.0, MIN_POLL_INTERVAL - (loop.time() - start)))
+            await self.message_reader.wait(max(0.0, self.interval - (loop.time() - start)))
+
+
+async def start_http_server(port: int, exposition: MetricsExposition) -> web.AppRunner:
+    """Serve the metrics from the event loop."""
+
+    async def metrics(request: web.Request) -> web.Response:
+        headers = RequestHeaders(
+            request.headers.get("Accept", ""),
+            request.headers.get("Accept-Encoding", ""),
+            request.headers.get("If-None-Match", ""),
+        )
+        response = exposition.get_response(request.path, headers, request.query_string)
+        return web.Response(status=response.status, headers=response.headers, body=response.body)
+
+    app = web.Application()
+    app.router.add_get("/", metrics)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/metrics/oom", metrics)
+    app.router.add_get("/ready", metrics)
+    app.router.add_get("/ooms", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    return runner
+
+
+async def run(
+    kube: Kubernetes,
+    message_reader: MessageReader,
+    exposition: MetricsExposition,
+    options: PollerOptions,
+    port: int,
+) -> None:
+    """Run the exporter in the event loop."""
+    async_reader = get_async_reader(message_reader)
+    runner = await start_http_server(port, exposition)
+    try:
+        await AsyncPoller(AsyncKubernetes(kube), async_reader, options).run()
+    finally:
+        await async_reader.close()
+        await runner.cleanup()
@@ -0,0 +1,88 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from es_oom_exporter.metrics import PARTIAL_EVENTS_EVICTED
+from es_oom_exporter.oom import Oom
+
+LOG = logging.getLogger(__name__)
+ASSEMBLER_MAX_AGE = float(os.environ.get("ASSEMBLER_MAX_AGE", "300"))
+ASSEMBLER_MAX_ENTRIES = int(os.environ.get("ASSEMBLER_MAX_ENTRIES", "10000"))
+
+
+class OomAssembler:
+    """
+    Keep the in-progress OOM events across the polls, by host and memory cgroup (POD UID).
+
+    The events are evicted if they are not complete after max_age seconds, or when we have more than
+    max_entries events.
+    """
+
+    def __init__(self, max_age: float, max_entries: int) -> None:
+        self._max_age = max_age
+        self._max_entries = max_entries
+        # host => POD UID => (OOM, creation time), in creation order
+        self._events: Dict[str, "OrderedDict[str, Tuple[Oom, float]]"] = {}
+        self._nb_events = 0
+
+    def __len__(self) -> int:
+        return self._nb_events
+
+    def start(self, host: str, pod_uid: str) -> Oom:
+        """Get the event of the memory cgroup, create it if needed."""
+        host_events = self._events.setdefault(host, OrderedDict())
+        event = host_events.get(pod_uid)
+        if event is not None:
+            return event[0]
+        if self._nb_events >= self._max_entries:
+            self._evict_oldest()
+        oom = Oom(host)
+        host_events[pod_uid] = (oom, time.monotonic())
+        self._nb_events += 1
+        return oom
+
+    def get(self, host: str, pod_uid: str) -> Optional[Oom]:
+        host_events = self._events.get(host)
+        event = host_events.get(pod_uid) if host_events is not None else None
+        return event[0] if event is not None else None
+
+    def pop_oldest(self, host: str) -> Optional[Oom]:
+        """
+        Get and remove the oldest event of the host.
+
+        The kernel doesn't interleave the OOM reports of one host, and the last line of a report doesn't
+        contain the memory cgroup.
+        """
+        host_events = self._events.get(host)
+        if not host_events:
+            return None
+        _, (oom, _) = host_events.popitem(last=False)
+        self._nb_events -= 1
+        return oom
+
+    def evict(self) -> None:
+        """Evict the too old events."""
+        min_time = time.monotonic() - self._max_age
+        for host, host_events in list(self._events.items()):
+            while host_events:
+                pod_uid, (_, created) = next(iter(host_events.items()))
+                if created >= min_time:
+                    break
+                del host_events[pod_uid]
+                self._nb_events -= 1
+                PARTIAL_EVENTS_EVICTED.labels("age").inc()
+                LOG.info("Evicted the too old partial OOM event %s/%s", host, pod_uid)
+            if not host_events:
+                del self._events[host]
+
+    def _evict_oldest(self) -> None:
+        oldest_host = min(
+            (host for host, host_events in self._events.items() if host_events),
+            key=lambda host: next(iter(self._events[host].values()))[1],
+        )
+        pod_uid, _ = self._events[oldest_host].popitem(last=False)
+        self._nb_events -= 1
+        PARTIAL_EVENTS_EVICTED.labels("max_entries").inc()
+        LOG.info("Evicted the partial OOM event %s/%s, too many events", oldest_host, pod_uid)
@@ -0,0 +1,269 @@
+"""
+Find the OOMs in archived kernel logs, without Elasticsearch or the API server.
+
+The input files are split in chunks that are scanned in parallel by a pool of processes, only the
+interesting lines are sent back, in order, to be assembled by host. The PODs are resolved with
+snapshots of the PODs, e.g. from `kubectl get pods --all-namespaces --output=json`.
+
+Run with: es-oom-backfill --pods=pods.json /var/log/messages-*.gz
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, ContextManager, Dict, Iterable, List, Mapping, NamedTuple, Optional, TextIO, Union
+
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.models.v1_pod_list import V1PodList
+
+from es_oom_exporter import dmesg, es
+from es_oom_exporter.assembler import ASSEMBLER_MAX_ENTRIES, OomAssembler
+from es_oom_exporter.history import OomEvent
+from es_oom_exporter.kube import get_pod_info
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodIndex, PodInfo
+from es_oom_exporter.store import OomStore
+
+LOG = logging.getLogger(__name__)
+CHUNK_SIZE = 64 * 1024 * 1024
+# Cheap literal pre-filter, before decoding the lines
+MARKERS = (b"Memory cgroup ", b"Task in ", b"oom-kill:")
+# syslog: the lines of /var/log/messages, like the messages indexed in Elasticsearch
+# ndjson: Elasticsearch hits, one per line, with the line in `_source.message` or `message`
+# dmesg: output of the dmesg command, the host is the file name or --host
+FORMATS = ("syslog", "ndjson", "dmesg")
+
+
+class Task(NamedTuple):
+    """A byte range of a file to scan, end is None to read everything (compressed files)."""
+
+    path: str
+    file_format: str
+    start: int
+    end: Optional[int]
+
+
+class ScanResult(NamedTuple):
+    """The result of the scan of a byte range."""
+
+    nb_lines: int
+    nb_bytes: int
+    # The interesting lines, in order
+    lines: List[str]
+
+
+def get_tasks(path: str, file_format: str, chunk_size: int = CHUNK_SIZE) -> List[Task]:
+    """Split a file in byte ranges, the compressed files cannot be split."""
+    if path.endswith(".gz"):
+        return [Task(path, file_format, 0, None)]
+    size = os.path.getsize(path)
+    return [
+        Task(path, file_format, start, min(start + chunk_size, size))
+        for start in range(0, max(size, 1), chunk_size)
+    ]
+
+
+def _open(task: Task) -> Union[gzip.GzipFile, io.BufferedReader]:
+    if task.end is None:
+        return gzip.open(task.path, "rb")
+    return open(task.path, "rb")  # pylint: disable=consider-using-with
+
+
+def scan(task: Task) -> ScanResult:
+    """
+    Get the interesting lines of a byte range of a file.
+
+    A line belongs to the range where it starts, so the partial first line is skipped and the last line
+    is read past the end.
+    """
+    nb_lines = 0
+    lines = []
+    with _open(task) as input_file:
+        pos = task.start
+        if pos > 0:
+            input_file.seek(pos - 1)
+            # Skip the end of the line started in the previous range
+            pos += len(input_file.readline()) - 1
+        first = pos
+        for line in input_file:
+            if task.end is not None and pos >= task.end:
+                break
+            pos += len(line)
+            nb_lines += 1
+            if any(marker in line for marker in MARKERS):
+                message = line.decode(errors="replace").rstrip("\n")
+                if task.file_format == "ndjson":
+                    try:
+                        message = _get_hit_message(message)
+                    except ValueError:
+                        LOG.warning("Invalid JSON line in %s: %s", task.path, message)
+                        continue
+                lines.append(message)
+    return ScanResult(nb_lines, pos - first, lines)
+
+
+def _get_hit_message(line: str) -> str:
+    hit = json.loads(line)
+    message: str = hit.get("_source", hit).get("message", "")
+    return message
+
+
+def load_pod_infos(paths: Iterable[str]) -> PodIndex:
+    """
+    Load the snapshots of the PODs (JSON list of PODs), in order.
+
+    The PODs of all the snapshots are kept, with the containers that disappeared between two snapshots.
+    """
+    index = PodIndex(grace_period=float("inf"))
+    api = ApiClient()
+    for path in paths:
+        with open(path, encoding="utf-8") as pods_file:
+            pods: V1PodList = api.deserialize(SimpleNamespace(data=pods_file.read()), "V1PodList")
+        index.replace({pod.metadata.uid: get_pod_info(pod) for pod in pods.items})
+        LOG.info("Loaded %i PODs from %s", len(pods.items), path)
+    return index
+
+
+class Backfill:
+    """Assemble the interesting lines of the scanned files into OOMs."""
+
+    def __init__(self, pod_infos: Mapping[str, PodInfo]) -> None:
+        self._pod_infos = pod_infos
+        # The events are never evicted by age, the lines are not read in real time
+        self._assembler = OomAssembler(float("inf"), ASSEMBLER_MAX_ENTRIES)
+        self._dmesg_readers: Dict[str, dmesg.Dmesg] = {}
+
+    def process(self, lines: List[str], file_format: str, host: str) -> List[Oom]:
+        if file_format == "dmesg":
+            reader = self._dmesg_readers.get(host)
+            if reader is None:
+                # Archived logs, from an unknown boot
+                reader = self._dmesg_readers[host] = dmesg.Dmesg(node_name=host, current_boot=False)
+            return reader.process_messages(dmesg.CLASSIFIER.classify_all(lines), self._get_pod_infos)
+        ooms = []
+        for kind, match in es.CLASSIFIER.classify_all(lines):
+            oom = es.process_message(self._assembler, kind, match, self._pod_infos)
+            if oom is not None:
+                ooms.append(oom)
+        return ooms
+
+    def _get_pod_infos(self) -> Mapping[str, PodInfo]:
+        return self._pod_infos
+
+
+class Options(NamedTuple):
+    """The options of the command, except the files and the PODs."""
+
+    file_format: str = "syslog"
+    # Number of processes, default: number of CPUs
+    jobs: Optional[int] = None
+    # Host of the dmesg files, default: the file name
+    host: Optional[str] = None
+    chunk_size: int = CHUNK_SIZE
+
+
+def get_summary(store: OomStore, nb_lines: int, nb_bytes: int, duration: float) -> Dict[str, Any]:
+    containers = sorted(store.get_snapshot(), key=lambda container: -container.nb_ooms)
+    return {
+        "lines": nb_lines,
+        "bytes": nb_bytes,
+        "seconds": round(duration, 3),
+        "lines_per_second": round(nb_lines / duration) if duration > 0 else None,
+        "ooms": sum(container.nb_ooms for container in containers),
+        "containers": [
+            {
+                **dict(zip(("namespace", "pod", "container", "process", "host"), container.key)),
+                "nb_ooms": container.nb_ooms,
+                "rss": container.rss,
+                "rss_killed": container.rss_killed,
+            }
+            for container in containers
+        ],
+    }
+
+
+def _get_host(path: str, host: Optional[str]) -> str:
+    if host is not None:
+        return host
+    name = os.path.basename(path)
+    return name[: -len(".gz")] if name.endswith(".gz") else name
+
+
+def run(
+    paths: List[str], pod_infos: Mapping[str, PodInfo], output: TextIO, options: Options = Options()
+) -> Dict[str, Any]:
+    """
+    Write the OOMs of the files as JSON lines to output, get the summary.
+
+    The OOMs have the same fields as on /ooms, the timestamp is the time of the run when the line time is
+    not known.
+    """
+    now = time.time()
+    start = time.monotonic()
+    backfill = Backfill(pod_infos)
+    store = OomStore(float("inf"))
+    tasks = [task for path in paths for task in get_tasks(path, options.file_format, options.chunk_size)]
+    nb_lines = 0
+    nb_bytes = 0
+    with multiprocessing.Pool(options.jobs) as pool:
+        # imap keeps the order of the tasks, the lines of a host must be assembled in order
+        for task, result in zip(tasks, pool.imap(scan, tasks)):
+            nb_lines += result.nb_lines
+            nb_bytes += result.nb_bytes
+            ooms = backfill.process(result.lines, options.file_format, _get_host(task.path, options.host))
+            for oom in ooms:
+                output.write(json.dumps(OomEvent.from_oom(oom, now).to_json()) + "\n")
+            store.add(ooms)
+    return get_summary(store, nb_lines, nb_bytes, time.monotonic() - start)
+
+
+def _open_output(path: Optional[str], default: TextIO) -> ContextManager[TextIO]:
+    if path is None:
+        # Don't close stdout or stderr
+        return contextlib.nullcontext(default)
+    return open(path, "w", encoding="utf-8")
+
+
+def main() -> None:
+    """Run the command."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("files", nargs="+", help="Log files, in chronological order, can be gzipped")
+    parser.add_argument("--format", choices=FORMATS, default="syslog", help="Format of the files")
+    parser.add_argument(
+        "--pods", action="append", default=[], help="JSON list of PODs, can be repeated, oldest first"
+    )
+    parser.add_argument("--host", help="Host of the dmesg files (default: the file name)")
+    parser.add_argument("--jobs", type=int, help="Number of processes (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Bytes per parallel task")
+    parser.add_argument("--output", help="File of the OOMs, as JSON lines (default: stdout)")
+    parser.add_argument("--summary", help="File of the summary, as JSON (default: stderr)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    pod_infos = load_pod_infos(args.pods)
+    with _open_output(args.output, sys.stdout) as output:
+        summary = run(
+            args.files, pod_infos, output, Options(args.format, args.jobs, args.host, args.chunk_size)
+        )
+    LOG.info(
+        "Read %i lines in %.1fs (%s lines/s), found %i OOMs",
+        summary["lines"],
+        summary["seconds"],
+        summary["lines_per_second"],
+        summary["ooms"],
+    )
+    with _open_output(args.summary, sys.stderr) as summary_file:
+        json.dump(summary, summary_file, indent=2)
+        summary_file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
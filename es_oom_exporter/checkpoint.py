@@ -0,0 +1,49 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """
+    Persist the cursors of the message reader in a JSON file.
+
+    The file is rewritten atomically, so a crash during the write keeps the previous checkpoint.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._saved: Optional[Dict[str, Any]] = None
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self._path, encoding="utf-8") as checkpoint_file:
+                state: Dict[str, Any] = json.load(checkpoint_file)
+        except FileNotFoundError:
+            LOG.info("No checkpoint in %s", self._path)
+            return {}
+        except (OSError, ValueError) as e:
+            LOG.warning("Cannot read the checkpoint %s: %s", self._path, e)
+            return {}
+        LOG.info("Loaded the checkpoint %s: %s", self._path, state)
+        self._saved = state
+        return state
+
+    def save(self, state: Dict[str, Any]) -> None:
+        if state == self._saved:
+            return
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+                json.dump(state, temp_file)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, self._path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._saved = state
@@ -0,0 +1,66 @@
+import enum
+from typing import Iterable, Iterator, Match, Optional, Pattern, Tuple
+
+from es_oom_exporter.metrics import LINES_MATCHED
+
+MEMORY_CGROUP = "Memory cgroup "
+
+
+class LineKind(enum.Enum):
+    """The kind of the interesting kernel log lines."""
+
+    START = "start"
+    CONTAINER = "container"
+    OOM = "oom"
+    OOM_KILL = "oom_kill"
+
+
+class LineClassifier:
+    """
+    Get the kind of a kernel log line in one pass.
+
+    Most of the lines are unrelated noise, so a cheap literal pre-filter is done first, and then only the
+    regular expression of the line kind is run.
+    """
+
+    def __init__(
+        self,
+        start_re: Pattern[str],
+        container_re: Pattern[str],
+        oom_re: Pattern[str],
+        oom_kill_re: Optional[Pattern[str]] = None,
+    ):
+        self._start_re = start_re
+        self._container_re = container_re
+        self._oom_re = oom_re
+        self._oom_kill_re = oom_kill_re
+        self._matched = {kind: LINES_MATCHED.labels(kind.value) for kind in LineKind}
+
+    def classify(self, line: str) -> Optional[Tuple[LineKind, Match[str]]]:
+        index = line.find(MEMORY_CGROUP)
+        if index >= 0:
+            index += len(MEMORY_CGROUP)
+            if line.startswith("stats for", index):
+                kind, pattern = LineKind.CONTAINER, self._container_re
+            elif line.startswith("out of memory", index):
+                kind, pattern = LineKind.OOM, self._oom_re
+            else:
+                return None
+        elif "Task in " in line:
+            kind, pattern = LineKind.START, self._start_re
+        elif self._oom_kill_re is not None and "oom-kill:" in line:
+            kind, pattern = LineKind.OOM_KILL, self._oom_kill_re
+        else:
+            return None
+        match = pattern.match(line)
+        if match is None:
+            return None
+        self._matched[kind].inc()
+        return kind, match
+
+    def classify_all(self, lines: Iterable[str]) -> Iterator[Tuple[LineKind, Match[str]]]:
+        """Get the interesting lines with their kind."""
+        for line in lines:
+            classified = self.classify(line)
+            if classified is not None:
+                yield classified
@@ -0,0 +1,174 @@
+import collections
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import FrameType
+from typing import Dict, List, Optional, Tuple, Union
+
+from es_oom_exporter.poller import Poller
+
+LOG = logging.getLogger(__name__)
+# The debug server is disabled if no port is set
+DEBUG_PORT = os.environ.get("DEBUG_PORT")
+DEBUG_ADDRESS = os.environ.get("DEBUG_ADDRESS", "127.0.0.1")
+MAX_PROFILE_DURATION = 300.0
+SAMPLE_INTERVAL = 0.01
+
+
+def get_thread_stacks() -> str:
+    """Get the current stack of all the threads."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    result = []
+    for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+        result.append(f'Thread "{names.get(ident, "unknown")}" ({ident}):\n')
+        result.extend(traceback.format_stack(frame))
+        result.append("\n")
+    return "".join(result)
+
+
+def sample_stacks(duration: float, interval: float = SAMPLE_INTERVAL) -> str:
+    """
+    Sample the stacks of all the threads during duration seconds.
+
+    Returns the collapsed stacks (one `frame;frame;frame count` per line), the format used to generate
+    flame graphs.
+    """
+    counts: Dict[str, int] = collections.Counter()
+    current = threading.get_ident()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident != current:
+                counts[_collapse(frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class TracemallocDiff:
+    """Compare the memory allocations with the previous call."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def diff(self, top: int) -> str:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._previous = tracemalloc.take_snapshot()
+                return "Started tracing the memory allocations, call again to get the differences\n"
+            snapshot = tracemalloc.take_snapshot()
+            assert self._previous is not None  # nosec
+            stats = snapshot.compare_to(self._previous, "lineno")
+            self._previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current={current} peak={peak}\n"]
+        lines.extend(f"{stat}\n" for stat in stats[:top])
+        return "".join(lines)
+
+    def stop(self) -> str:
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+        return "Stopped tracing the memory allocations\n"
+
+
+class DebugServer(ThreadingHTTPServer):
+    """HTTP server with the debug endpoints."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], poller: Poller) -> None:
+        super().__init__(address, _DebugHandler)
+        self.poller = poller
+        self.profile_lock = threading.Lock()
+        self.tracemalloc_diff = TracemallocDiff()
+
+
+class _DebugHandler(BaseHTTPRequestHandler):
+    server: DebugServer
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            if url.path == "/debug/threads":
+                self._send(get_thread_stacks())
+            elif url.path == "/debug/profile":
+                self._profile(params)
+            elif url.path == "/debug/tracemalloc":
+                if params.get("stop") is not None:
+                    self._send(self.server.tracemalloc_diff.stop())
+                else:
+                    self._send(self.server.tracemalloc_diff.diff(int(params.get("top", "20"))))
+            else:
+                self._send("Endpoints: /debug/threads, /debug/profile, /debug/tracemalloc\n", status=404)
+        except ValueError as e:
+            self._send(f"{e}\n", status=400)
+
+    def _profile(self, params: Dict[str, str]) -> None:
+        duration = min(float(params.get("seconds", "30")), MAX_PROFILE_DURATION)
+        output_format = params.get("format", "text")
+        if output_format not in ("text", "pstats", "collapsed"):
+            raise ValueError(f"Unknown format: {output_format}")
+        if not self.server.profile_lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            self._send("A profiling is already running\n", status=409)
+            return
+        try:
+            LOG.info("Profiling during %s seconds in the %s format", duration, output_format)
+            if output_format == "collapsed":
+                self._send(sample_stacks(duration))
+                return
+            profile = self.server.poller.profile(duration)
+        finally:
+            self.server.profile_lock.release()
+        profile.create_stats()
+        if output_format == "pstats":
+            # Can be read with pstats.Stats or snakeviz
+            self._send(marshal.dumps(profile.stats), content_type="application/octet-stream")
+        else:
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(
+                int(params.get("top", "50"))
+            )
+            self._send(text.getvalue())
+
+    def _send(
+        self, body: Union[str, bytes], status: int = 200, content_type: str = "text/plain; charset=utf-8"
+    ) -> None:
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        LOG.info("%s - %s", self.address_string(), format % args)
+
+
+def start_debug_server(port: int, poller: Poller) -> DebugServer:
+    """Start the debug HTTP server in a background thread."""
+    server = DebugServer((DEBUG_ADDRESS, port), poller)
+    thread = threading.Thread(target=server.serve_forever, name="debug-server", daemon=True)
+    thread.start()
+    LOG.warning("Started the debug server on %s:%i", DEBUG_ADDRESS, server.server_address[1])
+    return server
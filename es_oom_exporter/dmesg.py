@@ -1,15 +1,22 @@
+import functools
 import logging
 import os
 import re
 import subprocess  # nosec
-from typing import Dict, Iterable, List, Optional
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Match, Optional, Tuple
 
+from es_oom_exporter.assembler import ASSEMBLER_MAX_AGE, ASSEMBLER_MAX_ENTRIES, OomAssembler
+from es_oom_exporter.classifier import LineClassifier, LineKind
 from es_oom_exporter.kube import Kubernetes
 from es_oom_exporter.message_reader import MessageReader
 from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodInfo
+from es_oom_exporter.utils import count_read, split_lines
 
 LOG = logging.getLogger(__name__)
-TIMESTAMP_RE = re.compile(r"\[\s*(\d+\.\d+)\].*")
+CHUNK_SIZE = 65536
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
 
 # Interesting messages in dmesg with old kernels:
 # [21013.577527] Task in /kubepods/burstable/podaf389229-5fc5-4617-ae95-9160d576eb49/3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84 killed as a result of limit of /kubepods/burstable/podaf389229-5fc5-4617-ae95-9160d576eb49  # pylint: disable=line-too-long
@@ -21,8 +28,7 @@ START_RE = re.compile(
     r"limit of /kubepods/(?:burstable/)?pod[0-9a-f_-]*"
 )
 CONTAINER_RE = re.compile(
-    r"\[\s*(\d+\.\d+)\] Memory cgroup stats for /kubepods/(?:burstable/)?pod([0-9a-f_-]*)/([0-9a-f]*):.* "
-    r"rss:(\d+[KMG]B).*"
+    r"\[\s*(\d+\.\d+)\] Memory cgroup stats for /kubepods/(?:burstable/)?pod([0-9a-f_-]*)/([0-9a-f]*):"
 )
 OOM_RE = re.compile(
     r"\[\s*(\d+\.\d+)\] Memory cgroup out of memory: Kill process \d+ \(([^)]+)\) score \d+ or "
@@ -32,81 +38,124 @@ OOM_RE = re.compile(
 # Interesting messages in dmesg with new kernels:
 # [10657070.816698] oom-kill:constraint=CONSTRAINT_MEMCG,nodemask=(null),cpuset=7a982186b58cec345c4a3f635809c7e04afc930453a5dbb5cbc9d4d49f662761,mems_allowed=0,oom_memcg=/kubepods/burstable/pod792adfde-d139-4c9c-a89e-ae94f36ea69d/7a982186b58cec345c4a3f635809c7e04afc930453a5dbb5cbc9d4d49f662761,task_memcg=/kubepods/burstable/pod792adfde-d139-4c9c-a89e-ae94f36ea69d/7a982186b58cec345c4a3f635809c7e04afc930453a5dbb5cbc9d4d49f662761,task=ruby,pid=10506,uid=1000  # pylint: disable=line-too-long
 OOM_KILL_RE = re.compile(r"\[\s*(\d+\.\d+)\] oom-kill:(.*)")
+TIMESTAMP_RE = re.compile(r"\[\s*(\d+\.\d+)\]")
+CLASSIFIER = LineClassifier(START_RE, CONTAINER_RE, OOM_RE, OOM_KILL_RE)
 
 
 class Dmesg(MessageReader):
     """Read the message from dmesg."""
 
-    def __init__(self) -> None:
-        self._node_name = os.environ["NODE_NAME"]
-        self._cur: Optional[Oom] = None
+    def __init__(self, node_name: Optional[str] = None, current_boot: bool = True) -> None:
+        self._node_name = node_name if node_name is not None else os.environ["NODE_NAME"]
+        # The messages are from the current boot, their time since the boot can be converted
+        self._current_boot = current_boot
+        self._assembler = OomAssembler(ASSEMBLER_MAX_AGE, ASSEMBLER_MAX_ENTRIES)
 
         self._prev_timestamp: Optional[float] = None
 
-    def _get_cur(self) -> Oom:
-        if self._cur is None:
-            self._cur = Oom(self._node_name)
-        return self._cur
+    def get_state(self) -> Dict[str, Any]:
+        return {"boot_id": get_boot_id(), "prev_timestamp": self._prev_timestamp}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        # The timestamps are relative to the boot time
+        min_timestamp = time.monotonic() - max_age
+        prev_timestamp = state.get("prev_timestamp") if state.get("boot_id") == get_boot_id() else None
+        self._prev_timestamp = max(prev_timestamp or min_timestamp, min_timestamp)
 
     def _process_ooms(self, lines: Iterable[bytes], kube: Kubernetes) -> List[Oom]:
-        ooms: List[Oom] = []
-        pod_infos = None
-        for message in _get_messages(lines):
-            # Cannot use --follow (not working in a container) and cannot specify a position in the
-            # logs where to start. So, we need to read everything from the start and ignore the logs
-            # we've already seen.
-            timestamp_match = TIMESTAMP_RE.match(message)
-            if not timestamp_match:
+        return self.process_messages(self._get_new_messages(split_lines(lines)), kube.get_pod_infos)
+
+    def _get_new_messages(self, messages: Iterable[str]) -> Iterator[Tuple[LineKind, Match[str]]]:
+        # Only the new lines are classified, and counted as matched
+        return CLASSIFIER.classify_all(self._skip_seen(messages))
+
+    def _skip_seen(self, messages: Iterable[str]) -> Iterator[str]:
+        # Cannot use --follow (not working in a container) and cannot specify a position in the
+        # logs where to start. So, we need to read everything from the start and ignore the logs
+        # we've already seen.
+        prev_timestamp = self._prev_timestamp
+        for message in messages:
+            match = TIMESTAMP_RE.match(message)
+            if match is None:
                 continue
-            timestamp = float(timestamp_match.group(1))
-            if self._prev_timestamp is not None and self._prev_timestamp >= timestamp:
+            timestamp = float(match.group(1))
+            if prev_timestamp is not None and prev_timestamp >= timestamp:
                 continue
             self._prev_timestamp = timestamp
-
-            LOG.debug("message: <%s>", message)
-            start_match = START_RE.match(message)
-            pod_match = CONTAINER_RE.match(message)
-            oom_match = OOM_RE.match(message)
-            oom_kill_match = OOM_KILL_RE.match(message)
-            if start_match:
-                if pod_infos is None:
-                    pod_infos = kube.get_pod_infos()
-                self._get_cur().add_start_info(start_match, pod_infos)
-            elif pod_match:
-                self._get_cur().add_pod_info(pod_match)
-            elif oom_match:
-                if self._cur is not None and self._cur.add_oom_info(oom_match):
-                    ooms.append(self._cur)
-                self._cur = None
-            elif oom_kill_match:
-                fields = _split_oom_kill(oom_kill_match.group(2))
-                if pod_infos is None:
-                    pod_infos = kube.get_pod_infos()
-                if self._get_cur().add_oom_kill_info(fields, pod_infos):
-                    ooms.append(self._get_cur())
-                self._cur = None
+            yield message
+
+    def process_messages(
+        self,
+        messages: Iterable[Tuple[LineKind, Match[str]]],
+        get_pod_infos: Callable[[], Mapping[str, PodInfo]],
+    ) -> List[Oom]:
+        """Get the complete OOMs of the classified messages, the PODs are only resolved if needed."""
+        ooms: List[Oom] = []
+        get_pod_infos = functools.lru_cache(maxsize=None)(get_pod_infos)
+        handlers = {
+            LineKind.START: self._process_start,
+            LineKind.CONTAINER: self._process_container,
+            LineKind.OOM: self._process_oom,
+            LineKind.OOM_KILL: self._process_oom_kill,
+        }
+        self._assembler.evict()
+        # The timestamps of the messages are relative to the boot, like the monotonic clock
+        boot_time = time.time() - time.monotonic() if self._current_boot else None
+        for kind, match in messages:
+            LOG.debug("message: <%s>", match.group(0))
+            oom = handlers[kind](match, get_pod_infos)
+            if oom is not None:
+                if boot_time is not None:
+                    oom.set_timestamp(boot_time + float(match.group(1)))
+                ooms.append(oom)
         return ooms
 
+    def _process_start(
+        self, match: Match[str], get_pod_infos: Callable[[], Mapping[str, PodInfo]]
+    ) -> Optional[Oom]:
+        self._assembler.start(self._node_name, match.group(2).replace("_", "-")).add_start_info(
+            match, get_pod_infos()
+        )
+        return None
+
+    def _process_container(
+        self, match: Match[str], _get_pod_infos: Callable[[], Mapping[str, PodInfo]]
+    ) -> Optional[Oom]:
+        cur = self._assembler.get(self._node_name, match.group(2).replace("_", "-"))
+        if cur is not None:
+            cur.add_pod_info(match)
+        else:
+            LOG.debug("No OOM in progress for: %s", match.group(0))
+        return None
+
+    def _process_oom(
+        self, match: Match[str], _get_pod_infos: Callable[[], Mapping[str, PodInfo]]
+    ) -> Optional[Oom]:
+        cur = self._assembler.pop_oldest(self._node_name)
+        return cur if cur is not None and cur.add_oom_info(match) else None
+
+    def _process_oom_kill(
+        self, match: Match[str], get_pod_infos: Callable[[], Mapping[str, PodInfo]]
+    ) -> Optional[Oom]:
+        # The new kernels put everything in one line
+        oom = Oom(self._node_name)
+        return oom if oom.add_oom_kill_info(_split_oom_kill(match.group(2)), get_pod_infos()) else None
+
     def get_ooms(self, kube: Kubernetes) -> List[Oom]:
         with subprocess.Popen(  # nosec
             ["/usr/bin/dmesg", "--facility=kern", "--level=info,err"], stdout=subprocess.PIPE
         ) as dmesg:
             if dmesg.stdout is None:
                 return []
-            ooms = self._process_ooms(dmesg.stdout, kube)
+            chunks = iter(functools.partial(os.read, dmesg.stdout.fileno(), CHUNK_SIZE), b"")
+            ooms = self._process_ooms(count_read(chunks, "dmesg"), kube)
             dmesg.wait()
         return ooms
 
 
-def _get_messages(data: Iterable[bytes]) -> Iterable[str]:
-    prev = b""
-    for cur in data:
-        cur = prev + cur
-        if not cur.endswith(b"\n"):
-            prev = cur
-        else:
-            prev = b""
-            yield cur.decode().rstrip("\n")
+def get_boot_id() -> str:
+    with open(BOOT_ID_FILE, encoding="utf-8") as boot_id_file:
+        return boot_id_file.read().strip()
 
 
 def _split_oom_kill(text: str) -> Dict[str, str]:
@@ -1,15 +1,30 @@
+import gzip
+import heapq
 import json
 import logging
 import os
 import re
+import sys
+import threading
 import time
-from typing import Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Mapping, Match, Optional
 
 import requests
 
+from es_oom_exporter.assembler import ASSEMBLER_MAX_AGE, ASSEMBLER_MAX_ENTRIES, OomAssembler
+from es_oom_exporter.classifier import LineClassifier, LineKind
 from es_oom_exporter.kube import Kubernetes
 from es_oom_exporter.message_reader import MessageReader
+from es_oom_exporter.metrics import (
+    BYTES_READ,
+    ES_SEARCH_SECONDS,
+    ES_TARGET_ERRORS,
+    ES_TARGET_POLL_SECONDS,
+    LINES_READ,
+)
 from es_oom_exporter.oom import Oom
+from es_oom_exporter.pod_index import PodInfo
 from es_oom_exporter.utils import ensure_slash
 
 # Interesting messages during an OOM event:
@@ -19,6 +34,28 @@ from es_oom_exporter.utils import ensure_slash
 # Sep 19 08:35:40 ip-10-10-10-56 kernel: Memory cgroup out of memory: Kill process 99190 (apache2) score 1534 or sacrifice child  # pylint: disable=line-too-long
 
 LOG = logging.getLogger(__name__)
+ES_PAGE_SIZE = int(os.environ.get("ES_PAGE_SIZE", "500"))
+# Maximum number of pages read per poll
+ES_MAX_PAGES = int(os.environ.get("ES_MAX_PAGES", "20"))
+# Fields sorting the hits with the same timestamp, comma separated. They must identify a line, a hit with
+# the same sort values as the last one of a page would be skipped by search_after. With the filter on
+# /var/log/messages, the host and the offset in the file do.
+ES_TIEBREAKER = os.environ.get("ES_TIEBREAKER", "host.name,log.offset")
+# Type of the tiebreaker fields, for the indexes without them
+TIEBREAKER_TYPES = {"log.offset": "long"}
+ES_COMPRESS_REQUESTS = os.environ.get("ES_COMPRESS_REQUESTS", "true").lower() in ("true", "1")
+ES_TIMEOUT = 30
+# Hours of logs read on startup with sliced queries, disabled by default
+ES_BACKFILL_HOURS = float(os.environ.get("ES_BACKFILL_HOURS", "0"))
+ES_BACKFILL_SLICES = int(os.environ.get("ES_BACKFILL_SLICES", "4"))
+ES_PIT_KEEP_ALIVE = "1m"
+# With ES_TARGETS: number of targets read concurrently, and maximum time in seconds a poll waits for the
+# slow targets, their OOMs are returned by a next poll
+ES_MAX_CONCURRENCY = int(os.environ.get("ES_MAX_CONCURRENCY", "4"))
+ES_TARGET_WAIT = float(os.environ.get("ES_TARGET_WAIT", "5"))
+# Only get what we use from the response
+FILTER_PATH = "hits.hits._source.message,hits.hits.fields,hits.hits.sort"
+BACKFILL_FILTER_PATH = f"pit_id,{FILTER_PATH}"
 START_RE = re.compile(
     r".* ([^ ]+) kernel: Task in /kubepods\.slice/kubepods-burstable\.slice/"
     r"kubepods-burstable-pod([0-9a-f_]*)\.slice/docker-([0-9a-f]*)\.scope killed as a result of "
@@ -26,93 +63,438 @@ START_RE = re.compile(
 )
 CONTAINER_RE = re.compile(
     r".* ([^ ]+) kernel: Memory cgroup stats for /kubepods\.slice/kubepods-burstable\.slice/"
-    r"kubepods-burstable-pod([0-9a-f_]*)\.slice/docker-([0-9a-f]*)\.scope:.* rss:(\d+[KMG]B).*"
+    r"kubepods-burstable-pod([0-9a-f_]*)\.slice/docker-([0-9a-f]*)\.scope:"
 )
 OOM_RE = re.compile(
     r".* ([^ ]+) kernel: Memory cgroup out of memory: Kill process \d+ \(([^)]+)\) "
     r"score \d+ or sacrifice child"
 )
+CLASSIFIER = LineClassifier(START_RE, CONTAINER_RE, OOM_RE)
 
 
 class ElasticSearch(MessageReader):
-    """Read the message from elastic search."""
-
-    def __init__(self) -> None:
-        es_url = ensure_slash(os.environ["ES_URL"])
-        es_indexes = os.environ.get("ES_INDEXES", "_all")
-        es_auth = os.environ.get("ES_AUTH")
-        self.search_headers = {
-            "Content-Type": "application/json;charset=UTF-8",
-            "Accept": "application/json",
-            "kbn-version": "6.8.0",
-        }
-        if es_auth is not None:
-            self.search_headers["Authorization"] = es_auth
-        self.search_url = f"{es_url}{es_indexes}/_search"
+    """
+    Read the message from elastic search.
+
+    The hits are paginated with `search_after`, the cursor of the last hit is kept between the polls.
+    Without url, the target is configured with ES_URL, ES_INDEXES and ES_AUTH.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        indexes: str = "_all",
+        auth: Optional[str] = None,
+        name: str = "default",
+    ) -> None:
+        if url is None:
+            url = os.environ["ES_URL"]
+            indexes = os.environ.get("ES_INDEXES", "_all")
+            auth = os.environ.get("ES_AUTH")
+        self.name = name
+        self.es_url = ensure_slash(url)
+        self.es_indexes = indexes
+        # Keep the connection open between the polls
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json;charset=UTF-8",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip",
+                "kbn-version": "6.8.0",
+            }
+        )
+        if ES_COMPRESS_REQUESTS:
+            self.session.headers["Content-Encoding"] = "gzip"
+        if auth is not None:
+            self.session.headers["Authorization"] = auth
+        self.search_url = f"{self.es_url}{indexes}/_search"
         self.last_timestamp = int(time.time() * 1000)
+        self.search_after: Optional[List[Any]] = None
+        self._query = _get_query_template()
+        self._query_range = self._query["query"]["bool"]["filter"][-1]["range"]["@timestamp"]
+        # The OOM events can be split between two polls
+        self._assembler = OomAssembler(ASSEMBLER_MAX_AGE, ASSEMBLER_MAX_ENTRIES)
+        self._state_restored = False
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"last_timestamp": self.last_timestamp, "search_after": self.search_after}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        min_timestamp = int((time.time() - max_age) * 1000)
+        last_timestamp = state.get("last_timestamp")
+        if last_timestamp is None or last_timestamp < min_timestamp:
+            self.last_timestamp = min_timestamp
+            self.search_after = None
+        else:
+            self.last_timestamp = last_timestamp
+            self.search_after = state.get("search_after")
+            self._state_restored = True
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _get_query(self) -> Dict[str, Any]:
+        self._query_range["gte"] = self.last_timestamp
+        if self.search_after is not None:
+            self._query["search_after"] = self.search_after
+        else:
+            # e.g. after a restore of the state, the previous cursor must not be used
+            self._query.pop("search_after", None)
+        return self._query
+
+    def get_request_body(self) -> bytes:
+        """Get the body of the next search request."""
+        return self._encode(self._get_query())
+
+    @staticmethod
+    def _encode(query: Dict[str, Any]) -> bytes:
+        body = json.dumps(query).encode()
+        LOG.debug("Doing query: %s", body)
+        return gzip.compress(body) if ES_COMPRESS_REQUESTS else body
+
+    @staticmethod
+    def parse_response(content: bytes) -> List[Dict[str, Any]]:
+        """Get the hits of the body of a search response."""
+        BYTES_READ.labels("es").inc(len(content))
+        # With filter_path, the hits are missing if there is no hit
+        hits: List[Dict[str, Any]] = json.loads(content).get("hits", {}).get("hits", [])
+        LINES_READ.labels("es").inc(len(hits))
+        return hits
+
+    def _search(self) -> List[Dict[str, Any]]:
+        with ES_SEARCH_SECONDS.time(), self.session.post(
+            self.search_url,
+            params={"filter_path": FILTER_PATH},
+            data=self.get_request_body(),
+            timeout=ES_TIMEOUT,
+        ) as r:
+            r.raise_for_status()
+            return self.parse_response(r.content)
 
     def get_ooms(self, kube: Kubernetes) -> List[Oom]:
-        query = {
-            "version": True,
-            "size": 500,
-            "sort": [{"log.offset": {"order": "asc", "unmapped_type": "boolean"}}],
-            "docvalue_fields": [{"field": "@timestamp", "format": "epoch_millis"}],
-            "query": {
-                "bool": {
-                    "must": [{"match_all": {}}],
-                    "filter": [
-                        {"match_phrase": {"log.file.path": {"query": "/var/log/messages"}}},
-                        {"match_phrase": {"message": {"query": "kernel"}}},
-                        {
-                            "bool": {
-                                "should": [
-                                    {"match_phrase": {"message": "Memory cgroup stats for"}},
-                                    {"match_phrase": {"message": "Memory cgroup out of memory"}},
-                                    {"match_phrase": {"message": "killed as a result of limit of"}},
-                                ],
-                                "minimum_should_match": 1,
-                            }
-                        },
-                    ],
-                }
-            },
-        }
-        if self.last_timestamp is not None:
-            query["query"]["bool"]["filter"].append(  # type: ignore
-                {"range": {"@timestamp": {"gt": self.last_timestamp, "format": "epoch_millis"}}}
-            )
-        LOG.info("Doing query: %s", json.dumps(query))
-        with requests.post(self.search_url, json=query, headers=self.search_headers, timeout=30) as r:
+        return self.read_ooms(kube.get_pod_infos)
+
+    def read_ooms(self, get_pod_infos: Callable[[], Mapping[str, PodInfo]]) -> List[Oom]:
+        """Get the OOMs of the new hits, get_pod_infos is only called if needed."""
+        pages = SearchPages(self)
+        while pages.has_next():
+            if pages.add_hits(self._search()):
+                pages.pod_infos = get_pod_infos()
+            pages.process_hits()
+        return pages.ooms
+
+    def backfill(self, kube: Kubernetes) -> List[Oom]:
+        return self.read_backfill(kube.get_pod_infos)
+
+    def read_backfill(self, get_pod_infos: Callable[[], Mapping[str, PodInfo]]) -> List[Oom]:
+        """
+        Read the last ES_BACKFILL_HOURS hours of logs with concurrent sliced queries on a point in time.
+
+        The hits of the slices are merged in timestamp order, and the polls start where the backfill ended.
+        """
+        if ES_BACKFILL_HOURS <= 0 or self._state_restored:
+            return []
+        end = int(time.time() * 1000)
+        start = end - int(ES_BACKFILL_HOURS * 3600 * 1000)
+        try:
+            hits = self._backfill_search(start, end)
+        except Exception:  # pylint: disable=broad-except
+            # Also the unexpected responses, the polls must not start after the missing logs
+            LOG.exception("Error during the backfill, the polls will read the logs from its start")
+            self.last_timestamp = start
+            self.search_after = None
+            return []
+        LOG.info("Got %i hits from the backfill of the last %s hours", len(hits), ES_BACKFILL_HOURS)
+        ooms = self.process_hits(hits, get_pod_infos() if has_start(hits) else {})
+        # The sort values of the point in time searches have an additional tiebreaker
+        self.last_timestamp = end
+        self.search_after = None
+        return ooms
+
+    def _backfill_search(self, start: int, end: int) -> List[Dict[str, Any]]:
+        with self.session.post(
+            f"{self.es_url}{self.es_indexes}/_pit",
+            params={"keep_alive": ES_PIT_KEEP_ALIVE},
+            timeout=ES_TIMEOUT,
+        ) as r:
             r.raise_for_status()
-            json_responce = r.json()
-            hits = json_responce["hits"]["hits"]
-            if len(hits) == 0:
-                return []
-            pod_infos = kube.get_pod_infos()
-            cur_by_host: Dict[str, Oom] = {}
-            ooms = []
-            for hit in hits:
-                timestamp = int(hit["fields"]["@timestamp"][0])
-                self.last_timestamp = timestamp
-                message = hit["_source"]["message"]
-                LOG.debug("message: %s", message)
-                start_match = START_RE.match(message)
-                pod_match = CONTAINER_RE.match(message)
-                oom_match = OOM_RE.match(message)
-                if start_match:
-                    _get_cur(cur_by_host, start_match.group(1)).add_start_info(start_match, pod_infos)
-                if pod_match:
-                    _get_cur(cur_by_host, pod_match.group(1)).add_pod_info(pod_match)
-                elif oom_match:
-                    cur = cur_by_host.pop(oom_match.group(1), None)
-                    if cur is not None and cur.add_oom_info(oom_match):
-                        ooms.append(cur)
-            return ooms
-
-
-def _get_cur(cur_by_host: Dict[str, Oom], host: str) -> Oom:
-    cur = cur_by_host.get(host)
-    if cur is None:
-        cur = Oom(host)
-        cur_by_host[host] = cur
-    return cur
+            pit_id = r.json()["id"]
+        try:
+            with ThreadPoolExecutor(ES_BACKFILL_SLICES, thread_name_prefix="es-backfill") as executor:
+                slices = list(
+                    executor.map(
+                        lambda slice_id: self._search_slice(pit_id, slice_id, start, end),
+                        range(ES_BACKFILL_SLICES),
+                    )
+                )
+        finally:
+            with self.session.delete(
+                f"{self.es_url}_pit", data=self._encode({"id": pit_id}), timeout=ES_TIMEOUT
+            ) as r:
+                if not r.ok:
+                    LOG.warning("Cannot close the point in time: %s", r.text)
+        # The order of the lines of a host is kept (timestamp, then ES_TIEBREAKER, without the implicit
+        # tiebreaker of the point in time)
+        return list(heapq.merge(*slices, key=lambda hit: hit["sort"][:-1]))
+
+    def _search_slice(self, pit_id: str, slice_id: int, start: int, end: int) -> List[Dict[str, Any]]:
+        query = _get_query_template()
+        query["query"]["bool"]["filter"][-1]["range"]["@timestamp"].update({"gte": start, "lt": end})
+        query["pit"] = {"id": pit_id, "keep_alive": ES_PIT_KEEP_ALIVE}
+        if ES_BACKFILL_SLICES > 1:
+            query["slice"] = {"id": slice_id, "max": ES_BACKFILL_SLICES}
+        results: List[Dict[str, Any]] = []
+        while True:
+            with ES_SEARCH_SECONDS.time(), self.session.post(
+                f"{self.es_url}_search",
+                params={"filter_path": BACKFILL_FILTER_PATH},
+                data=self._encode(query),
+                timeout=ES_TIMEOUT,
+            ) as r:
+                r.raise_for_status()
+                BYTES_READ.labels("es").inc(len(r.content))
+                response = r.json()
+            hits: List[Dict[str, Any]] = response.get("hits", {}).get("hits", [])
+            LINES_READ.labels("es").inc(len(hits))
+            results.extend(hits)
+            if len(hits) < ES_PAGE_SIZE:
+                return results
+            query["pit"]["id"] = response.get("pit_id", query["pit"]["id"])
+            query["search_after"] = hits[-1]["sort"]
+
+    def process_hits(self, hits: List[Dict[str, Any]], pod_infos: Mapping[str, PodInfo]) -> List[Oom]:
+        """Get the complete OOMs of a page of hits, the pod_infos are needed if has_start(hits)."""
+        ooms = []
+        self._assembler.evict()
+        for hit in hits:
+            timestamp = int(hit["fields"]["@timestamp"][0])
+            self.last_timestamp = timestamp
+            self.search_after = hit["sort"]
+            message = hit["_source"]["message"]
+            LOG.debug("message: %s", message)
+            classified = CLASSIFIER.classify(message)
+            if classified is None:
+                continue
+            kind, match = classified
+            oom = process_message(self._assembler, kind, match, pod_infos)
+            if oom is not None:
+                oom.set_timestamp(timestamp / 1000)
+                ooms.append(oom)
+        return ooms
+
+
+class SearchPages:
+    """
+    The pagination of the hits of a poll, without the transport.
+
+    While has_next(), the transport does a search with the reader request body, gives the hits to
+    add_hits(), sets the POD infos if it returns True, and calls process_hits().
+    """
+
+    def __init__(self, reader: ElasticSearch) -> None:
+        self._reader = reader
+        self._nb_pages = 0
+        self._hits: List[Dict[str, Any]] = []
+        self.pod_infos: Optional[Mapping[str, PodInfo]] = None
+        self.ooms: List[Oom] = []
+
+    def has_next(self) -> bool:
+        if self._nb_pages > 0 and len(self._hits) < ES_PAGE_SIZE:
+            return False
+        if self._nb_pages >= ES_MAX_PAGES:
+            LOG.warning(
+                "Got more than %i pages of hits, the next ones will be read on the next poll", ES_MAX_PAGES
+            )
+            return False
+        return True
+
+    def add_hits(self, hits: List[Dict[str, Any]]) -> bool:
+        """Add the hits of a page, returns True if the POD infos are needed to process them."""
+        self._nb_pages += 1
+        self._hits = hits
+        return self.pod_infos is None and has_start(hits)
+
+    def process_hits(self) -> None:
+        self.ooms.extend(self._reader.process_hits(self._hits, self.pod_infos or {}))
+
+
+class MultiElasticSearch(MessageReader):
+    """
+    Read the messages from several Elasticsearch targets, each with its own cursor.
+
+    The targets are read concurrently on a bounded pool. A poll waits at most ES_TARGET_WAIT seconds, a
+    slower target continues in the background and its OOMs are returned by a next poll, so it doesn't
+    delay the others. The POD index is got at most once per poll, for all the targets.
+    """
+
+    def __init__(self, targets: List[ElasticSearch]) -> None:
+        self.targets = targets
+        self._executor = ThreadPoolExecutor(ES_MAX_CONCURRENCY, thread_name_prefix="es-target")
+        # target name => running poll
+        self._futures: Dict[str, "Future[List[Oom]]"] = {}
+        # target name => state at the end of its last poll, a running poll changes the cursors
+        self._states = {target.name: target.get_state() for target in targets}
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"targets": dict(self._states)}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        states = state.get("targets", {})
+        for target in self.targets:
+            target.set_state(states.get(target.name, {}), max_age)
+            self._states[target.name] = target.get_state()
+
+    def close(self) -> None:
+        # Don't wait for a slow target, its queued polls are cancelled
+        if sys.version_info >= (3, 9):
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        else:
+            for future in self._futures.values():
+                future.cancel()
+            self._executor.shutdown(wait=False)
+        for target in self.targets:
+            target.close()
+
+    def get_ooms(self, kube: Kubernetes) -> List[Oom]:
+        get_pod_infos = _SharedPodInfos(kube)
+        for target in self.targets:
+            if target.name not in self._futures:
+                self._futures[target.name] = self._executor.submit(self._poll, target, get_pod_infos)
+        wait(self._futures.values(), timeout=ES_TARGET_WAIT)
+        return self._collect()
+
+    def backfill(self, kube: Kubernetes) -> List[Oom]:
+        get_pod_infos = _SharedPodInfos(kube)
+        for target in self.targets:
+            self._futures[target.name] = self._executor.submit(self._backfill, target, get_pod_infos)
+        wait(self._futures.values())
+        return self._collect()
+
+    def _collect(self) -> List[Oom]:
+        ooms = []
+        for target in self.targets:
+            future = self._futures[target.name]
+            if future.done():
+                del self._futures[target.name]
+                ooms.extend(future.result())
+                self._states[target.name] = target.get_state()
+            else:
+                LOG.info("The target %s is slow, its OOMs will be returned by a next poll", target.name)
+        return ooms
+
+    @staticmethod
+    def _poll(target: ElasticSearch, get_pod_infos: Callable[[], Mapping[str, PodInfo]]) -> List[Oom]:
+        try:
+            with ES_TARGET_POLL_SECONDS.labels(target.name).time():
+                return target.read_ooms(get_pod_infos)
+        except Exception:  # pylint: disable=broad-except
+            ES_TARGET_ERRORS.labels(target.name).inc()
+            LOG.exception("Error while reading the target %s", target.name)
+            return []
+
+    @staticmethod
+    def _backfill(target: ElasticSearch, get_pod_infos: Callable[[], Mapping[str, PodInfo]]) -> List[Oom]:
+        try:
+            return target.read_backfill(get_pod_infos)
+        except Exception:  # pylint: disable=broad-except
+            ES_TARGET_ERRORS.labels(target.name).inc()
+            LOG.exception("Error during the backfill of the target %s", target.name)
+            return []
+
+
+class _SharedPodInfos:
+    """Get the POD index once, for all the targets of a poll."""
+
+    def __init__(self, kube: Kubernetes) -> None:
+        self._kube = kube
+        self._lock = threading.Lock()
+        self._pod_infos: Optional[Mapping[str, PodInfo]] = None
+
+    def __call__(self) -> Mapping[str, PodInfo]:
+        with self._lock:
+            if self._pod_infos is None:
+                self._pod_infos = self._kube.get_pod_infos()
+            return self._pod_infos
+
+
+def get_targets(config: str) -> List[ElasticSearch]:
+    """
+    Get the targets of ES_TARGETS.
+
+    It's a JSON list of objects with a name, an url, optional indexes (default: _all), and an optional
+    auth (value of the Authorization header) or auth_env (name of the environment variable containing it).
+    """
+    targets = []
+    for target in json.loads(config):
+        if "name" not in target or "url" not in target:
+            raise ValueError(f"The ES targets need a name and an url: {target}")
+        auth = target.get("auth")
+        if "auth_env" in target:
+            auth = os.environ[target["auth_env"]]
+        targets.append(ElasticSearch(target["url"], target.get("indexes", "_all"), auth, target["name"]))
+    if len({target.name for target in targets}) != len(targets):
+        raise ValueError("The names of the ES targets must be unique")
+    return targets
+
+
+def process_message(
+    assembler: OomAssembler, kind: LineKind, match: Match[str], pod_infos: Mapping[str, PodInfo]
+) -> Optional[Oom]:
+    """Add a classified message to its OOM event, get the OOM if it's complete."""
+    if kind is LineKind.START:
+        assembler.start(match.group(1), match.group(2).replace("_", "-")).add_start_info(match, pod_infos)
+    elif kind is LineKind.CONTAINER:
+        cur = assembler.get(match.group(1), match.group(2).replace("_", "-"))
+        if cur is not None:
+            cur.add_pod_info(match)
+        else:
+            LOG.debug("No OOM in progress for: %s", match.group(0))
+    elif kind is LineKind.OOM:
+        cur = assembler.pop_oldest(match.group(1))
+        if cur is not None and cur.add_oom_info(match):
+            return cur
+    return None
+
+
+def has_start(hits: List[Dict[str, Any]]) -> bool:
+    """Check if the hits contain the start of an OOM, that needs the POD infos."""
+    return any("Task in " in hit["_source"]["message"] for hit in hits)
+
+
+def _get_query_template() -> Dict[str, Any]:
+    return {
+        "size": ES_PAGE_SIZE,
+        "track_total_hits": False,
+        "_source": ["message"],
+        # The tiebreaker is needed to have a stable sort for search_after
+        "sort": [
+            {"@timestamp": {"order": "asc"}},
+            *(
+                {field: {"order": "asc", "unmapped_type": TIEBREAKER_TYPES.get(field, "keyword")}}
+                for field in ES_TIEBREAKER.split(",")
+            ),
+        ],
+        "docvalue_fields": [{"field": "@timestamp", "format": "epoch_millis"}],
+        "query": {
+            "bool": {
+                "must": [{"match_all": {}}],
+                "filter": [
+                    {"match_phrase": {"log.file.path": {"query": "/var/log/messages"}}},
+                    {"match_phrase": {"message": {"query": "kernel"}}},
+                    {
+                        "bool": {
+                            "should": [
+                                {"match_phrase": {"message": "Memory cgroup stats for"}},
+                                {"match_phrase": {"message": "Memory cgroup out of memory"}},
+                                {"match_phrase": {"message": "killed as a result of limit of"}},
+                            ],
+                            "minimum_should_match": 1,
+                        }
+                    },
+                    # Must be the last filter, the bound is updated before each request
+                    {"range": {"@timestamp": {"gte": None, "format": "epoch_millis"}}},
+                ],
+            }
+        },
+    }
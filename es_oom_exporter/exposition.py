@@ -0,0 +1,303 @@
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import prometheus_client.exposition
+import prometheus_client.openmetrics.exposition
+import prometheus_client.registry
+from prometheus_client.core import GaugeMetricFamily
+
+from es_oom_exporter.history import FIELDS
+from es_oom_exporter.metrics import EXPOSITION_RENDERS
+from es_oom_exporter.store import ContainerOoms, OomStore
+
+LOG = logging.getLogger(__name__)
+LABELS = ["namespace", "pod", "container", "process", "host"]
+OPENMETRICS_EOF = b"# EOF\n"
+HISTORY_MAX_LIMIT = 10000
+DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class OomCollector(prometheus_client.registry.Collector):
+    """Collect the OOM."""
+
+    def __init__(self, store: OomStore) -> None:
+        self.store = store
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        g_oom = GaugeMetricFamily(
+            "pod_process_oom",
+            "OOM events in a POD's container",
+            labels=LABELS,
+        )
+        g_rss_killed = GaugeMetricFamily(
+            "pod_process_oom_rss_container",
+            "RSS in bytes before an OOM events in a POD's container",
+            labels=LABELS,
+        )
+        g_rss = GaugeMetricFamily(
+            "pod_process_oom_rss", "RSS in bytes before an OOM events in a POD's container", labels=LABELS
+        )
+        g_memcg = GaugeMetricFamily(
+            "pod_process_oom_memcg_bytes",
+            "Memory cgroup counters in bytes before an OOM events in a POD's container",
+            labels=LABELS + ["stat"],
+        )
+        for container in self.store.get_snapshot():
+            g_oom.add_metric(labels=container.key, value=container.nb_ooms)
+            g_rss.add_metric(labels=container.key, value=container.rss)
+            g_rss_killed.add_metric(labels=container.key, value=container.rss_killed)
+            for name, value in container.memcg_stats.items():
+                g_memcg.add_metric(labels=[*container.key, name], value=value)
+
+        yield g_oom
+        yield g_rss_killed
+        yield g_rss
+        yield g_memcg
+
+
+class _Rendered(NamedTuple):
+    body: bytes
+    gzip_body: bytes
+    etag: str
+
+
+class RequestHeaders(NamedTuple):
+    """The headers of a scrape used for the content negotiation and the ETag."""
+
+    accept: str = ""
+    accept_encoding: str = ""
+    if_none_match: str = ""
+
+    @property
+    def openmetrics(self) -> bool:
+        return "application/openmetrics-text" in self.accept
+
+    @property
+    def gzip(self) -> bool:
+        return "gzip" in self.accept_encoding
+
+
+class Response(NamedTuple):
+    """A response of the exposition, independent of the HTTP server."""
+
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class MetricsExposition:
+    """
+    Render the OOM metrics once per change of the store, as plain and gzip bytes.
+
+    The metrics about the exporter itself change at every scrape, they are rendered every time and
+    appended. As a gzip stream can have several members, the cached gzip bytes are used as is.
+    """
+
+    def __init__(
+        self,
+        store: OomStore,
+        registry: prometheus_client.registry.CollectorRegistry = prometheus_client.registry.REGISTRY,
+        ready: Optional[threading.Event] = None,
+    ) -> None:
+        self._store = store
+        self._ready = ready
+        self._oom_registry = prometheus_client.registry.CollectorRegistry()
+        self._oom_registry.register(OomCollector(store))
+        self._registry = registry
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Tuple[ContainerOoms, ...]] = None
+        # OpenMetrics? => rendered OOM metrics
+        self._rendered: Dict[bool, _Rendered] = {}
+
+    def _get_ooms(self, openmetrics: bool) -> _Rendered:
+        with self._lock:
+            snapshot = self._store.get_snapshot()
+            if snapshot is not self._snapshot:
+                self._snapshot = snapshot
+                self._rendered = {}
+            rendered = self._rendered.get(openmetrics)
+            if rendered is None:
+                EXPOSITION_RENDERS.inc()
+                body = _generate(self._oom_registry, openmetrics)
+                etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+                rendered = self._rendered[openmetrics] = _Rendered(body, gzip.compress(body, 6), etag)
+            return rendered
+
+    def get_response(
+        self, path: str, headers: RequestHeaders = RequestHeaders(), query: str = ""
+    ) -> Response:
+        """
+        Get the response of a scrape.
+
+        /metrics (or /) returns all the metrics, /metrics/oom returns only the OOM metrics, with an ETag,
+        /ready returns 503 until the first poll is done, /ooms returns the events of the history as JSON.
+        """
+        if path == "/ready":
+            return self._get_ready_response()
+        if path == "/ooms" and self._store.history is not None:
+            return self._get_history_response(query, headers.gzip)
+        if path in ("/", "/metrics"):
+            return self._get_metrics_response(headers)
+        if path == "/metrics/oom":
+            return self._get_oom_metrics_response(headers)
+        return Response(404, {"Content-Type": "text/plain; charset=utf-8"}, b"Not found\n")
+
+    def _get_ready_response(self) -> Response:
+        if self._ready is not None and not self._ready.is_set():
+            return Response(503, {"Content-Type": "text/plain; charset=utf-8"}, b"Not ready\n")
+        return Response(200, {"Content-Type": "text/plain; charset=utf-8"}, b"Ready\n")
+
+    def _get_metrics_response(self, headers: RequestHeaders) -> Response:
+        """Get the cached OOM metrics, followed by the metrics about the exporter."""
+        ooms = self._get_ooms(headers.openmetrics)
+        tail = _generate(self._registry, headers.openmetrics)
+        return Response(200, _get_metrics_headers(headers), _get_metrics_body(ooms, tail, headers))
+
+    def _get_oom_metrics_response(self, headers: RequestHeaders) -> Response:
+        ooms = self._get_ooms(headers.openmetrics)
+        response_headers = _get_metrics_headers(headers)
+        # The bodies can be the same in both formats, without the EOF
+        etag = (
+            f'"{ooms.etag}{"-openmetrics" if headers.openmetrics else ""}{"-gzip" if headers.gzip else ""}"'
+        )
+        response_headers["ETag"] = etag
+        if etag in _parse_etags(headers.if_none_match) or headers.if_none_match.strip() == "*":
+            return Response(304, response_headers, b"")
+        return Response(200, response_headers, _get_metrics_body(ooms, b"", headers))
+
+    def _get_history_response(self, query: str, use_gzip: bool) -> Response:
+        """
+        Query the history.
+
+        The parameters are the filters (namespace, pod, container, process, host), since and until (seconds
+        since the epoch, or a duration before now like 6h) and limit.
+        """
+        assert self._store.history is not None  # nosec
+        params = dict(urllib.parse.parse_qsl(query))
+        try:
+            now = time.time()
+            since = _parse_time(params.pop("since", None), now)
+            until = _parse_time(params.pop("until", None), now)
+            limit = int(params.pop("limit", "100"))
+            if not 0 < limit <= HISTORY_MAX_LIMIT:
+                raise ValueError(f"The limit must be between 1 and {HISTORY_MAX_LIMIT}")
+            unknown = set(params) - set(FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+        except ValueError as e:
+            return _json_response(400, {"error": str(e)}, use_gzip)
+        events, truncated = self._store.history.query(params, since, until, limit)
+        return _json_response(
+            200,
+            {
+                "events": [event.to_json() for event in events],
+                "truncated": truncated,
+                "retained": len(self._store.history),
+            },
+            use_gzip,
+        )
+
+
+def _parse_time(value: Optional[str], now: float) -> Optional[float]:
+    if value is None:
+        return None
+    match = DURATION_RE.match(value)
+    if match is not None:
+        return now - float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}") from None
+
+
+def _json_response(status: int, data: Dict[str, Any], use_gzip: bool) -> Response:
+    body = json.dumps(data).encode()
+    headers = {"Content-Type": "application/json", "Vary": "Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = gzip.compress(body, 6)
+    return Response(status, headers, body)
+
+
+def _get_metrics_headers(headers: RequestHeaders) -> Dict[str, str]:
+    response_headers = {
+        "Content-Type": (
+            prometheus_client.openmetrics.exposition.CONTENT_TYPE_LATEST
+            if headers.openmetrics
+            else prometheus_client.exposition.CONTENT_TYPE_LATEST
+        ),
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if headers.gzip:
+        response_headers["Content-Encoding"] = "gzip"
+    return response_headers
+
+
+def _get_metrics_body(ooms: _Rendered, tail: bytes, headers: RequestHeaders) -> bytes:
+    if headers.openmetrics:
+        tail += OPENMETRICS_EOF
+    if headers.gzip:
+        return (ooms.gzip_body + gzip.compress(tail, 6)) if tail else ooms.gzip_body
+    return ooms.body + tail
+
+
+def _generate(registry: prometheus_client.registry.CollectorRegistry, openmetrics: bool) -> bytes:
+    if not openmetrics:
+        return prometheus_client.exposition.generate_latest(registry)
+    body: bytes = prometheus_client.openmetrics.exposition.generate_latest(registry)  # type: ignore
+    # Only one EOF, at the end of the concatenated parts
+    return body[: -len(OPENMETRICS_EOF)] if body.endswith(OPENMETRICS_EOF) else body
+
+
+def _parse_etags(header: str) -> List[str]:
+    return [etag.strip() for etag in header.split(",")]
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """HTTP server of the metrics."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], exposition: MetricsExposition) -> None:
+        super().__init__(address, _MetricsHandler)
+        self.exposition = exposition
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    server: MetricsServer
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        url = urllib.parse.urlsplit(self.path)
+        headers = RequestHeaders(
+            self.headers.get("Accept", ""),
+            self.headers.get("Accept-Encoding", ""),
+            self.headers.get("If-None-Match", ""),
+        )
+        response = self.server.exposition.get_response(url.path, headers, url.query)
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    def log_message(self, format: str, *args: object) -> None:  # pylint: disable=redefined-builtin
+        # One line per scrape is too much
+        LOG.debug("%s - %s", self.address_string(), format % args)
+
+
+def start_http_server(port: int, exposition: MetricsExposition, address: str = "") -> MetricsServer:
+    """Serve the metrics in a background thread."""
+    server = MetricsServer((address, port), exposition)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
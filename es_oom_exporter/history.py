@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from es_oom_exporter.metrics import HISTORY_EVENTS
+from es_oom_exporter.oom import Oom
+
+# The fields that can be filtered, with a secondary index
+FIELDS = ("namespace", "pod", "container", "process", "host")
+
+
+class OomEvent(NamedTuple):
+    """A resolved OOM, timestamp is the time of its log line, in seconds since the epoch."""
+
+    timestamp: float
+    host: str
+    namespace: Optional[str]
+    pod: Optional[str]
+    pod_uid: Optional[str]
+    container: Optional[str]
+    container_uid: Optional[str]
+    process: Optional[str]
+    release: Optional[str]
+    service: Optional[str]
+    rss: float
+    rss_killed: float
+    memcg_stats: Dict[str, float]
+
+    @staticmethod
+    def from_oom(oom: Oom, timestamp: float) -> "OomEvent":
+        """Get the event of an OOM, timestamp is used if the OOM doesn't have one."""
+        oom_timestamp = oom.get_timestamp()
+        return OomEvent(
+            oom_timestamp if oom_timestamp is not None else timestamp,
+            oom.get_host(),
+            oom.get_namespace(),
+            oom.get_pod_name(),
+            oom.get_pod_uid(),
+            oom.get_container(),
+            oom.get_container_uid(),
+            oom.get_process(),
+            oom.get_release(),
+            oom.get_service(),
+            oom.get_rss(),
+            oom.get_killed_rss(),
+            oom.get_memcg_stats(),
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class _Events:
+    """
+    Events ordered by timestamp, then by insertion, the first ones can be already evicted.
+
+    The evicted events are removed by batches, when half of the list is evicted.
+    """
+
+    __slots__ = ("head", "timestamps", "events")
+
+    def __init__(self) -> None:
+        # Index of the oldest retained event
+        self.head = 0
+        self.timestamps: List[float] = []
+        self.events: List[OomEvent] = []
+
+    def __len__(self) -> int:
+        return len(self.events) - self.head
+
+    def insert(self, event: OomEvent) -> None:
+        pos = bisect.bisect_right(self.timestamps, event.timestamp, lo=self.head)
+        self.timestamps.insert(pos, event.timestamp)
+        self.events.insert(pos, event)
+
+    def evict(self, nb_events: int) -> None:
+        """Evict the nb_events oldest retained events."""
+        self.head += nb_events
+        if self.head * 2 >= len(self.events):
+            del self.timestamps[: self.head]
+            del self.events[: self.head]
+            self.head = 0
+
+    def get_range(self, since: Optional[float], until: Optional[float]) -> "_Slice":
+        start = self.head
+        if since is not None:
+            start = bisect.bisect_left(self.timestamps, since, lo=start)
+        end = len(self.events)
+        if until is not None:
+            end = bisect.bisect_right(self.timestamps, until, lo=start)
+        return _Slice(self.events, start, end)
+
+
+class OomHistory:
+    """
+    Keep the last OOMs, at most max_events of them and for at most max_age seconds.
+
+    The events are in a list ordered by the time of their log lines, the late ones (e.g. from the
+    backfill or from a slow host) are inserted at their place. The secondary indexes are the same
+    lists by field value, so the time range of a query is found by bisection in the index with the
+    fewest candidates.
+    """
+
+    def __init__(self, max_events: int, max_age: float) -> None:
+        self._max_events = max_events
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._events = _Events()
+        # field => value => events
+        self._indexes: Dict[str, Dict[str, _Events]] = {field: {} for field in FIELDS}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, ooms: Sequence[Oom]) -> None:
+        with self._lock:
+            now = time.time()
+            for oom in ooms:
+                event = OomEvent.from_oom(oom, now)
+                self._events.insert(event)
+                for field in FIELDS:
+                    value = getattr(event, field)
+                    if value is not None:
+                        self._indexes[field].setdefault(value, _Events()).insert(event)
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        events = self._events
+        head = max(
+            events.head,
+            len(events.events) - self._max_events,
+            bisect.bisect_left(events.timestamps, now - self._max_age, lo=events.head),
+        )
+        # The evicted events are also the oldest retained ones of their indexes
+        for event in events.events[events.head : head]:
+            for field in FIELDS:
+                value = getattr(event, field)
+                if value is not None:
+                    index = self._indexes[field]
+                    index[value].evict(1)
+                    if not index[value]:
+                        del index[value]
+        events.evict(head - events.head)
+        HISTORY_EVENTS.set(len(self))
+
+    def query(
+        self,
+        filters: Dict[str, str],
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> Tuple[List[OomEvent], bool]:
+        """
+        Get the events matching the filters (field of FIELDS => value), in the time range, newest first.
+
+        Also returns True if more events are matching than the limit.
+        """
+        with self._lock:
+            self._evict(time.time())
+            candidates = self._events.get_range(since, until)
+            for field, value in filters.items():
+                index = self._indexes[field].get(value)
+                if index is None:
+                    return [], False
+                index_candidates = index.get_range(since, until)
+                if len(index_candidates) < len(candidates):
+                    candidates = index_candidates
+
+            events: List[OomEvent] = []
+            for i in range(len(candidates) - 1, -1, -1):
+                event = candidates[i]
+                if all(getattr(event, field) == value for field, value in filters.items()):
+                    if len(events) == limit:
+                        return events, True
+                    events.append(event)
+            return events, False
+
+
+class _Slice(Sequence[OomEvent]):
+    """A view of a part of a list, without copying it."""
+
+    def __init__(self, items: List[OomEvent], start: int, end: int) -> None:
+        self._items = items
+        self._start = start
+        self._end = end
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, i: Any) -> Any:
+        return self._items[self._start + i]
@@ -0,0 +1,192 @@
+import logging
+import os
+import subprocess  # nosec
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+from es_oom_exporter.dmesg import CLASSIFIER, Dmesg
+from es_oom_exporter.kmsg import LEVELS
+from es_oom_exporter.kube import Kubernetes
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.utils import count_read
+
+LOG = logging.getLogger(__name__)
+# Directory of the journal files, e.g. the /var/log/journal of the host mounted in the container,
+# the default is the journal of the system
+JOURNAL_DIRECTORY = os.environ.get("JOURNAL_DIRECTORY")
+READ_SIZE = 65536
+# Seconds to wait for journalctl to exit on SIGTERM, before killing it
+STOP_TIMEOUT = 5
+# The fields we need, the export format always contains the cursor
+OUTPUT_FIELDS = "MESSAGE,PRIORITY,_SOURCE_MONOTONIC_TIMESTAMP"
+
+
+class Journal(Dmesg):
+    """
+    Read the kernel messages from the systemd journal.
+
+    A `journalctl --follow` process streams the new entries in the export format, its output is read
+    without blocking at every poll. The cursor of the last entry is kept, to restart from there.
+    """
+
+    def __init__(self, directory: Optional[str] = JOURNAL_DIRECTORY) -> None:
+        super().__init__()
+        self._directory = directory
+        self._cursor: Optional[str] = None
+        self._max_age: Optional[float] = None
+        self._process: Optional["subprocess.Popen[bytes]"] = None
+        self._parser = ExportParser()
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"cursor": self._cursor}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        # The cursors are valid across the reboots
+        self._cursor = state.get("cursor")
+        self._max_age = max_age
+        # Restart from the new state
+        self._stop_process()
+
+    def close(self) -> None:
+        self._stop_process()
+
+    def _get_command(self) -> List[str]:
+        command = [
+            "journalctl",
+            "--output=export",
+            f"--output-fields={OUTPUT_FIELDS}",
+            "--follow",
+            "--lines=all",
+            "--no-pager",
+        ]
+        if self._directory is not None:
+            command.append(f"--directory={self._directory}")
+        if self._cursor is not None:
+            command.append(f"--after-cursor={self._cursor}")
+        elif self._max_age is not None:
+            command.append(f"--since=-{int(self._max_age)}s")
+        else:
+            # Same as dmesg
+            command.append("--boot")
+        command.append("_TRANSPORT=kernel")
+        return command
+
+    def _get_stdout(self) -> IO[bytes]:
+        if self._process is None:
+            command = self._get_command()
+            LOG.info("Running %s", " ".join(command))
+            # Long running, stopped by _stop_process
+            self._process = subprocess.Popen(  # nosec pylint: disable=consider-using-with
+                command, stdout=subprocess.PIPE
+            )
+            assert self._process.stdout is not None  # nosec
+            os.set_blocking(self._process.stdout.fileno(), False)
+            self._parser = ExportParser()
+        assert self._process.stdout is not None  # nosec
+        return self._process.stdout
+
+    def fileno(self) -> int:
+        """Get the file descriptor to wait on for new entries."""
+        return self._get_stdout().fileno()
+
+    def get_ooms(self, kube: Kubernetes) -> List[Oom]:
+        return self.process_messages(CLASSIFIER.classify_all(self._read_messages()), kube.get_pod_infos)
+
+    def _read_messages(self) -> Iterator[str]:
+        try:
+            for chunk in count_read(self._read_chunks(), "journal"):
+                for entry in self._parser.feed(chunk):
+                    message = self._parse_entry(entry)
+                    if message is not None:
+                        yield message
+        except Exception:
+            # The output is in an unknown state, the next poll restarts from the last cursor
+            self._stop_process()
+            raise
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        fd = self.fileno()
+        while True:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            if not data:
+                return_code = self._stop_process()
+                LOG.warning("journalctl exited with %s, it will be restarted at the next poll", return_code)
+                return
+            yield data
+
+    def _stop_process(self) -> Optional[int]:
+        """Stop journalctl if it is running, and get its return code."""
+        process = self._process
+        if process is None:
+            return None
+        self._process = None
+        process.terminate()
+        try:
+            return_code = process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            return_code = process.wait()
+        assert process.stdout is not None  # nosec
+        process.stdout.close()
+        return return_code
+
+    def _parse_entry(self, entry: Dict[str, bytes]) -> Optional[str]:
+        cursor = entry.get("__CURSOR")
+        if cursor is not None:
+            self._cursor = cursor.decode()
+        if int(entry.get("PRIORITY", b"6")) not in LEVELS:
+            return None
+        message = entry.get("MESSAGE")
+        if message is None:
+            return None
+        text = message.decode(errors="replace").rstrip()
+        # Same format as dmesg
+        timestamp = int(entry.get("_SOURCE_MONOTONIC_TIMESTAMP", b"0"))
+        return f"[{timestamp // 1000000:5d}.{timestamp % 1000000:06d}] {text}"
+
+
+class ExportParser:
+    """
+    Incremental parser of the journal export format.
+
+    The entries are separated by an empty line, the fields are `NAME=value` lines, or for the binary values
+    a `NAME` line followed by the size on 64 bits little endian, the value and a new line.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._entry: Dict[str, bytes] = {}
+
+    def feed(self, data: bytes) -> List[Dict[str, bytes]]:
+        """Get the entries completed by this chunk of data."""
+        entries = []
+        buffer = self._buffer
+        buffer += data
+        pos = 0
+        while True:
+            end = buffer.find(b"\n", pos)
+            if end < 0:
+                break
+            if end == pos:
+                if self._entry:
+                    entries.append(self._entry)
+                    self._entry = {}
+                pos = end + 1
+                continue
+            separator = buffer.find(b"=", pos, end)
+            if separator >= 0:
+                self._entry[buffer[pos:separator].decode()] = bytes(buffer[separator + 1 : end])
+                pos = end + 1
+            else:
+                value_start = end + 9
+                if len(buffer) < value_start:
+                    break
+                value_end = value_start + int.from_bytes(buffer[end + 1 : value_start], "little")
+                if len(buffer) <= value_end:
+                    break
+                self._entry[buffer[pos:end].decode()] = bytes(buffer[value_start:value_end])
+                pos = value_end + 1
+        del buffer[:pos]
+        return entries
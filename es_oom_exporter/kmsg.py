@@ -0,0 +1,104 @@
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from es_oom_exporter.dmesg import CLASSIFIER, Dmesg, get_boot_id
+from es_oom_exporter.kube import Kubernetes
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.utils import count_read, split_lines
+
+LOG = logging.getLogger(__name__)
+KMSG = "/dev/kmsg"
+READ_SIZE = 65536
+# Same filter as `dmesg --facility=kern --level=info,err`
+LEVELS = (3, 6)
+
+
+class Kmsg(Dmesg):
+    """
+    Read the message from /dev/kmsg.
+
+    The file is opened once and only the new records are read, the kernel sequence number is used as
+    cursor. Fall back on the dmesg command if /dev/kmsg is not readable.
+    """
+
+    def __init__(self, path: str = KMSG) -> None:
+        super().__init__()
+        self._seq: Optional[int] = None
+        # In microseconds since the boot
+        self._min_timestamp = 0
+        self._fd: Optional[int] = None
+        try:
+            self._fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError as e:
+            LOG.warning("Cannot open %s, fall back on the dmesg command: %s", path, e)
+            return
+        try:
+            os.lseek(self._fd, 0, os.SEEK_DATA)
+        except OSError:
+            # Not seekable (e.g. a FIFO)
+            pass
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def fileno(self) -> Optional[int]:
+        """Get the file descriptor of /dev/kmsg, None if we fall back on the dmesg command."""
+        return self._fd
+
+    def get_state(self) -> Dict[str, Any]:
+        return {**super().get_state(), "seq": self._seq}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        super().set_state(state, max_age)
+        if state.get("boot_id") == get_boot_id():
+            self._seq = state.get("seq")
+        self._min_timestamp = int((time.monotonic() - max_age) * 1000000)
+
+    def get_ooms(self, kube: Kubernetes) -> List[Oom]:
+        if self._fd is None:
+            return super().get_ooms(kube)
+        return self.process_messages(
+            CLASSIFIER.classify_all(self._read_messages(self._fd)), kube.get_pod_infos
+        )
+
+    def _read_messages(self, fd: int) -> Iterator[str]:
+        for record in split_lines(count_read(_read_chunks(fd), "kmsg")):
+            message = self._parse_record(record)
+            if message is not None:
+                yield message
+
+    def _parse_record(self, record: str) -> Optional[str]:
+        # Record format: <priority>,<sequence>,<timestamp>,<flags>[,...];<message>
+        # followed by optional continuation lines starting with a space.
+        header, sep, text = record.partition(";")
+        fields = header.split(",")
+        if record.startswith(" ") or not sep or len(fields) < 4:
+            return None
+        priority, seq, timestamp = int(fields[0]), int(fields[1]), int(fields[2])
+        if self._seq is not None and seq <= self._seq:
+            return None
+        self._seq = seq
+        if timestamp < self._min_timestamp or priority >> 3 != 0 or priority & 7 not in LEVELS:
+            return None
+        # Same format as dmesg
+        return f"[{timestamp // 1000000:5d}.{timestamp % 1000000:06d}] {text}"
+
+
+def _read_chunks(fd: int) -> Iterator[bytes]:
+    # With /dev/kmsg, each read returns one complete record
+    while True:
+        try:
+            data = os.read(fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except BrokenPipeError:
+            # The next record is read on the next call
+            LOG.warning("Some kernel messages have been overwritten before being read")
+            continue
+        if not data:
+            return
+        yield data
@@ -1,69 +1,279 @@
+import copy
+import functools
 import logging
 import os
-from typing import Any, Dict, List
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
 
-from kubernetes.client import CoreV1Api, VersionApi
-from kubernetes.client.api_client import ApiClient
-from kubernetes.client.models.v1_pod_list import V1PodList
-from kubernetes.config.incluster_config import SERVICE_TOKEN_FILENAME, load_incluster_config
-from kubernetes.config.kube_config import load_kube_config
+from es_oom_exporter.metrics import GET_POD_INFOS_SECONDS, LIST_PODS_SECONDS, POD_INDEX_SIZE
+from es_oom_exporter.pod_index import PodIndex, PodInfo
+
+if TYPE_CHECKING:
+    from kubernetes.client import ApiClient, V1Pod, V1PodList
+
+# The kubernetes client takes a long time to import, it's imported on first use
+# pylint: disable=import-outside-toplevel
 
 LOG = logging.getLogger(__name__)
 NAMESPACE = os.environ.get("NAMESPACE")
+# watch: one list followed by a watch that keeps the index up to date, without NAMESPACE it needs
+# the cluster-wide permissions, falls back to list on a 403
+# list: list all the PODs every time we need to resolve one
+# kubelet: get the PODs from the local kubelet every time we need to resolve one (node scoped only)
+POD_SOURCE = os.environ.get("POD_SOURCE", "watch")
+KUBELET_URL = os.environ.get("KUBELET_URL", "https://localhost:10250")
+KUBELET_INSECURE = os.environ.get("KUBELET_INSECURE", "false").lower() in ("true", "1")
+POD_INDEX_GRACE_PERIOD = float(os.environ.get("POD_INDEX_GRACE_PERIOD", "600"))
+WATCH_TIMEOUT = int(os.environ.get("WATCH_TIMEOUT", "300"))
+WATCH_RETRY_DELAY = 10
+# How the PODs are listed with POD_SOURCE=list and without NAMESPACE:
+# namespaces: one list per namespace (or OpenShift project), run concurrently
+# paginated: one paginated list of the PODs of all the namespaces (needs the cluster-wide permission)
+POD_LIST_STRATEGY = os.environ.get("POD_LIST_STRATEGY", "namespaces")
+POD_LIST_CONCURRENCY = int(os.environ.get("POD_LIST_CONCURRENCY", "8"))
+POD_LIST_TIMEOUT = float(os.environ.get("POD_LIST_TIMEOUT", "30"))
+POD_LIST_PAGE_SIZE = int(os.environ.get("POD_LIST_PAGE_SIZE", "500"))
 
 
 class Kubernetes:
-    """Get some additional the information about the kubernetes contest."""
+    """
+    Get some additional the information about the kubernetes contest.
+
+    With a node name, only the PODs running on that node are resolved.
+    """
+
+    def __init__(self, node_name: Optional[str] = None) -> None:
+        # Nothing is loaded or requested before the first use
+        self._api: Optional["ApiClient"] = None
+        self._api_lock = threading.Lock()
+        self._node_name = node_name
+        self._field_selector = f"spec.nodeName={node_name}" if node_name is not None else None
+        self._index = PodIndex(POD_INDEX_GRACE_PERIOD)
+        POD_INDEX_SIZE.set_function(lambda: len(self._index))
+        self._watch_lock = threading.Lock()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._kubelet_api: Optional["ApiClient"] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Set when the POD index has been loaded once
+        self.loaded = threading.Event()
+        # Can fall back from watch to list
+        self._pod_source = POD_SOURCE
+
+    @property
+    def api(self) -> "ApiClient":
+        """Get the client of the API server, the configuration is loaded on the first call."""
+        with self._api_lock:
+            if self._api is None:
+                from kubernetes.client import ApiClient, Configuration
+                from kubernetes.config.incluster_config import SERVICE_TOKEN_FILENAME, load_incluster_config
+                from kubernetes.config.kube_config import load_kube_config
 
-    def __init__(self) -> None:
-        if os.path.exists(SERVICE_TOKEN_FILENAME):
-            load_incluster_config()
+                if os.path.exists(SERVICE_TOKEN_FILENAME):
+                    load_incluster_config()
+                else:
+                    load_kube_config()
+                configuration = Configuration.get_default_copy()
+                # One connection per concurrent list
+                configuration.connection_pool_maxsize = max(
+                    configuration.connection_pool_maxsize, POD_LIST_CONCURRENCY
+                )
+                self._api = ApiClient(configuration)
+            return self._api
+
+    @functools.cached_property
+    def is_openshift(self) -> bool:
+        """Probe the cluster flavor, only needed to list the namespaces."""
+        from kubernetes.client import VersionApi
+
+        return "eks" not in VersionApi(self.api).get_code().git_version
+
+    def start(self) -> None:
+        """Load the POD index in the background, so the polls don't wait for it."""
+        if self._pod_source in ("list", "kubelet"):
+            threading.Thread(target=self._load, name="pod-loader", daemon=True).start()
         else:
-            load_kube_config()
-        self.api = ApiClient()
-        version_api = VersionApi(self.api)
-        self._is_openshift = "eks" not in version_api.get_code().git_version
+            self._ensure_watching()
 
-    def get_pod_infos(self) -> Dict[Any, Dict[str, Any]]:
-        if NAMESPACE is None:
-            results = {}
-            namespaces = self.get_namespaces()
-            for namespace in namespaces:
-                results.update(self._get_pod_infos_ns(namespace))
-            return results
+    def _load(self) -> None:
+        try:
+            self.get_pod_infos()
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception("Cannot load the PODs, the next OOM will try again")
+
+    def get_pod_infos(self) -> PodIndex:
+        with GET_POD_INFOS_SECONDS.labels(self._pod_source).time():
+            if self._pod_source == "list":
+                pod_infos, failed_namespaces = self._list_pod_infos()
+                self._index.replace(pod_infos, keep_namespaces=failed_namespaces)
+                self.loaded.set()
+            elif self._pod_source == "kubelet":
+                self._index.replace(self._get_kubelet_pod_infos())
+                self.loaded.set()
+            else:
+                self._ensure_watching()
+                # Only an OOM right after the start waits for the first list of the watch thread
+                if not self.loaded.wait(POD_LIST_TIMEOUT):
+                    LOG.warning("The PODs are not listed yet, the OOM may not be resolved")
+        return self._index
+
+    def _list_pod_infos(self) -> Tuple[Dict[str, PodInfo], Set[str]]:
+        """Get the POD infos and the namespaces that failed to be listed."""
+        if self._node_name is not None:
+            list_pods, args = self._get_list_pods_call()
+            with LIST_PODS_SECONDS.labels(NAMESPACE or "").time():
+                pods: "V1PodList" = list_pods(
+                    *args, field_selector=self._field_selector, _request_timeout=POD_LIST_TIMEOUT
+                )
+            return {pod.metadata.uid: get_pod_info(pod) for pod in pods.items}, set()
+        elif NAMESPACE is not None:
+            return self._get_pod_infos_ns(NAMESPACE), set()
+        elif POD_LIST_STRATEGY == "paginated":
+            return self._list_pod_infos_paginated(), set()
         else:
-            return self._get_pod_infos_ns(NAMESPACE)
+            return self._list_pod_infos_concurrently(self.get_namespaces())
+
+    def _list_pod_infos_concurrently(self, namespaces: List[str]) -> Tuple[Dict[str, PodInfo], Set[str]]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(POD_LIST_CONCURRENCY, thread_name_prefix="pod-lister")
+        futures = {
+            self._executor.submit(self._get_pod_infos_ns, namespace): namespace for namespace in namespaces
+        }
+        results: Dict[str, PodInfo] = {}
+        failed_namespaces = set()
+        for future in as_completed(futures):
+            namespace = futures[future]
+            try:
+                results.update(future.result())
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.warning(
+                    "Cannot list the PODs of the namespace %s, keeping the previous ones: %s", namespace, e
+                )
+                failed_namespaces.add(namespace)
+        return results, failed_namespaces
+
+    def _get_pod_infos_ns(self, namespace: str) -> Dict[str, PodInfo]:
+        from kubernetes.client import CoreV1Api
+
+        v1 = CoreV1Api(self.api)
+        with LIST_PODS_SECONDS.labels(namespace).time():
+            pods: "V1PodList" = v1.list_namespaced_pod(namespace, _request_timeout=POD_LIST_TIMEOUT)
+        return {pod.metadata.uid: get_pod_info(pod) for pod in pods.items}
+
+    def _list_pod_infos_paginated(self) -> Dict[str, PodInfo]:
+        from kubernetes.client import CoreV1Api
+
+        v1 = CoreV1Api(self.api)
+        results: Dict[str, PodInfo] = {}
+        continue_token = None
+        while True:
+            with LIST_PODS_SECONDS.labels("").time():
+                pods: "V1PodList" = v1.list_pod_for_all_namespaces(
+                    limit=POD_LIST_PAGE_SIZE, _continue=continue_token, _request_timeout=POD_LIST_TIMEOUT
+                )
+            results.update({pod.metadata.uid: get_pod_info(pod) for pod in pods.items})
+            continue_token = pods.metadata._continue  # pylint: disable=protected-access
+            if not continue_token:
+                return results
+
+    def _get_kubelet_pod_infos(self) -> Dict[str, PodInfo]:
+        if self._kubelet_api is None:
+            from kubernetes.client import ApiClient
+
+            # Same configuration and credentials as the API server
+            configuration = copy.deepcopy(self.api.configuration)
+            configuration.host = KUBELET_URL
+            configuration.verify_ssl = not KUBELET_INSECURE
+            self._kubelet_api = ApiClient(configuration)
+        pods: "V1PodList" = self._kubelet_api.call_api(
+            "/pods",
+            "GET",
+            auth_settings=["BearerToken"],
+            response_type="V1PodList",
+            _return_http_data_only=True,
+        )
+        return {
+            pod.metadata.uid: get_pod_info(pod)
+            for pod in pods.items
+            if NAMESPACE is None or pod.metadata.namespace == NAMESPACE
+        }
+
+    def _ensure_watching(self) -> None:
+        with self._watch_lock:
+            if self._watch_thread is not None:
+                return
+            # The thread starts with the first list
+            self._watch_thread = threading.Thread(
+                target=self._watch, args=(None,), name="pod-watcher", daemon=True
+            )
+            self._watch_thread.start()
+
+    def _get_list_pods_call(self) -> Tuple[Callable[..., "V1PodList"], List[str]]:
+        from kubernetes.client import CoreV1Api
 
-    def _get_pod_infos_ns(self, namespace: str) -> Dict[Any, Dict[str, Any]]:
         v1 = CoreV1Api(self.api)
-        results = {}
-        pods: V1PodList = v1.list_namespaced_pod(namespace)
-        for pod in pods.items:
-            md = pod.metadata
-            status = pod.status
-            containers = {}
-            for statuses in (status.container_statuses, status.init_container_statuses):
-                if statuses is None:
-                    continue
-                for container_status in statuses:
-                    for location in (
-                        container_status,
-                        container_status.last_state.terminated,
-                        container_status.state.terminated,
-                    ):
-                        if location is not None and location.container_id is not None:
-                            containers[location.container_id.replace("docker://", "")] = container_status.name
-            results[md.uid] = {
-                "namespace": md.namespace,
-                "release": md.labels.get("release", md.labels.get("app.kubernetes.io/instance")),
-                "service": md.labels.get("service", md.labels.get("app.kubernetes.io/name")),
-                "pod_name": md.name,
-                "containers": containers,
-            }
-        return results
+        if NAMESPACE is None:
+            return v1.list_pod_for_all_namespaces, []
+        else:
+            return v1.list_namespaced_pod, [NAMESPACE]
+
+    def _relist(self) -> str:
+        list_pods, args = self._get_list_pods_call()
+        with LIST_PODS_SECONDS.labels(NAMESPACE or "").time():
+            pods: "V1PodList" = list_pods(
+                *args, field_selector=self._field_selector, _request_timeout=POD_LIST_TIMEOUT
+            )
+        self._index.replace({pod.metadata.uid: get_pod_info(pod) for pod in pods.items})
+        self.loaded.set()
+        LOG.info("Listed %i PODs at resource version %s", len(pods.items), pods.metadata.resource_version)
+        return str(pods.metadata.resource_version)
+
+    def _watch(self, resource_version: Optional[str]) -> None:
+        from kubernetes.client.exceptions import ApiException
+        from kubernetes.watch import Watch
+
+        list_pods, args = self._get_list_pods_call()
+        while True:
+            try:
+                if resource_version is None:
+                    resource_version = self._relist()
+                watch = Watch()
+                for event in watch.stream(
+                    list_pods,
+                    *args,
+                    field_selector=self._field_selector,
+                    resource_version=resource_version,
+                    timeout_seconds=WATCH_TIMEOUT,
+                ):
+                    pod: "V1Pod" = event["object"]
+                    if event["type"] == "DELETED":
+                        self._index.remove(pod.metadata.uid)
+                    elif event["type"] in ("ADDED", "MODIFIED"):
+                        self._index.update(pod.metadata.uid, get_pod_info(pod))
+                if watch.resource_version is not None:
+                    resource_version = watch.resource_version
+            except ApiException as e:
+                if e.status == 410:
+                    LOG.info("The POD watch has expired, re-listing")
+                    resource_version = None
+                elif e.status == 403 and NAMESPACE is None and self._node_name is None:
+                    # e.g. a service account with only the permissions of some OpenShift projects, the
+                    # list mode lists the PODs of each visible project
+                    LOG.warning("Cannot watch the PODs of the cluster, falling back to POD_SOURCE=list")
+                    self._pod_source = "list"
+                    self._load()
+                    return
+                else:
+                    LOG.warning("Error while watching the PODs: %s", e)
+                    time.sleep(WATCH_RETRY_DELAY)
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Error while watching the PODs")
+                time.sleep(WATCH_RETRY_DELAY)
 
     def get_namespaces(self) -> List[Any]:
-        if self._is_openshift:
+        if self.is_openshift:
             data, status, _headers = self.api.call_api(
                 "/apis/project.openshift.io/v1/projects",
                 "GET",
@@ -74,6 +284,40 @@ class Kubernetes:
             assert data["kind"] == "ProjectList"  # nosec
             return [ns["metadata"]["name"] for ns in data["items"]]
         else:
+            from kubernetes.client import CoreV1Api
+
             v1 = CoreV1Api(self.api)
             namespaces = v1.list_namespace()
             return [ns.metadata.name for ns in namespaces.items]
+
+
+def get_pod_info(pod: "V1Pod") -> PodInfo:
+    """Get the info of a POD of the API server, or of a snapshot of the PODs."""
+    md = pod.metadata
+    status = pod.status
+    labels = md.labels or {}
+    containers: Dict[str, str] = {}
+    for statuses in (status.container_statuses, status.init_container_statuses):
+        if statuses is None:
+            continue
+        for container_status in statuses:
+            for location in (
+                container_status,
+                container_status.last_state.terminated,
+                container_status.state.terminated,
+            ):
+                if location is not None and location.container_id is not None:
+                    containers[location.container_id.replace("docker://", "")] = sys.intern(
+                        container_status.name
+                    )
+    return PodInfo(
+        namespace=sys.intern(md.namespace),
+        release=_intern(labels.get("release", labels.get("app.kubernetes.io/instance"))),
+        service=_intern(labels.get("service", labels.get("app.kubernetes.io/name"))),
+        pod_name=md.name,
+        containers=tuple(containers.items()),
+    )
+
+
+def _intern(text: Optional[str]) -> Optional[str]:
+    return sys.intern(text) if text is not None else None
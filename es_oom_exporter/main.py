@@ -1,103 +1,77 @@
+import asyncio
 import logging.config
 import os
-import time
-from typing import Dict, Iterator, List, Union, cast
+import threading
 
-import prometheus_client.exposition
-import prometheus_client.registry
-from prometheus_client.core import GaugeMetricFamily
-
-from es_oom_exporter.dmesg import Dmesg
-from es_oom_exporter.es import ElasticSearch
+from es_oom_exporter.checkpoint import Checkpoint
+from es_oom_exporter.debug import DEBUG_PORT, start_debug_server
+from es_oom_exporter.es import ElasticSearch, MultiElasticSearch, get_targets
+from es_oom_exporter.exposition import MetricsExposition, start_http_server
+from es_oom_exporter.history import OomHistory
+from es_oom_exporter.journal import Journal
+from es_oom_exporter.kmsg import Kmsg
 from es_oom_exporter.kube import Kubernetes
 from es_oom_exporter.message_reader import MessageReader
-from es_oom_exporter.oom import Oom
+from es_oom_exporter.poller import Poller, PollerOptions
+from es_oom_exporter.store import OomStore
 
-LABELS = ["namespace", "pod", "container", "process", "host"]
+LOG_CONFIG = os.environ.get("LOG_CONFIG", "/app/production.ini")
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "10"))
+OOM_RETENTION = float(os.environ.get("OOM_RETENTION", "300"))
+# The individual OOMs kept for the /ooms endpoint, 0 to disable it
+HISTORY_MAX_EVENTS = int(os.environ.get("HISTORY_MAX_EVENTS", "10000"))
+HISTORY_MAX_AGE = float(os.environ.get("HISTORY_MAX_AGE", "86400"))
+CHECKPOINT_FILE = os.environ.get("CHECKPOINT_FILE")
+CHECKPOINT_MAX_AGE = float(os.environ.get("CHECKPOINT_MAX_AGE", "3600"))
+# Where the kernel messages are read without ES_URL or ES_TARGETS: kmsg (/dev/kmsg or dmesg) or journal
+KERNEL_LOG_SOURCE = os.environ.get("KERNEL_LOG_SOURCE", "kmsg")
+# Run everything in one asyncio event loop instead of threads
+ASYNC_MODE = os.environ.get("ASYNC_MODE", "false").lower() in ("true", "1")
 
 LOG = logging.getLogger("es_oom_exporter")
 
 
-class OomCollector(prometheus_client.registry.Collector):
-    """Collect the OOM."""
-
-    def __init__(self, kube: Kubernetes, message_reader: MessageReader) -> None:
-        self.kube = kube
-        self.message_reader = message_reader
-
-    def collect(self) -> Iterator[GaugeMetricFamily]:
-        try:
-            ooms: List[Oom] = self.message_reader.get_ooms(self.kube)
-            g_oom = GaugeMetricFamily(
-                "pod_process_oom",
-                "OOM events in a POD's container",
-                labels=LABELS,
-            )
-            g_rss_killed = GaugeMetricFamily(
-                "pod_process_oom_rss_container",
-                "RSS in bytes before an OOM events in a POD's container",
-                labels=LABELS,
-            )
-            g_rss = GaugeMetricFamily(
-                "pod_process_oom_rss", "RSS in bytes before an OOM events in a POD's container", labels=LABELS
-            )
-            count_containers: Dict[str, int] = {}
-            rss_containers: Dict[str, Union[float, str]] = {}
-            rss_killed_container: Dict[str, Union[float, str]] = {}
-            for oom in ooms:
-                key = oom.get_key()
-                LOG.warning(
-                    "Killed host: %s, namespace: %s, release: %s, service: %s, pod: %s, container: %s, "
-                    "process: %s, rss: %s, rss_killed: %s",
-                    oom.get_host(),
-                    oom.get_namespace(),
-                    oom.get_release(),
-                    oom.get_service(),
-                    oom.get_pod_name(),
-                    oom.get_container(),
-                    oom.get_process(),
-                    oom.get_rss(),
-                    oom.get_killed_rss(),
-                )
-                if key in count_containers:
-                    count_containers[key] += 1
-                else:
-                    count_containers[key] = 1
-                rss_containers[key] = max(rss_containers.get(key, 0), oom.get_rss())
-                rss_killed_container[key] = max(rss_killed_container.get(key, 0), oom.get_killed_rss())
-
-            for key, count_container in count_containers.items():
-                LOG.warning(
-                    "Killed container: %s count: %s, rss: %s, rss_killed: %s",
-                    key,
-                    count_container,
-                    rss_containers[key],
-                    rss_killed_container[key],
-                )
-                g_oom.add_metric(labels=key, value=count_container)
-                g_rss.add_metric(labels=key, value=cast(float, rss_containers[key]))
-                g_rss_killed.add_metric(labels=key, value=cast(float, rss_killed_container[key]))
-
-            yield g_oom
-            yield g_rss_killed
-            yield g_rss
-        except:  # pylint: disable=bare-except
-            LOG.exception("Error while collecting the OOMs")
-
-
 def main() -> None:
     """Run the command."""
-    logging.config.fileConfig("/app/production.ini", defaults=dict(os.environ))
+    logging.config.fileConfig(LOG_CONFIG, defaults=dict(os.environ))
     logging.getLogger("kubernetes").setLevel(logging.INFO)
-    if "ES_URL" in os.environ:
-        message_reader: MessageReader = ElasticSearch()
+    history = OomHistory(HISTORY_MAX_EVENTS, HISTORY_MAX_AGE) if HISTORY_MAX_EVENTS > 0 else None
+    store = OomStore(OOM_RETENTION, history)
+    ready = threading.Event()
+    exposition = MetricsExposition(store, ready=ready)
+    if not ASYNC_MODE:
+        # Serve the metrics as soon as possible, /ready tells when the first poll is done
+        start_http_server(8080, exposition)
+    # The kubernetes configuration is loaded and the cluster is probed on first use, by the poller
+    if "ES_TARGETS" in os.environ:
+        message_reader: MessageReader = MultiElasticSearch(get_targets(os.environ["ES_TARGETS"]))
+        kube = Kubernetes()
+    elif "ES_URL" in os.environ:
+        message_reader = ElasticSearch()
+        kube = Kubernetes()
     else:
-        message_reader = Dmesg()
-    kube = Kubernetes()
-    prometheus_client.registry.REGISTRY.register(OomCollector(kube, message_reader))
-    prometheus_client.exposition.start_http_server(port=8080)
-    while True:
-        time.sleep(10)
+        message_reader = Journal() if KERNEL_LOG_SOURCE == "journal" else Kmsg()
+        # dmesg only sees the OOMs of the current node
+        kube = Kubernetes(node_name=os.environ["NODE_NAME"])
+    checkpoint = None
+    if CHECKPOINT_FILE is not None:
+        checkpoint = Checkpoint(CHECKPOINT_FILE)
+        message_reader.set_state(checkpoint.load(), CHECKPOINT_MAX_AGE)
+    options = PollerOptions(store, POLL_INTERVAL, checkpoint, ready)
+    if ASYNC_MODE:
+        # aiohttp is only needed in the asyncio mode
+        from es_oom_exporter import aio  # pylint: disable=import-outside-toplevel
+
+        if DEBUG_PORT is not None:
+            LOG.warning("The debug server is not available in the asyncio mode")
+        asyncio.run(aio.run(kube, message_reader, exposition, options, port=8080))
+        return
+    poller = Poller(kube, message_reader, options)
+    poller.start()
+    if DEBUG_PORT is not None:
+        start_debug_server(int(DEBUG_PORT), poller)
+    poller.join()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, Dict, List
 
 from es_oom_exporter.kube import Kubernetes
 from es_oom_exporter.oom import Oom
@@ -9,3 +9,18 @@ class MessageReader:
 
     def get_ooms(self, kube: Kubernetes) -> List[Oom]:
         raise NotImplementedError()
+
+    def backfill(self, kube: Kubernetes) -> List[Oom]:
+        """Get the OOMs of the past, before the first poll."""
+        del kube  # unused
+        return []
+
+    def get_state(self) -> Dict[str, Any]:
+        """Get the cursors to be saved in the checkpoint, must be JSON serializable."""
+        return {}
+
+    def set_state(self, state: Dict[str, Any], max_age: float) -> None:
+        """Restore the cursors from the checkpoint, without going back more than max_age seconds."""
+
+    def close(self) -> None:
+        """Release the resources, e.g. the processes."""
@@ -0,0 +1,38 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+PARTIAL_EVENTS_EVICTED = Counter(
+    "es_oom_exporter_partial_events_evicted",
+    "Partial OOM events evicted before being complete",
+    ["reason"],
+)
+
+# Latency of the stages
+GET_OOMS_SECONDS = Histogram("es_oom_exporter_get_ooms_seconds", "Duration of the polls of the logs")
+ES_SEARCH_SECONDS = Histogram("es_oom_exporter_es_search_seconds", "Duration of the Elasticsearch requests")
+ES_TARGET_POLL_SECONDS = Histogram(
+    "es_oom_exporter_es_target_poll_seconds", "Duration of the polls of an Elasticsearch target", ["target"]
+)
+ES_TARGET_ERRORS = Counter(
+    "es_oom_exporter_es_target_errors", "Failed polls of an Elasticsearch target", ["target"]
+)
+GET_POD_INFOS_SECONDS = Histogram(
+    "es_oom_exporter_get_pod_infos_seconds", "Duration of the resolution of the PODs", ["source"]
+)
+LIST_PODS_SECONDS = Histogram(
+    "es_oom_exporter_list_pods_seconds",
+    "Duration of the POD list calls, the namespace is empty for the list of all the namespaces",
+    ["namespace"],
+)
+
+# Throughput
+LINES_READ = Counter("es_oom_exporter_lines_read", "Log lines (or Elasticsearch hits) read", ["reader"])
+BYTES_READ = Counter("es_oom_exporter_bytes_read", "Bytes of logs read", ["reader"])
+LINES_MATCHED = Counter("es_oom_exporter_lines_matched", "Interesting log lines, by kind", ["kind"])
+UNRESOLVED_PODS = Counter("es_oom_exporter_unresolved_pods", "OOMs with an unknown POD UID")
+UNRESOLVED_CONTAINERS = Counter("es_oom_exporter_unresolved_containers", "OOMs with an unknown container ID")
+
+POD_INDEX_SIZE = Gauge("es_oom_exporter_pod_index_size", "Number of PODs in the index")
+EXPOSITION_RENDERS = Counter(
+    "es_oom_exporter_exposition_renders", "Renderings of the OOM metrics, they are cached between the changes"
+)
+HISTORY_EVENTS = Gauge("es_oom_exporter_history_events", "Number of OOM events in the history")
@@ -1,9 +1,11 @@
 import logging
 import re
-from typing import Any, Dict, Match, Optional
+from typing import Any, Dict, Mapping, Match, Optional
+
+from es_oom_exporter.metrics import UNRESOLVED_CONTAINERS, UNRESOLVED_PODS
+from es_oom_exporter.pod_index import PodInfo
 
 LOG = logging.getLogger(__name__)
-SIZE_RE = re.compile(r"^(\d+)([KMG])B$")
 SIZES = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
 CG_RE = re.compile(r"/kubepods/(?:burstable/)?pod([0-9a-f_-]*)/([0-9a-f]*)")
 
@@ -11,19 +13,36 @@ CG_RE = re.compile(r"/kubepods/(?:burstable/)?pod([0-9a-f_-]*)/([0-9a-f]*)")
 class Oom:
     """Metadata information about the detected OOM."""
 
+    __slots__ = (
+        "_host",
+        "_pod_uid",
+        "_process",
+        "_container_uid",
+        "_containers_stats",
+        "_pod_name",
+        "_namespace",
+        "_release",
+        "_service",
+        "_container",
+        "_timestamp",
+    )
+
     def __init__(self, host: str):
         self._host = host
         self._pod_uid: Optional[str] = None
         self._process: Optional[str] = None
         self._container_uid: Optional[str] = None
-        self._containers_rss: Dict[str, float] = {}
+        # container ID => memory cgroup counter => bytes
+        self._containers_stats: Dict[str, Dict[str, int]] = {}
         self._pod_name: Optional[str] = None
         self._namespace: Optional[str] = None
         self._release: Optional[str] = None
         self._service: Optional[str] = None
         self._container: Optional[str] = None
+        # Time of the log line that completed the OOM, in seconds since the epoch
+        self._timestamp: Optional[float] = None
 
-    def add_start_info(self, matcher: Match[str], pod_infos: Dict[str, Any]) -> None:
+    def add_start_info(self, matcher: Match[str], pod_infos: Mapping[str, PodInfo]) -> None:
         pod_uid = matcher.group(2).replace("_", "-")
         if self._pod_uid is not None:
             LOG.warning("Inconsistent logs (twice the start): %s", matcher.group(0))
@@ -34,6 +53,7 @@ class Oom:
         if pod_info is not None:
             self._add_kubernetes_pod_info(pod_info)
         else:
+            UNRESOLVED_PODS.inc()
             LOG.debug(
                 "Didn't find POD info for %s in [%s]: %s", pod_uid, ", ".join(pod_infos), matcher.group(0)
             )
@@ -46,15 +66,15 @@ class Oom:
             )
             return
 
-        rss = _get_size(matcher.group(4))
         container_uid = matcher.group(3)
-        self._containers_rss[container_uid] = rss
+        # The counters are after the matched part
+        self._containers_stats[container_uid] = parse_memcg_stats(matcher.string[matcher.end() :])
 
     def add_oom_info(self, matcher: Match[str]) -> bool:
         self._process = matcher.group(2)
         return self._container is not None
 
-    def add_oom_kill_info(self, fields: Dict[str, str], pod_infos: Dict[str, Any]) -> bool:
+    def add_oom_kill_info(self, fields: Dict[str, str], pod_infos: Mapping[str, PodInfo]) -> bool:
         pod_match = CG_RE.match(fields.get("task_memcg", ""))
         if not pod_match:
             LOG.warning("Cannot find POD info in %s", fields)
@@ -69,21 +89,24 @@ class Oom:
         if pod_info is not None:
             self._add_kubernetes_pod_info(pod_info)
         else:
+            UNRESOLVED_PODS.inc()
             LOG.info("Didn't find POD info for %s in [%s]: %s", pod_uid, ", ".join(pod_infos), fields)
             return False
         self._process = fields.get("task")
         return True
 
-    def _add_kubernetes_pod_info(self, pod_info: Any) -> None:
-        self._pod_name = pod_info["pod_name"]
-        self._namespace = pod_info["namespace"]
-        self._release = pod_info["release"]
-        self._service = pod_info["service"]
-        container_info = pod_info["containers"].get(self._container_uid)
+    def _add_kubernetes_pod_info(self, pod_info: PodInfo) -> None:
+        assert self._container_uid is not None  # nosec
+        self._pod_name = pod_info.pod_name
+        self._namespace = pod_info.namespace
+        self._release = pod_info.release
+        self._service = pod_info.service
+        container_info = pod_info.get_container(self._container_uid)
         if container_info is not None:
             self._container = container_info
         else:
-            LOG.info("Didn't find container info for %s/%s", pod_info["pod_name"], self._container_uid)
+            UNRESOLVED_CONTAINERS.inc()
+            LOG.info("Didn't find container info for %s/%s", pod_info.pod_name, self._container_uid)
             self._container = "unknown"
 
     def get_release(self) -> Optional[str]:
@@ -107,25 +130,61 @@ class Oom:
     def get_host(self) -> str:
         return self._host
 
+    def get_pod_uid(self) -> Optional[str]:
+        return self._pod_uid
+
+    def get_container_uid(self) -> Optional[str]:
+        return self._container_uid
+
+    def get_timestamp(self) -> Optional[float]:
+        return self._timestamp
+
+    def set_timestamp(self, timestamp: float) -> None:
+        self._timestamp = timestamp
+
     def get_key(self) -> Any:
         return self._namespace, self._pod_name, self._container, self._process, self._host
 
     def get_rss(self) -> float:
-        return sum(self._containers_rss.values())
+        return sum(stats.get("rss", 0) for stats in self._containers_stats.values())
 
     def get_killed_rss(self) -> float:
         assert self._container_uid is not None  # nosec
-        return self._containers_rss.get(self._container_uid, 0)
+        return self._containers_stats.get(self._container_uid, {}).get("rss", 0)
+
+    def get_memcg_stats(self) -> Dict[str, float]:
+        """Get the sum of the memory cgroup counters of all the containers."""
+        result: Dict[str, float] = {}
+        for stats in self._containers_stats.values():
+            for name, value in stats.items():
+                result[name] = result.get(name, 0) + value
+        return result
 
     def __str__(self) -> str:
         assert self._container_uid is not None  # nosec
-        return f"{'/'.join(self.get_key())}={self._containers_rss.get(self._container_uid)}"
+        stats = self._containers_stats.get(self._container_uid)
+        return f"{'/'.join(self.get_key())}={stats.get('rss') if stats is not None else None}"
 
     def __repr__(self) -> str:
         return f"Oom({str(self)})"
 
 
-def _get_size(txt: str) -> int:
-    matcher = SIZE_RE.match(txt)
-    assert matcher, "Cannot parse " + txt  # nosec
-    return int(matcher.group(1)) * SIZES[matcher.group(2)]
+def parse_memcg_stats(text: str) -> Dict[str, int]:
+    """
+    Parse the counters of a "Memory cgroup stats for" line.
+
+    e.g.: " cache:0KB rss:36KB rss_huge:0KB shmem:0KB"
+    => {"cache": 0, "rss": 36864, "rss_huge": 0, "shmem": 0}
+    """
+    result = {}
+    for token in text.split():
+        name, sep, value = token.partition(":")
+        if not sep or len(value) < 3 or value[-1] != "B":
+            continue
+        unit = SIZES.get(value[-2])
+        number = value[:-2]
+        if unit is None or not number.isdigit():
+            LOG.debug("Cannot parse %s", token)
+            continue
+        result[name] = int(number) * unit
+    return result
@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from typing import AbstractSet, Dict, Iterator, Mapping, NamedTuple, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+
+class PodInfo(NamedTuple):
+    """
+    The information we need about a POD.
+
+    The label strings are interned (shared between the PODs) and the containers are a tuple of
+    (container ID, container name), to keep the index small with a lot of PODs.
+    """
+
+    namespace: str
+    release: Optional[str]
+    service: Optional[str]
+    pod_name: str
+    containers: Tuple[Tuple[str, str], ...]
+
+    def get_container(self, container_id: str) -> Optional[str]:
+        """Get the name of a container."""
+        for cur_id, name in self.containers:
+            if cur_id == container_id:
+                return name
+        return None
+
+
+class PodIndex(Mapping[str, PodInfo]):
+    """
+    Long-lived index of the PODs, by POD UID and by container ID.
+
+    The deleted PODs and the containers that disappear from a POD status are kept during a grace period,
+    to be able to resolve the OOM messages we get after the POD is gone.
+    """
+
+    def __init__(self, grace_period: float) -> None:
+        self._grace_period = grace_period
+        self._lock = threading.Lock()
+        self._pods: Dict[str, PodInfo] = {}
+        # container ID => POD UID
+        self._containers: Dict[str, str] = {}
+        # POD UID => expiration time
+        self._pods_expiration: Dict[str, float] = {}
+        # container ID => expiration time
+        self._containers_expiration: Dict[str, float] = {}
+
+    def __getitem__(self, pod_uid: str) -> PodInfo:
+        return self._pods[pod_uid]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._pods))
+
+    def __len__(self) -> int:
+        return len(self._pods)
+
+    def get_container(self, container_id: str) -> Optional[Tuple[PodInfo, str]]:
+        """Get the POD info and the container name for a container ID."""
+        pod_uid = self._containers.get(container_id)
+        if pod_uid is None:
+            return None
+        pod_info = self._pods.get(pod_uid)
+        if pod_info is None:
+            return None
+        container = pod_info.get_container(container_id)
+        if container is None:
+            return None
+        return pod_info, container
+
+    def update(self, pod_uid: str, pod_info: PodInfo) -> None:
+        """Add or update a POD."""
+        with self._lock:
+            now = time.monotonic()
+            self._update(pod_uid, pod_info, now)
+            self._purge(now)
+
+    def remove(self, pod_uid: str) -> None:
+        """Mark a POD as deleted, it will be removed after the grace period."""
+        with self._lock:
+            now = time.monotonic()
+            if pod_uid in self._pods:
+                self._pods_expiration.setdefault(pod_uid, now + self._grace_period)
+            self._purge(now)
+
+    def replace(
+        self, pod_infos: Mapping[str, PodInfo], keep_namespaces: AbstractSet[str] = frozenset()
+    ) -> None:
+        """
+        Replace the content of the index with a full listing of the PODs.
+
+        The PODs of keep_namespaces are kept as is (e.g. the list of the namespace failed).
+        """
+        with self._lock:
+            now = time.monotonic()
+            for pod_uid, pod_info in self._pods.items():
+                if pod_uid not in pod_infos and pod_info.namespace not in keep_namespaces:
+                    self._pods_expiration.setdefault(pod_uid, now + self._grace_period)
+            for pod_uid, pod_info in pod_infos.items():
+                self._update(pod_uid, pod_info, now)
+            self._purge(now)
+
+    def _update(self, pod_uid: str, pod_info: PodInfo, now: float) -> None:
+        self._pods_expiration.pop(pod_uid, None)
+        for container_id, _ in pod_info.containers:
+            self._containers[container_id] = pod_uid
+            self._containers_expiration.pop(container_id, None)
+        prev_pod_info = self._pods.get(pod_uid)
+        if prev_pod_info is not None and prev_pod_info.containers != pod_info.containers:
+            # Keep the containers that disappeared from the status during the grace period
+            container_ids = {container_id for container_id, _ in pod_info.containers}
+            missing = tuple(
+                container for container in prev_pod_info.containers if container[0] not in container_ids
+            )
+            for container_id, _ in missing:
+                self._containers_expiration.setdefault(container_id, now + self._grace_period)
+            if missing:
+                pod_info = pod_info._replace(containers=pod_info.containers + missing)
+        self._pods[pod_uid] = pod_info
+
+    def _purge(self, now: float) -> None:
+        expired_containers = [
+            container_id
+            for container_id, expiration in self._containers_expiration.items()
+            if expiration <= now
+        ]
+        for container_id in expired_containers:
+            del self._containers_expiration[container_id]
+            pod_uid = self._containers.pop(container_id, None)
+            pod_info = self._pods.get(pod_uid) if pod_uid is not None else None
+            if pod_uid is not None and pod_info is not None:
+                containers = tuple(
+                    container for container in pod_info.containers if container[0] != container_id
+                )
+                self._pods[pod_uid] = pod_info._replace(containers=containers)
+
+        expired_pods = [pod_uid for pod_uid, expiration in self._pods_expiration.items() if expiration <= now]
+        for pod_uid in expired_pods:
+            del self._pods_expiration[pod_uid]
+            pod_info = self._pods.pop(pod_uid)
+            for container_id, _ in pod_info.containers:
+                self._containers_expiration.pop(container_id, None)
+                if self._containers.get(container_id) == pod_uid:
+                    del self._containers[container_id]
+        if expired_pods or expired_containers:
+            LOG.debug("Purged %i PODs and %i containers", len(expired_pods), len(expired_containers))
@@ -0,0 +1,138 @@
+import cProfile
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from es_oom_exporter.checkpoint import Checkpoint
+from es_oom_exporter.kube import Kubernetes
+from es_oom_exporter.message_reader import MessageReader
+from es_oom_exporter.metrics import GET_OOMS_SECONDS
+from es_oom_exporter.oom import Oom
+from es_oom_exporter.store import OomStore
+
+LOG = logging.getLogger(__name__)
+
+
+class PollerOptions(NamedTuple):
+    """Where the poller puts the OOMs and its cursors, shared by both pollers."""
+
+    store: OomStore
+    interval: float
+    checkpoint: Optional[Checkpoint] = None
+    # Set by the first poll done with the POD index loaded, the index is loaded in the background
+    ready: Optional[threading.Event] = None
+
+
+class Poller(threading.Thread):
+    """
+    Get the OOMs from the message reader at a regular interval and put them in the store.
+
+    This is the only thread that use the message reader, so the scrapes don't touch its cursors.
+    """
+
+    def __init__(self, kube: Kubernetes, message_reader: MessageReader, options: PollerOptions):
+        super().__init__(name="poller", daemon=True)
+        self.kube = kube
+        self.message_reader = message_reader
+        self.store = options.store
+        self.interval = options.interval
+        self.checkpoint = options.checkpoint
+        self.ready = options.ready if options.ready is not None else threading.Event()
+        self._stop_event = threading.Event()
+        # Held during a poll
+        self._poll_lock = threading.Lock()
+        self._profile: Optional[cProfile.Profile] = None
+
+    def poll(self) -> None:
+        with GET_OOMS_SECONDS.time():
+            ooms = self.message_reader.get_ooms(self.kube)
+        ready = self.ready if self.kube.loaded.is_set() else None
+        end_poll(ooms, self.store, ready, self.checkpoint, self.message_reader.get_state)
+
+    def backfill(self) -> None:
+        try:
+            ooms = self.message_reader.backfill(self.kube)
+        except Exception:  # pylint: disable=broad-except
+            LOG.exception("Error during the backfill")
+            return
+        add_ooms(ooms, self.store)
+
+    def run(self) -> None:
+        try:
+            self._run()
+        finally:
+            self.message_reader.close()
+
+    def _run(self) -> None:
+        self.kube.start()
+        self.backfill()
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            with self._poll_lock:
+                profile = self._profile
+                if profile is not None:
+                    profile.enable()
+                try:
+                    self.poll()
+                except Exception:  # pylint: disable=broad-except
+                    LOG.exception("Error while collecting the OOMs")
+                finally:
+                    if profile is not None:
+                        profile.disable()
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def profile(self, duration: float) -> cProfile.Profile:
+        """Profile the polls done during the next duration seconds."""
+        profile = cProfile.Profile()
+        self._profile = profile
+        self._stop_event.wait(duration)
+        self._profile = None
+        # Wait for the end of the running poll
+        with self._poll_lock:
+            return profile
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def log_ooms(ooms: List[Oom]) -> None:
+    for oom in ooms:
+        LOG.warning(
+            "Killed host: %s, namespace: %s, release: %s, service: %s, pod: %s, container: %s, "
+            "process: %s, rss: %s, rss_killed: %s",
+            oom.get_host(),
+            oom.get_namespace(),
+            oom.get_release(),
+            oom.get_service(),
+            oom.get_pod_name(),
+            oom.get_container(),
+            oom.get_process(),
+            oom.get_rss(),
+            oom.get_killed_rss(),
+        )
+
+
+def add_ooms(ooms: List[Oom], store: OomStore) -> None:
+    log_ooms(ooms)
+    store.add(ooms)
+
+
+def end_poll(
+    ooms: List[Oom],
+    store: OomStore,
+    ready: Optional[threading.Event],
+    checkpoint: Optional[Checkpoint],
+    get_state: Callable[[], Dict[str, Any]],
+) -> None:
+    """Store the OOMs of a poll, tell it's ready (if given) and save the cursors of the reader."""
+    add_ooms(ooms, store)
+    # The polls work even if the checkpoint cannot be saved
+    if ready is not None:
+        ready.set()
+    if checkpoint is None:
+        return
+    try:
+        checkpoint.save(get_state())
+    except Exception:  # pylint: disable=broad-except
+        LOG.exception("Cannot save the checkpoint, the next polls will try again")
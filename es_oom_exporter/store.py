@@ -0,0 +1,73 @@
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from es_oom_exporter.history import OomHistory
+from es_oom_exporter.oom import Oom
+
+
+class ContainerOoms(NamedTuple):
+    """The aggregated OOMs of a container."""
+
+    key: Any
+    nb_ooms: int
+    rss: float
+    rss_killed: float
+    # memory cgroup counter => bytes
+    memcg_stats: Dict[str, float]
+    last_seen: float
+
+
+class OomStore:
+    """
+    Aggregate the OOMs by metric labels.
+
+    Filled by the poller and read by the scrapes, a container is kept until it didn't get any OOM during
+    the retention time. The individual OOMs are also added to the history, if any.
+    """
+
+    def __init__(self, retention: float, history: Optional[OomHistory] = None) -> None:
+        self._retention = retention
+        self.history = history
+        self._lock = threading.Lock()
+        self._containers: Dict[Any, ContainerOoms] = {}
+        self._snapshot: Tuple[ContainerOoms, ...] = ()
+
+    def add(self, ooms: Sequence[Oom]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            for oom in ooms:
+                key = oom.get_key()
+                prev = self._containers.get(key)
+                if prev is None:
+                    self._containers[key] = ContainerOoms(
+                        key, 1, oom.get_rss(), oom.get_killed_rss(), oom.get_memcg_stats(), now
+                    )
+                else:
+                    memcg_stats = dict(prev.memcg_stats)
+                    for name, value in oom.get_memcg_stats().items():
+                        memcg_stats[name] = max(memcg_stats.get(name, 0), value)
+                    self._containers[key] = ContainerOoms(
+                        key,
+                        prev.nb_ooms + 1,
+                        max(prev.rss, oom.get_rss()),
+                        max(prev.rss_killed, oom.get_killed_rss()),
+                        memcg_stats,
+                        now,
+                    )
+            expired: List[Any] = [
+                key
+                for key, container in self._containers.items()
+                if container.last_seen + self._retention < now
+            ]
+            for key in expired:
+                del self._containers[key]
+            if ooms or expired:
+                # A new snapshot only when something changed, the scrapes cache the rendered metrics
+                self._snapshot = tuple(self._containers.values())
+        if ooms and self.history is not None:
+            self.history.add(ooms)
+
+    def get_snapshot(self) -> Tuple[ContainerOoms, ...]:
+        """Get the current state, without waiting on the poller."""
+        return self._snapshot
@@ -1,4 +1,6 @@
-from typing import Optional
+from typing import Iterable, Iterator, Optional
+
+from es_oom_exporter.metrics import BYTES_READ, LINES_READ
 
 
 def ensure_slash(txt: Optional[str]) -> Optional[str]:
@@ -8,3 +10,37 @@ def ensure_slash(txt: Optional[str]) -> Optional[str]:
     if txt.endswith("/"):
         return txt
     return txt + "/"
+
+
+def split_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Get the complete lines of a stream of chunks, without the ending newline.
+
+    Each chunk is decoded at once, only the incomplete last line is copied to be completed by the next
+    chunks, and the invalid UTF-8 bytes are replaced.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            buffer += chunk
+            continue
+        with memoryview(chunk) as view:
+            if buffer:
+                buffer += view[:end]
+                text = buffer.decode(errors="replace")
+                buffer.clear()
+            else:
+                text = str(view[:end], "utf-8", "replace")
+            buffer += view[end + 1 :]
+        yield from text.split("\n")
+
+
+def count_read(chunks: Iterable[bytes], reader: str) -> Iterator[bytes]:
+    """Count the bytes and the lines of a stream of chunks."""
+    bytes_read = BYTES_READ.labels(reader)
+    lines_read = LINES_READ.labels(reader)
+    for chunk in chunks:
+        bytes_read.inc(len(chunk))
+        lines_read.inc(chunk.count(b"\n"))
+        yield chunk
@@ -0,0 +1,117 @@
+import pytest
+from mockito import mock, when
+
+from es_oom_exporter.pod_index import PodInfo
+
+ES_MESSAGES = [
+    "Sep 19 08:35:40 ip-10-10-10-56 kernel: Task in /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod12be0f08_da27_11e9_99ac_069044000888.slice/docker-4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150.scope killed as a result of limit of /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod12be0f08_da27_11e9_99ac_069044000888.slice",  # noqa: E501
+    "Sep 19 08:35:40 ip-10-10-10-56 kernel: Memory cgroup stats for /kubepods.slice/kubepods-burstable.slice/kubepods-burstable-pod12be0f08_da27_11e9_99ac_069044000888.slice/docker-4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150.scope: cache:92KB rss:81440KB rss_huge:0KB mapped_file:60KB swap:0KB inactive_anon:28KB active_anon:81464KB inactive_file:4KB active_file:36KB unevictable:0KB",  # noqa: E501
+    "Sep 19 08:35:40 ip-10-10-10-56 kernel: Memory cgroup out of memory: Kill process 99190 (apache2) score 1534 or sacrifice child",  # noqa: E501
+]
+
+ES_POD_INFOS = {
+    "12be0f08-da27-11e9-99ac-069044000888": PodInfo(
+        namespace="my_ns",
+        release="my_release",
+        service="my_service",
+        pod_name="my_pod",
+        containers=(("4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150", "my_container"),),
+    )
+}
+
+
+def _hit(index, message):
+    timestamp = 1568882140000 + index
+    return {
+        "_source": {"message": message},
+        "fields": {"@timestamp": [str(timestamp)]},
+        "sort": [timestamp, index],
+    }
+
+
+KMSG_POD_INFOS = {
+    "af389229-5fc5-4617-ae95-9160d576eb49": PodInfo(
+        namespace="my_ns",
+        release="my_release",
+        service="my_service",
+        pod_name="my_pod",
+        containers=(("3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84", "my_container"),),
+    )
+}
+
+KMSG_RECORDS = [
+    b"6,1001,21013577527,-;Task in /kubepods/burstable/podaf389229-5fc5-4617-ae95-9160d576eb49/3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84 killed as a result of limit of /kubepods/burstable/podaf389229-5fc5-4617-ae95-9160d576eb49\n",  # noqa: E501
+    b"4,1002,21013577527,-;Some warning\n",
+    b" SUBSYSTEM=cpu\n",
+    b"6,1003,21013577527,-;Memory cgroup stats for /kubepods/burstable/podaf389229-5fc5-4617-ae95-9160d576eb49/3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84: cache:0KB rss:36KB rss_huge:0KB shmem:0KB mapped_file:0KB dirty:0KB writeback:0KB swap:0KB inactive_anon:0KB active_anon:36KB inactive_file:0KB active_file:0KB unevictable:0KB\n",  # noqa: E501
+    b"3,1004,21013577527,-;Memory cgroup out of memory: Kill process 8308 (java) score 1894 or sacrifice child\n",  # noqa: E501
+]
+
+
+def _store_oom(key, rss, rss_killed):
+    oom = mock()
+    when(oom).get_key().thenReturn(key)
+    when(oom).get_rss().thenReturn(rss)
+    when(oom).get_killed_rss().thenReturn(rss_killed)
+    when(oom).get_memcg_stats().thenReturn({"rss": rss, "swap": rss_killed})
+    return oom
+
+
+def _history_oom(namespace, pod, container="my_container", host="toto", process="java", timestamp=None):
+    oom = mock()
+    when(oom).get_timestamp().thenReturn(timestamp)
+    when(oom).get_host().thenReturn(host)
+    when(oom).get_namespace().thenReturn(namespace)
+    when(oom).get_pod_name().thenReturn(pod)
+    when(oom).get_pod_uid().thenReturn(f"{pod}_uid")
+    when(oom).get_container().thenReturn(container)
+    when(oom).get_container_uid().thenReturn(f"{container}_uid")
+    when(oom).get_process().thenReturn(process)
+    when(oom).get_release().thenReturn("my_release")
+    when(oom).get_service().thenReturn("my_service")
+    when(oom).get_rss().thenReturn(10)
+    when(oom).get_killed_rss().thenReturn(5)
+    when(oom).get_memcg_stats().thenReturn({"rss": 10})
+    return oom
+
+
+@pytest.fixture
+def es_messages():
+    return list(ES_MESSAGES)
+
+
+@pytest.fixture
+def es_pod_infos():
+    return dict(ES_POD_INFOS)
+
+
+@pytest.fixture
+def es_hit():
+    return _hit
+
+
+@pytest.fixture
+def kmsg_records():
+    return list(KMSG_RECORDS)
+
+
+@pytest.fixture
+def kmsg_pod_infos():
+    return dict(KMSG_POD_INFOS)
+
+
+@pytest.fixture
+def kube(kmsg_pod_infos):  # pylint: disable=redefined-outer-name
+    result = mock()
+    when(result).get_pod_infos().thenReturn(kmsg_pod_infos)
+    return result
+
+
+@pytest.fixture
+def store_oom():
+    return _store_oom
+
+
+@pytest.fixture
+def history_oom():
+    return _history_oom
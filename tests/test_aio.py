@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+from aiohttp import web
+from mockito import mock, when
+
+from es_oom_exporter import aio
+from es_oom_exporter.es import ElasticSearch
+from es_oom_exporter.kmsg import Kmsg
+
+
+async def _es_get_ooms(monkeypatch, hits, pod_infos):
+    async def search(request):
+        # The request body is decompressed by aiohttp
+        assert request.headers["Content-Encoding"] == "gzip"
+        query = await request.json()
+        assert query["size"] == 500
+        assert request.query["filter_path"].startswith("hits.hits")
+        return web.json_response({"hits": {"hits": hits}})
+
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(pod_infos)
+    app = web.Application()
+    app.router.add_post("/_all/_search", search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setenv("ES_URL", f"http://127.0.0.1:{port}")
+    reader = aio.get_async_reader(ElasticSearch())
+    try:
+        return await reader.get_ooms(aio.AsyncKubernetes(kube))
+    finally:
+        await reader.close()
+        await runner.cleanup()
+
+
+def test_es(monkeypatch, es_messages, es_pod_infos, es_hit):
+    hits = [es_hit(index, message) for index, message in enumerate(es_messages)]
+    ooms = asyncio.run(_es_get_ooms(monkeypatch, hits, es_pod_infos))
+
+    assert [oom.get_process() for oom in ooms] == ["apache2"]
+    assert ooms[0].get_pod_name() == "my_pod"
+
+
+async def _kmsg_wait(kmsg_path, records):
+    reader = aio.get_async_reader(Kmsg(kmsg_path))
+    assert isinstance(reader, aio.AsyncKmsg)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await reader.wait(0.1)
+    # Nothing to read
+    assert loop.time() - start >= 0.1
+
+    writer = os.open(kmsg_path, os.O_WRONLY | os.O_NONBLOCK)
+    try:
+        loop.call_later(0.05, os.write, writer, b"".join(records))
+        start = loop.time()
+        await reader.wait(10)
+        assert loop.time() - start < 5
+    finally:
+        os.close(writer)
+
+
+def test_kmsg_wait(tmp_path, monkeypatch, kmsg_records):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    kmsg_path = str(tmp_path / "kmsg")
+    os.mkfifo(kmsg_path)
+    asyncio.run(_kmsg_wait(kmsg_path, kmsg_records))
@@ -0,0 +1,54 @@
+from es_oom_exporter import assembler
+from es_oom_exporter.metrics import PARTIAL_EVENTS_EVICTED
+
+
+def _nb_evicted(reason):
+    return PARTIAL_EVENTS_EVICTED.labels(reason)._value.get()
+
+
+def test_by_host_and_pod():
+    oom_assembler = assembler.OomAssembler(max_age=300, max_entries=10)
+    oom1 = oom_assembler.start("host1", "pod1")
+    oom2 = oom_assembler.start("host1", "pod2")
+    oom3 = oom_assembler.start("host2", "pod1")
+
+    assert len({id(oom1), id(oom2), id(oom3)}) == 3
+    assert oom_assembler.start("host1", "pod1") is oom1
+    assert oom_assembler.get("host2", "pod1") is oom3
+    assert oom_assembler.get("host2", "pod2") is None
+    assert len(oom_assembler) == 3
+
+    assert oom_assembler.pop_oldest("host1") is oom1
+    assert oom_assembler.pop_oldest("host1") is oom2
+    assert oom_assembler.pop_oldest("host1") is None
+    assert len(oom_assembler) == 1
+
+
+def test_evict_max_entries():
+    nb_evicted = _nb_evicted("max_entries")
+    oom_assembler = assembler.OomAssembler(max_age=300, max_entries=2)
+    oom_assembler.start("host1", "pod1")
+    oom2 = oom_assembler.start("host2", "pod2")
+    oom3 = oom_assembler.start("host1", "pod3")
+
+    assert len(oom_assembler) == 2
+    assert oom_assembler.get("host1", "pod1") is None
+    assert oom_assembler.get("host2", "pod2") is oom2
+    assert oom_assembler.get("host1", "pod3") is oom3
+    assert _nb_evicted("max_entries") == nb_evicted + 1
+
+
+def test_evict_age(monkeypatch):
+    nb_evicted = _nb_evicted("age")
+    now = [1000.0]
+    monkeypatch.setattr(assembler.time, "monotonic", lambda: now[0])
+    oom_assembler = assembler.OomAssembler(max_age=300, max_entries=10)
+    oom_assembler.start("host1", "pod1")
+    now[0] += 200
+    oom2 = oom_assembler.start("host1", "pod2")
+    now[0] += 200
+    oom_assembler.evict()
+
+    assert len(oom_assembler) == 1
+    assert oom_assembler.pop_oldest("host1") is oom2
+    assert _nb_evicted("age") == nb_evicted + 1
@@ -0,0 +1,111 @@
+import gzip
+import io
+import json
+import time
+
+from es_oom_exporter import backfill
+from es_oom_exporter.history import OomEvent
+
+PODS = {
+    "kind": "List",
+    "apiVersion": "v1",
+    "items": [
+        {
+            "metadata": {
+                "name": "my_pod",
+                "namespace": "my_ns",
+                "uid": "12be0f08-da27-11e9-99ac-069044000888",
+                "labels": {"release": "my_release", "service": "my_service"},
+            },
+            "status": {
+                "containerStatuses": [
+                    {
+                        "name": "my_container",
+                        "image": "apache",
+                        "imageID": "",
+                        "ready": True,
+                        "restartCount": 0,
+                        "containerID": "docker://4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150",
+                        "state": {"running": {}},
+                        "lastState": {},
+                    }
+                ]
+            },
+        }
+    ],
+}
+
+
+def test_scan_chunks(tmp_path, es_messages):
+    path = tmp_path / "messages"
+    noise = "Sep 19 08:35:40 ip-10-10-10-56 systemd: noise\n"
+    path.write_text((noise * 3 + "\n".join(es_messages) + "\n") * 5)
+    tasks = backfill.get_tasks(str(path), "syslog", chunk_size=100)
+    assert len(tasks) > 5
+
+    results = [backfill.scan(task) for task in tasks]
+
+    # Every line is read once, whatever the chunk boundaries
+    assert sum(result.nb_lines for result in results) == 30
+    assert sum(result.nb_bytes for result in results) == path.stat().st_size
+    assert [line for result in results for line in result.lines] == es_messages * 5
+
+
+def test_run(tmp_path, es_messages, es_pod_infos):
+    pods_path = tmp_path / "pods.json"
+    pods_path.write_text(json.dumps(PODS))
+    syslog_path = tmp_path / "messages"
+    syslog_path.write_text("\n".join(es_messages * 2) + "\n")
+    ndjson_path = tmp_path / "hits.ndjson"
+    ndjson_path.write_text(
+        "".join(json.dumps({"_source": {"message": message}}) + "\n" for message in es_messages)
+    )
+    pod_infos = backfill.load_pod_infos([str(pods_path)])
+    assert (
+        pod_infos["12be0f08-da27-11e9-99ac-069044000888"]
+        == es_pod_infos["12be0f08-da27-11e9-99ac-069044000888"]
+    )
+
+    output = io.StringIO()
+    summary = backfill.run([str(syslog_path)], pod_infos, output, backfill.Options(jobs=2, chunk_size=200))
+    summary_ndjson = backfill.run(
+        [str(ndjson_path)], pod_infos, io.StringIO(), backfill.Options("ndjson", jobs=1)
+    )
+
+    events = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(events) == 2
+    assert events[0]["host"] == "ip-10-10-10-56"
+    assert events[0]["container"] == "my_container"
+    assert events[0]["process"] == "apache2"
+    assert events[0]["rss"] == 81440 * 1024
+    # Same fields as /ooms
+    assert list(events[0]) == list(OomEvent._fields)
+    assert events[0]["pod_uid"] == "12be0f08-da27-11e9-99ac-069044000888"
+    assert summary["lines"] == 6
+    assert summary["ooms"] == 2
+    assert summary["containers"][0]["nb_ooms"] == 2
+    assert summary["lines_per_second"] > 0
+    assert summary_ndjson["ooms"] == 1
+
+
+def test_run_dmesg(tmp_path):
+    path = tmp_path / "node1.gz"
+    with gzip.open(path, "wt") as dmesg_file:
+        dmesg_file.write(
+            "[10657070.816698] oom-kill:constraint=CONSTRAINT_MEMCG,nodemask=(null),cpuset=4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150,mems_allowed=0,oom_memcg=/kubepods/burstable/pod12be0f08-da27-11e9-99ac-069044000888/4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150,task_memcg=/kubepods/burstable/pod12be0f08-da27-11e9-99ac-069044000888/4304197e5a46240357356250fcaf602bb4930f1b87157b73ae5e240f4a67a150,task=ruby,pid=10506,uid=1000\n"  # noqa: E501
+        )
+    pods_path = tmp_path / "pods.json"
+    pods_path.write_text(json.dumps(PODS))
+
+    output = io.StringIO()
+    start = time.time()
+    summary = backfill.run(
+        [str(path)], backfill.load_pod_infos([str(pods_path)]), output, backfill.Options("dmesg", jobs=1)
+    )
+
+    assert summary["ooms"] == 1
+    assert summary["containers"][0]["host"] == "node1"
+    event = json.loads(output.getvalue())
+    assert event["process"] == "ruby"
+    # The time since the boot of an archived dmesg cannot be converted
+    assert start <= event["timestamp"] <= time.time()
@@ -0,0 +1,53 @@
+import time
+
+from es_oom_exporter.checkpoint import Checkpoint
+from es_oom_exporter.es import ElasticSearch
+from es_oom_exporter.kmsg import Kmsg
+
+
+def test_checkpoint(tmp_path):
+    checkpoint_path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(str(checkpoint_path))
+    assert checkpoint.load() == {}
+
+    checkpoint.save({"last_timestamp": 42, "search_after": [42, 1]})
+    assert Checkpoint(str(checkpoint_path)).load() == {"last_timestamp": 42, "search_after": [42, 1]}
+    # No temporary file left
+    assert [path.name for path in tmp_path.iterdir()] == ["checkpoint.json"]
+
+    checkpoint_path.write_text("{broken")
+    assert Checkpoint(str(checkpoint_path)).load() == {}
+
+
+def test_es_max_age(monkeypatch):
+    monkeypatch.setenv("ES_URL", "http://localhost:9200")
+    elastic_search = ElasticSearch()
+    now = int(time.time() * 1000)
+
+    elastic_search.set_state({"last_timestamp": now - 1000, "search_after": [now - 1000, 1]}, max_age=3600)
+    assert elastic_search.get_state() == {"last_timestamp": now - 1000, "search_after": [now - 1000, 1]}
+
+    elastic_search.set_state({"last_timestamp": 42, "search_after": [42, 1]}, max_age=3600)
+    assert elastic_search.search_after is None
+    assert elastic_search.last_timestamp >= now - 3600 * 1000
+
+
+def test_kmsg_resume(monkeypatch, tmp_path, kmsg_records, kube):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    kmsg_path = tmp_path / "kmsg"
+    kmsg_path.write_bytes(b"".join(kmsg_records))
+    kmsg = Kmsg(str(kmsg_path))
+    kmsg.set_state({}, max_age=1e10)
+    assert len(kmsg.get_ooms(kube)) == 1
+    state = kmsg.get_state()
+    assert state["seq"] == 1004
+
+    # Restart
+    kmsg = Kmsg(str(kmsg_path))
+    kmsg.set_state(state, max_age=1e10)
+    assert kmsg.get_ooms(kube) == []
+
+    # Reboot
+    kmsg = Kmsg(str(kmsg_path))
+    kmsg.set_state({**state, "boot_id": "other"}, max_age=1e10)
+    assert len(kmsg.get_ooms(kube)) == 1
@@ -0,0 +1,28 @@
+from es_oom_exporter.classifier import LineKind
+from es_oom_exporter.dmesg import CLASSIFIER
+from es_oom_exporter.metrics import LINES_MATCHED
+
+
+def test_classify():
+    assert CLASSIFIER.classify("[21013.577527] eth0: link up") is None
+    assert CLASSIFIER.classify("[21013.577527] Memory cgroup something else") is None
+    # Pre-filter match but not the regular expression
+    assert CLASSIFIER.classify("[21013.577527] Task in /user.slice killed as a result of limit") is None
+
+    kind, match = CLASSIFIER.classify(
+        "[21013.577527] Memory cgroup out of memory: Kill process 8308 (java) score 1894 or sacrifice child"
+    )
+    assert kind is LineKind.OOM
+    assert match.group(2) == "java"
+
+    kind, match = CLASSIFIER.classify("[10657070.816698] oom-kill:constraint=CONSTRAINT_MEMCG,task=ruby")
+    assert kind is LineKind.OOM_KILL
+    assert match.group(2) == "constraint=CONSTRAINT_MEMCG,task=ruby"
+
+
+def test_matched_counter():
+    matched = LINES_MATCHED.labels("oom_kill")
+    before = matched._value.get()
+    CLASSIFIER.classify("[10657070.816698] oom-kill:constraint=CONSTRAINT_MEMCG,task=ruby")
+    CLASSIFIER.classify("[10657070.816698] eth0: link up")
+    assert matched._value.get() == before + 1
@@ -0,0 +1,56 @@
+import threading
+import time
+import urllib.request
+
+from mockito import mock, when
+
+from es_oom_exporter import debug
+from es_oom_exporter.poller import Poller, PollerOptions
+from es_oom_exporter.store import OomStore
+
+
+def _busy_loop(stop_event):
+    while not stop_event.is_set():
+        time.sleep(0.001)
+
+
+def test_sample_stacks():
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_busy_loop, args=(stop_event,))
+    thread.start()
+    try:
+        stacks = debug.sample_stacks(0.1)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    assert any("_busy_loop (test_debug.py:" in line for line in stacks.splitlines())
+    for line in stacks.splitlines():
+        assert int(line.rsplit(" ", 1)[1]) > 0
+
+
+def test_server():
+    message_reader = mock()
+    when(message_reader).backfill(...).thenReturn([])
+    when(message_reader).get_ooms(...).thenReturn([])
+    poller = Poller(
+        mock({"loaded": threading.Event()}), message_reader, PollerOptions(OomStore(300), interval=0.01)
+    )
+    poller.start()
+    server = debug.start_debug_server(0, poller)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{url}/debug/threads") as response:
+            assert 'Thread "poller"' in response.read().decode()
+        with urllib.request.urlopen(f"{url}/debug/profile?seconds=0.1&top=5") as response:
+            assert "poll" in response.read().decode()
+        with urllib.request.urlopen(f"{url}/debug/tracemalloc") as response:
+            assert response.read().decode().startswith("Started")
+        with urllib.request.urlopen(f"{url}/debug/tracemalloc?top=5") as response:
+            assert response.read().decode().startswith("Traced memory:")
+        with urllib.request.urlopen(f"{url}/debug/tracemalloc?stop=1") as response:
+            assert response.read().decode().startswith("Stopped")
+    finally:
+        server.shutdown()
+        poller.stop()
+        poller.join()
@@ -1,6 +1,11 @@
+import time
+
 from mockito import mock, when
 
 from es_oom_exporter.dmesg import Dmesg
+from es_oom_exporter.metrics import LINES_MATCHED
+from es_oom_exporter.oom import parse_memcg_stats
+from es_oom_exporter.pod_index import PodInfo
 
 
 def test_new_kernel(monkeypatch):
@@ -9,15 +14,15 @@ def test_new_kernel(monkeypatch):
     kube = mock()
     when(kube).get_pod_infos().thenReturn(
         {
-            "792adfde-d139-4c9c-a89e-ae94f36ea69d": {
-                "namespace": "my_ns",
-                "release": "my_release",
-                "service": "my_service",
-                "pod_name": "my_pod",
-                "containers": {
-                    "7a982186b58cec345c4a3f635809c7e04afc930453a5dbb5cbc9d4d49f662761": "my_container"
-                },
-            }
+            "792adfde-d139-4c9c-a89e-ae94f36ea69d": PodInfo(
+                namespace="my_ns",
+                release="my_release",
+                service="my_service",
+                pod_name="my_pod",
+                containers=(
+                    ("7a982186b58cec345c4a3f635809c7e04afc930453a5dbb5cbc9d4d49f662761", "my_container"),
+                ),
+            )
         }
     )
 
@@ -33,19 +38,21 @@ def test_new_kernel(monkeypatch):
 
 def test_old_kernel(monkeypatch):
     monkeypatch.setenv("NODE_NAME", "toto")
+    monkeypatch.setattr(time, "time", lambda: 1600000000.0)
+    monkeypatch.setattr(time, "monotonic", lambda: 30000.0)
     dmesg = Dmesg()
     kube = mock()
     when(kube).get_pod_infos().thenReturn(
         {
-            "af389229-5fc5-4617-ae95-9160d576eb49": {
-                "namespace": "my_ns",
-                "release": "my_release",
-                "service": "my_service",
-                "pod_name": "my_pod",
-                "containers": {
-                    "3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84": "my_container"
-                },
-            }
+            "af389229-5fc5-4617-ae95-9160d576eb49": PodInfo(
+                namespace="my_ns",
+                release="my_release",
+                service="my_service",
+                pod_name="my_pod",
+                containers=(
+                    ("3b3d031aca1bab63c359a8aac8c18e373ac90373faf12c69e5225aec01fc9c84", "my_container"),
+                ),
+            )
         }
     )
 
@@ -60,3 +67,32 @@ def test_old_kernel(monkeypatch):
     )
 
     assert list(map(repr, ooms)) == ["Oom(my_ns/my_pod/my_container/java/toto=36864)"]
+    assert ooms[0].get_memcg_stats()["active_anon"] == 36864
+    # Time of the last line, since the epoch
+    assert ooms[0].get_timestamp() == 1600000000.0 - 30000.0 + 21013.577530
+
+
+def test_already_seen(monkeypatch):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    dmesg = Dmesg()
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn({})
+    oom_kill = b"[%d.000000] oom-kill:constraint=CONSTRAINT_MEMCG,task_memcg=/kubepods/pod1/2,task=ruby\n"
+    matched = LINES_MATCHED.labels("oom_kill")
+    dmesg._process_ooms([oom_kill % 10, b"[   11.000000] eth0: link up\n"], kube)
+    before = matched._value.get()
+
+    # dmesg returns all the lines again, only the new ones are classified
+    dmesg._process_ooms([oom_kill % 10, b"[   11.000000] eth0: link up\n", oom_kill % 12], kube)
+
+    assert matched._value.get() == before + 1
+    assert dmesg.get_state()["prev_timestamp"] == 12.0
+
+
+def test_parse_memcg_stats():
+    assert parse_memcg_stats(" cache:92KB rss:81440KB rss_huge:0KB swap:1MB invalid:xKB other") == {
+        "cache": 94208,
+        "rss": 83394560,
+        "rss_huge": 0,
+        "swap": 1048576,
+    }
@@ -0,0 +1,288 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mockito import mock, verify, when
+
+from es_oom_exporter import es
+
+
+def test_pagination(monkeypatch, es_messages, es_pod_infos, es_hit):
+    monkeypatch.setenv("ES_URL", "http://localhost:9200")
+    monkeypatch.setattr(es, "ES_PAGE_SIZE", 2)
+    elastic_search = es.ElasticSearch()
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(es_pod_infos)
+    hits = [es_hit(index, message) for index, message in enumerate(es_messages)]
+    when(elastic_search)._search().thenReturn(hits[:2]).thenReturn(hits[2:])
+
+    ooms = elastic_search.get_ooms(kube)
+
+    assert list(map(repr, ooms)) == ["Oom(my_ns/my_pod/my_container/apache2/ip-10-10-10-56=83394560)"]
+    # Time of the last line
+    assert ooms[0].get_timestamp() == 1568882140.002
+    assert elastic_search.last_timestamp == 1568882140002
+    assert elastic_search.search_after == [1568882140002, 2]
+    assert elastic_search._get_query()["search_after"] == [1568882140002, 2]
+
+
+def test_interleaved_between_polls(monkeypatch, es_messages, es_pod_infos, es_hit):
+    monkeypatch.setenv("ES_URL", "http://localhost:9200")
+    elastic_search = es.ElasticSearch()
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(es_pod_infos)
+    other_host = [message.replace("ip-10-10-10-56", "ip-10-10-10-57") for message in es_messages]
+    messages = [es_messages[0], other_host[0], other_host[1], es_messages[1], other_host[2], es_messages[2]]
+    hits = [es_hit(index, message) for index, message in enumerate(messages)]
+    when(elastic_search)._search().thenReturn(hits[:4]).thenReturn(hits[4:])
+
+    # The page is not full, so the first poll stops after the first page
+    assert elastic_search.get_ooms(kube) == []
+    ooms = elastic_search.get_ooms(kube)
+
+    assert list(map(repr, ooms)) == [
+        "Oom(my_ns/my_pod/my_container/apache2/ip-10-10-10-57=83394560)",
+        "Oom(my_ns/my_pod/my_container/apache2/ip-10-10-10-56=83394560)",
+    ]
+
+
+class _FakeElasticSearch(BaseHTTPRequestHandler):
+    """Point in time and sliced searches, the hits of the slices are given by the server."""
+
+    server: ThreadingHTTPServer
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return json.loads(body)
+
+    def _send(self, response):
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if self.path.startswith("/_all/_pit?"):
+            self._send(self.server.pit)
+            return
+        query = self._read_body()
+        self.server.queries.append(query)
+        hits = self.server.slices[query["slice"]["id"]]
+        if "search_after" in query:
+            hits = [hit for hit in hits if hit["sort"] > query["search_after"]]
+        self._send({"pit_id": "pit1", "hits": {"hits": hits[: query["size"]]}})
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self.server.closed.append(self._read_body()["id"])
+        self._send({"succeeded": True})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def test_backfill(monkeypatch, es_messages, es_pod_infos, es_hit):
+    monkeypatch.setattr(es, "ES_PAGE_SIZE", 2)
+    monkeypatch.setattr(es, "ES_BACKFILL_HOURS", 1.0)
+    monkeypatch.setattr(es, "ES_BACKFILL_SLICES", 2)
+    other_host = [message.replace("ip-10-10-10-56", "ip-10-10-10-57") for message in es_messages]
+    messages = [es_messages[0], other_host[0], es_messages[1], other_host[1], es_messages[2], other_host[2]]
+    hits = [es_hit(index, message) for index, message in enumerate(messages)]
+    for hit in hits:
+        # Implicit tiebreaker of the point in time searches
+        hit["sort"].append(hit["sort"][1])
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeElasticSearch)
+    # The lines of each host are split between the slices
+    server.slices = [[hits[0], hits[3], hits[4]], [hits[1], hits[2], hits[5]]]
+    server.pit = {"id": "pit1"}
+    server.queries = []
+    server.closed = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ES_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(es_pod_infos)
+    try:
+        elastic_search = es.ElasticSearch()
+        ooms = elastic_search.backfill(kube)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert list(map(repr, ooms)) == [
+        "Oom(my_ns/my_pod/my_container/apache2/ip-10-10-10-56=83394560)",
+        "Oom(my_ns/my_pod/my_container/apache2/ip-10-10-10-57=83394560)",
+    ]
+    # 2 pages per slice
+    assert len(server.queries) == 4
+    assert {query["pit"]["id"] for query in server.queries} == {"pit1"}
+    time_range = server.queries[0]["query"]["bool"]["filter"][-1]["range"]["@timestamp"]
+    assert time_range["lt"] - time_range["gte"] == 3600 * 1000
+    assert server.closed == ["pit1"]
+    # The polls start where the backfill ended
+    assert elastic_search.last_timestamp == time_range["lt"]
+    assert elastic_search.search_after is None
+    assert "search_after" not in elastic_search._get_query()
+
+
+def test_backfill_error(monkeypatch):
+    monkeypatch.setattr(es, "ES_BACKFILL_HOURS", 1.0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeElasticSearch)
+    # Unexpected response, without the id of the point in time
+    server.pit = {"error": "toto"}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ES_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    kube = mock()
+    try:
+        elastic_search = es.ElasticSearch()
+        before = int(time.time() * 1000)
+        ooms = elastic_search.backfill(kube)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert ooms == []
+    # The polls read the logs from the start of the backfill
+    assert before - 3600 * 1000 <= elastic_search.last_timestamp <= time.time() * 1000 - 3600 * 1000
+    assert elastic_search.search_after is None
+    verify(kube, times=0).get_pod_infos()
+
+
+def test_multi_targets(monkeypatch, es_messages, es_pod_infos, es_hit):
+    monkeypatch.setattr(es, "ES_TARGET_WAIT", 0.2)
+    monkeypatch.setenv("EU_AUTH", "Basic ZXU=")
+    targets = es.get_targets(
+        json.dumps(
+            [
+                {"name": "eu", "url": "http://eu:9200", "auth_env": "EU_AUTH"},
+                {"name": "us", "url": "http://us:9200", "indexes": "logs-*"},
+                {"name": "asia", "url": "http://asia:9200"},
+            ]
+        )
+    )
+    eu, us, asia = targets
+    assert eu.session.headers["Authorization"] == "Basic ZXU="
+    assert us.search_url == "http://us:9200/logs-*/_search"
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(es_pod_infos)
+    hits = [es_hit(index, message) for index, message in enumerate(es_messages)]
+    asia_hits = [
+        es_hit(index, message.replace("ip-10-10-10-56", "asia")) for index, message in enumerate(es_messages)
+    ]
+    when(eu)._search().thenReturn(hits).thenReturn([])
+    when(us)._search().thenRaise(ValueError("broken"))
+    slow = threading.Event()
+
+    def asia_search():
+        slow.wait(10)
+        return asia_hits
+
+    asia._search = asia_search
+    reader = es.MultiElasticSearch(targets)
+    errors = es.ES_TARGET_ERRORS.labels("us")._value.get()
+
+    # The slow target doesn't delay the others
+    ooms = reader.get_ooms(kube)
+    assert [oom.get_host() for oom in ooms] == ["ip-10-10-10-56"]
+    assert es.ES_TARGET_ERRORS.labels("us")._value.get() == errors + 1
+    assert reader.get_state()["targets"]["eu"]["last_timestamp"] == 1568882140002
+    assert reader.get_state()["targets"]["asia"]["search_after"] is None
+
+    slow.set()
+    asia._search = lambda: []
+    # Still polled, not restarted
+    assert [oom.get_host() for oom in reader.get_ooms(kube)] == ["asia"]
+    assert reader.get_state()["targets"]["asia"]["search_after"] == [1568882140002, 2]
+    # The POD index is shared
+    verify(kube, times=1).get_pod_infos()
+
+
+def test_multi_close(monkeypatch, es_pod_infos):
+    monkeypatch.setattr(es, "ES_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(es, "ES_TARGET_WAIT", 0.1)
+    targets = es.get_targets(
+        json.dumps([{"name": "eu", "url": "http://eu:9200"}, {"name": "us", "url": "http://us:9200"}])
+    )
+    slow = threading.Event()
+    for target in targets:
+        target._search = lambda: slow.wait(10) and []
+        when(target.session).close().thenReturn(None)
+    kube = mock()
+    when(kube).get_pod_infos().thenReturn(es_pod_infos)
+    reader = es.MultiElasticSearch(targets)
+    assert reader.get_ooms(kube) == []
+
+    reader.close()
+    slow.set()
+    # The queued poll is cancelled, the sessions are closed
+    assert reader._futures["us"].cancelled()
+    for target in targets:
+        verify(target.session).close()
+
+
+def test_tiebreaker():
+    # The offset is only unique in a file, so in a host
+    assert es._get_query_template()["sort"] == [
+        {"@timestamp": {"order": "asc"}},
+        {"host.name": {"order": "asc", "unmapped_type": "keyword"}},
+        {"log.offset": {"order": "asc", "unmapped_type": "long"}},
+    ]
+
+
+class _RecordingElasticSearch(BaseHTTPRequestHandler):
+    """Record the search requests, answer with the given responses."""
+
+    server: ThreadingHTTPServer
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), body, self.client_address))
+        response = json.dumps(self.server.responses.pop(0)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def test_search_requests(monkeypatch, es_hit):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RecordingElasticSearch)
+    server.requests = []
+    server.responses = [{"hits": {"hits": [es_hit(1, "Sep 19 08:35:40 toto kernel: noise")]}}, {}]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ES_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    kube = mock()
+    try:
+        elastic_search = es.ElasticSearch()
+        start = elastic_search.last_timestamp
+        elastic_search.get_ooms(kube)
+        elastic_search.get_ooms(kube)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    (path1, headers1, body1, client1), (path2, headers2, body2, client2) = server.requests
+    assert path1 == path2 == "/_all/_search?filter_path=" + es.FILTER_PATH.replace(",", "%2C")
+    assert headers1["Content-Encoding"] == headers2["Content-Encoding"] == "gzip"
+    # Same session, same connection
+    assert client1 == client2
+    query1, query2 = json.loads(gzip.decompress(body1)), json.loads(gzip.decompress(body2))
+    assert query1["track_total_hits"] is False
+    assert query1["query"]["bool"]["filter"][-1]["range"]["@timestamp"]["gte"] == start
+    assert "search_after" not in query1
+    # Only the range bound and the cursor change
+    assert query2.pop("search_after") == [1568882140001, 1]
+    query2["query"]["bool"]["filter"][-1]["range"]["@timestamp"]["gte"] = start
+    assert query2 == query1
+
+    # No stale cursor after a restore
+    elastic_search.set_state({}, max_age=3600)
+    assert "search_after" not in elastic_search._get_query()
@@ -0,0 +1,115 @@
+import gzip
+import json
+import threading
+import urllib.request
+
+from prometheus_client import CollectorRegistry, Counter
+
+from es_oom_exporter.exposition import MetricsExposition, RequestHeaders, start_http_server
+from es_oom_exporter.history import OomHistory
+from es_oom_exporter.metrics import EXPOSITION_RENDERS
+from es_oom_exporter.store import OomStore
+
+KEY = ("my_ns", "my_pod", "my_container", "java", "toto")
+
+
+def _renders():
+    return EXPOSITION_RENDERS._value.get()
+
+
+def test_cache(store_oom):
+    registry = CollectorRegistry()
+    scrapes = Counter("scrapes", "Scrapes", registry=registry)
+    store = OomStore(retention=60)
+    store.add([store_oom(KEY, 10, 5)])
+    exposition = MetricsExposition(store, registry)
+
+    renders = _renders()
+    plain = exposition.get_response("/metrics").body
+    scrapes.inc()
+    compressed = exposition.get_response("/metrics", RequestHeaders(accept_encoding="gzip")).body
+    assert _renders() == renders + 1
+    assert b'pod_process_oom{container="my_container"' in plain
+    assert b"scrapes_total 0.0" in plain
+    # The cached OOM metrics and the exporter metrics are two gzip members
+    assert gzip.decompress(compressed) == plain.replace(b"scrapes_total 0.0", b"scrapes_total 1.0")
+
+    # No change
+    store.add([])
+    exposition.get_response("/metrics")
+    assert _renders() == renders + 1
+    store.add([store_oom(KEY, 20, 5)])
+    assert b"pod_process_oom_rss{" in exposition.get_response("/metrics").body
+    assert _renders() == renders + 2
+
+
+def test_etag_openmetrics(store_oom):
+    store = OomStore(retention=60)
+    store.add([store_oom(KEY, 10, 5)])
+    exposition = MetricsExposition(store, CollectorRegistry())
+
+    response = exposition.get_response(
+        "/metrics/oom", RequestHeaders(accept="application/openmetrics-text; version=1.0.0")
+    )
+    assert response.headers["Content-Type"].startswith("application/openmetrics-text")
+    assert response.body.count(b"# EOF\n") == 1
+    assert response.body.endswith(b"# EOF\n")
+    etag = response.headers["ETag"]
+
+    not_modified = exposition.get_response("/metrics/oom", RequestHeaders(if_none_match=f'"other", {etag}'))
+    assert not_modified.status == 200
+    not_modified = exposition.get_response(
+        "/metrics/oom", RequestHeaders(accept="application/openmetrics-text", if_none_match=etag)
+    )
+    assert not_modified.status == 304
+    assert not_modified.body == b""
+
+    store.add([store_oom(KEY, 20, 5)])
+    response = exposition.get_response(
+        "/metrics/oom", RequestHeaders(accept="application/openmetrics-text", if_none_match=etag)
+    )
+    assert response.status == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_server(store_oom):
+    store = OomStore(retention=60)
+    store.add([store_oom(KEY, 10, 5)])
+    server = start_http_server(0, MetricsExposition(store, CollectorRegistry()), address="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        request = urllib.request.Request(f"{url}/metrics", headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(request) as response:  # nosec
+            assert response.headers["Content-Encoding"] == "gzip"
+            assert b"pod_process_oom{" in gzip.decompress(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ready():
+    ready = threading.Event()
+    exposition = MetricsExposition(OomStore(retention=60), CollectorRegistry(), ready=ready)
+
+    assert exposition.get_response("/ready").status == 503
+    ready.set()
+    assert exposition.get_response("/ready").status == 200
+
+
+def test_history(history_oom):
+    store = OomStore(retention=60, history=OomHistory(max_events=100, max_age=3600))
+    store.add([history_oom("my_ns", "my_pod"), history_oom("other_ns", "other_pod")])
+    exposition = MetricsExposition(store, CollectorRegistry())
+
+    response = exposition.get_response("/ooms", query="namespace=my_ns&since=1h&limit=10")
+    assert response.status == 200
+    data = json.loads(response.body)
+    assert [event["pod"] for event in data["events"]] == ["my_pod"]
+    assert data["retained"] == 2
+    assert not data["truncated"]
+
+    response = exposition.get_response("/ooms", RequestHeaders(accept_encoding="gzip"), query="limit=1")
+    assert json.loads(gzip.decompress(response.body))["truncated"]
+    assert exposition.get_response("/ooms", query="other=1").status == 400
+    assert exposition.get_response("/ooms", query="since=yesterday").status == 400
+    assert MetricsExposition(OomStore(retention=60)).get_response("/ooms").status == 404
@@ -0,0 +1,92 @@
+import time
+
+from es_oom_exporter.history import OomHistory
+
+
+def test_query(monkeypatch, history_oom):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    history = OomHistory(max_events=100, max_age=3600)
+    for i in range(10):
+        history.add([history_oom(f"ns{i % 2}", f"pod{i}"), history_oom("other", f"pod{i}", process="ruby")])
+        now[0] += 60
+
+    events, truncated = history.query({"namespace": "ns1"})
+    assert [event.pod for event in events] == ["pod9", "pod7", "pod5", "pod3", "pod1"]
+    assert not truncated
+    assert events[0].to_json()["rss_killed"] == 5
+    assert events[0].to_json()["pod_uid"] == "pod9_uid"
+
+    events, truncated = history.query({"namespace": "ns0"}, since=1060, until=1300)
+    assert [(event.pod, event.timestamp) for event in events] == [("pod4", 1240), ("pod2", 1120)]
+    assert not truncated
+    events, truncated = history.query({"namespace": "ns0"}, since=1060, until=1300, limit=1)
+    assert [event.pod for event in events] == ["pod4"]
+    assert truncated
+
+    # Several filters
+    assert len(history.query({"process": "ruby"})[0]) == 10
+    assert [e.pod for e in history.query({"namespace": "other", "pod": "pod3", "process": "ruby"})[0]] == [
+        "pod3"
+    ]
+    assert history.query({"host": "unknown"}) == ([], False)
+
+
+def test_eviction(monkeypatch, history_oom):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    history = OomHistory(max_events=5, max_age=100)
+    for i in range(8):
+        history.add([history_oom("my_ns", f"pod{i}")])
+        now[0] += 10
+
+    # By count
+    assert len(history) == 5
+    assert [event.pod for event in history.query({"namespace": "my_ns"})[0]] == [
+        "pod7",
+        "pod6",
+        "pod5",
+        "pod4",
+        "pod3",
+    ]
+
+    # By age
+    now[0] += 75
+    assert [event.pod for event in history.query({})[0]] == ["pod7", "pod6"]
+    now[0] += 100
+    assert history.query({"namespace": "my_ns"}) == ([], False)
+    history.add([history_oom("my_ns", "pod8")])
+    assert [event.pod for event in history.query({"namespace": "my_ns"})[0]] == ["pod8"]
+
+
+def test_line_timestamps(monkeypatch, history_oom):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    history = OomHistory(max_events=4, max_age=100)
+    history.add([history_oom("my_ns", "pod1", timestamp=990), history_oom("my_ns", "pod2", timestamp=950)])
+    # Late line, e.g. from a slow host
+    history.add([history_oom("my_ns", "pod3", timestamp=960)])
+    # Without line time
+    history.add([history_oom("other_ns", "pod4")])
+
+    assert [(event.pod, event.timestamp) for event in history.query({})[0]] == [
+        ("pod4", 1000),
+        ("pod1", 990),
+        ("pod3", 960),
+        ("pod2", 950),
+    ]
+    assert [event.pod for event in history.query({"namespace": "my_ns"}, since=955, until=995)[0]] == [
+        "pod1",
+        "pod3",
+    ]
+    assert [event.pod for event in history.query({}, until=960)[0]] == ["pod3", "pod2"]
+
+    # Already too old
+    history.add([history_oom("my_ns", "pod5", timestamp=800)])
+    assert len(history) == 4
+    # The oldest by line time are evicted first
+    history.add([history_oom("my_ns", "pod6", timestamp=955)])
+    assert [event.pod for event in history.query({"namespace": "my_ns"})[0]] == ["pod1", "pod3", "pod6"]
+    now[0] += 58
+    assert [event.pod for event in history.query({"namespace": "my_ns"})[0]] == ["pod1", "pod3"]
+    assert [event.pod for event in history.query({})[0]] == ["pod4", "pod1", "pod3"]
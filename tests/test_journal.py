@@ -0,0 +1,100 @@
+import os
+import select
+import time
+
+import pytest
+
+from es_oom_exporter.journal import ExportParser, Journal
+
+EXPORT_FILE = os.path.join(os.path.dirname(__file__), "journal.export")
+
+
+def _read_export():
+    with open(EXPORT_FILE, "rb") as export_file:
+        return export_file.read()
+
+
+def test_parser():
+    data = _read_export()
+    entries = ExportParser().feed(data)
+
+    assert len(entries) == 5
+    assert entries[0]["MESSAGE"] == b"eth0: link becomes ready"
+    assert entries[0]["PRIORITY"] == b"6"
+    # Binary field
+    assert entries[1]["MESSAGE"].startswith(b"Task in /kubepods/burstable/podaf389229")
+    assert entries[1]["MESSAGE"].endswith(b"\n")
+
+    # Same result when the entries are split between the chunks
+    parser = ExportParser()
+    assert [entry for i in range(len(data)) for entry in parser.feed(data[i : i + 1])] == entries
+
+
+def test_journal(monkeypatch, kube):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    journal = Journal()
+    monkeypatch.setattr(journal, "_get_command", lambda: ["cat", EXPORT_FILE])
+
+    ooms = []
+    for _ in range(100):
+        ooms += journal.get_ooms(kube)
+        if journal._process is None:
+            break
+        time.sleep(0.01)
+
+    assert list(map(repr, ooms)) == ["Oom(my_ns/my_pod/my_container/java/toto=36864)"]
+    assert journal.get_state()["cursor"].startswith("s=6c2b2e7e3a1c4f3e9d1f6f0e5b4a3c21;i=1a2f;")
+
+
+def test_command():
+    journal = Journal.__new__(Journal)
+    journal._directory = "/host/journal"
+    journal._cursor = None
+    journal._max_age = None
+    journal._process = None
+    assert journal._get_command()[-3:] == ["--directory=/host/journal", "--boot", "_TRANSPORT=kernel"]
+
+    journal.set_state({"cursor": "s=42"}, max_age=3600)
+    assert journal._get_command()[-2:] == ["--after-cursor=s=42", "_TRANSPORT=kernel"]
+
+    journal.set_state({}, max_age=3600)
+    assert journal._get_command()[-2:] == ["--since=-3600s", "_TRANSPORT=kernel"]
+
+
+def test_restart(monkeypatch):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    journal = Journal()
+    monkeypatch.setattr(journal, "_get_command", lambda: ["sleep", "60"])
+    journal.fileno()
+    process = journal._process
+
+    # A new state replaces the process
+    journal.set_state({"cursor": "s=42"}, max_age=3600)
+    assert journal._process is None
+    assert process.returncode is not None
+    assert process.stdout.closed
+
+    journal.fileno()
+    process = journal._process
+    journal.close()
+    assert journal._process is None
+    assert process.returncode is not None
+    assert process.stdout.closed
+
+
+def test_read_error(monkeypatch, kube):
+    def feed(parser, data):
+        raise ValueError(data)
+
+    monkeypatch.setenv("NODE_NAME", "toto")
+    journal = Journal()
+    monkeypatch.setattr(journal, "_get_command", lambda: ["sh", "-c", "echo toto; sleep 60"])
+    monkeypatch.setattr(ExportParser, "feed", feed)
+    select.select([journal.fileno()], [], [], 10)
+    process = journal._process
+
+    with pytest.raises(ValueError):
+        journal.get_ooms(kube)
+    assert journal._process is None
+    assert process.returncode is not None
+    assert process.stdout.closed
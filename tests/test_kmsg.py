@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from es_oom_exporter.kmsg import Kmsg
+
+
+def test_kmsg(monkeypatch, tmp_path, kmsg_records, kube):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    kmsg_path = tmp_path / "kmsg"
+    kmsg_path.write_bytes(b"6,1000,21000000000,-;Some noise\n")
+    kmsg = Kmsg(str(kmsg_path))
+
+    assert kmsg.get_ooms(kube) == []
+
+    # Same timestamp for all the messages
+    with kmsg_path.open("ab") as kmsg_file:
+        kmsg_file.write(b"".join(kmsg_records))
+    ooms = kmsg.get_ooms(kube)
+    assert list(map(repr, ooms)) == ["Oom(my_ns/my_pod/my_container/java/toto=36864)"]
+
+    assert kmsg.get_ooms(kube) == []
+
+    fd = kmsg.fileno()
+    kmsg.close()
+    assert kmsg.fileno() is None
+    with pytest.raises(OSError):
+        os.fstat(fd)
+
+
+def test_kmsg_already_seen(monkeypatch, tmp_path, kmsg_records, kube):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    kmsg_path = tmp_path / "kmsg"
+    kmsg_path.write_bytes(b"".join(kmsg_records))
+    kmsg = Kmsg(str(kmsg_path))
+    kmsg._seq = 1004
+
+    assert kmsg.get_ooms(kube) == []
+
+
+def test_fallback(monkeypatch, tmp_path):
+    monkeypatch.setenv("NODE_NAME", "toto")
+    kmsg = Kmsg(str(tmp_path / "missing"))
+
+    assert kmsg._fd is None
@@ -0,0 +1,315 @@
+import json
+import subprocess  # nosec
+import sys
+from types import SimpleNamespace
+
+import kubernetes.client
+import kubernetes.watch
+import pytest
+from kubernetes.client import V1ListMeta, V1ObjectMeta, V1Pod, V1PodList
+from kubernetes.client.api_client import ApiClient
+from kubernetes.client.exceptions import ApiException
+from mockito import mock, when
+
+from es_oom_exporter import kube as kube_module
+from es_oom_exporter.kube import Kubernetes, get_pod_info
+from es_oom_exporter.pod_index import PodInfo
+
+
+def test_kubelet_pod_info():
+    # Trimmed output of the kubelet /pods endpoint
+    kubelet_pods = {
+        "kind": "PodList",
+        "apiVersion": "v1",
+        "metadata": {},
+        "items": [
+            {
+                "metadata": {
+                    "name": "my_pod",
+                    "namespace": "my_ns",
+                    "uid": "792adfde-d139-4c9c-a89e-ae94f36ea69d",
+                    "labels": {
+                        "app.kubernetes.io/instance": "my_release",
+                        "app.kubernetes.io/name": "my_app",
+                    },
+                },
+                "spec": {"nodeName": "toto", "containers": [{"name": "my_container"}]},
+                "status": {
+                    "containerStatuses": [
+                        {
+                            "name": "my_container",
+                            "image": "ruby",
+                            "imageID": "",
+                            "ready": True,
+                            "restartCount": 1,
+                            "containerID": "docker://7a982186",
+                            "state": {"running": {}},
+                            "lastState": {
+                                "terminated": {"exitCode": 137, "containerID": "docker://3b3d031a"}
+                            },
+                        }
+                    ]
+                },
+            }
+        ],
+    }
+    pods = ApiClient().deserialize(SimpleNamespace(data=json.dumps(kubelet_pods)), "V1PodList")
+
+    pod_info = get_pod_info(pods.items[0])
+    assert pod_info == PodInfo(
+        namespace="my_ns",
+        release="my_release",
+        service="my_app",
+        pod_name="my_pod",
+        containers=(("7a982186", "my_container"), ("3b3d031a", "my_container")),
+    )
+    # The label strings are shared between the PODs
+    assert pod_info.namespace is sys.intern("my_ns")
+
+
+def _pod_info(namespace, name):
+    return PodInfo(namespace=namespace, release=None, service=None, pod_name=name, containers=())
+
+
+def _kubernetes():
+    kube = Kubernetes()
+    kube._api = mock()
+    return kube
+
+
+def test_list_concurrently(monkeypatch):
+    monkeypatch.setattr(kube_module, "POD_SOURCE", "list")
+    kube = _kubernetes()
+    when(kube).get_namespaces().thenReturn(["ns1", "ns2"])
+    when(kube)._get_pod_infos_ns("ns1").thenReturn({"pod1": _pod_info("ns1", "pod1")})
+    when(kube)._get_pod_infos_ns("ns2").thenReturn({"pod2": _pod_info("ns2", "pod2")})
+    assert set(kube.get_pod_infos()) == {"pod1", "pod2"}
+
+    # The PODs of the failed namespace are kept as is
+    when(kube)._get_pod_infos_ns("ns1").thenReturn({"pod3": _pod_info("ns1", "pod3")})
+    when(kube)._get_pod_infos_ns("ns2").thenRaise(ApiException(status=500))
+    pod_infos = kube.get_pod_infos()
+    assert set(pod_infos) == {"pod1", "pod2", "pod3"}
+    assert pod_infos._pods_expiration.keys() == {"pod1"}
+
+
+def test_list_paginated(monkeypatch):
+    monkeypatch.setattr(kube_module, "POD_LIST_STRATEGY", "paginated")
+    pages = {
+        None: V1PodList(
+            items=[V1Pod(metadata=V1ObjectMeta(uid="pod1", name="pod1", namespace="ns1"))],
+            metadata=V1ListMeta(_continue="next"),
+        ),
+        "next": V1PodList(
+            items=[V1Pod(metadata=V1ObjectMeta(uid="pod2", name="pod2", namespace="ns2"))],
+            metadata=V1ListMeta(),
+        ),
+    }
+    calls = []
+
+    class FakeCoreV1Api:
+        def __init__(self, api):
+            pass
+
+        def list_pod_for_all_namespaces(self, limit, _continue, _request_timeout):
+            calls.append(_continue)
+            return pages[_continue]
+
+    monkeypatch.setattr(kubernetes.client, "CoreV1Api", FakeCoreV1Api)
+    monkeypatch.setattr(
+        kube_module, "get_pod_info", lambda pod: _pod_info(pod.metadata.namespace, pod.metadata.name)
+    )
+    kube = _kubernetes()
+
+    pod_infos, failed_namespaces = kube._list_pod_infos()
+    assert set(pod_infos) == {"pod1", "pod2"}
+    assert failed_namespaces == set()
+    assert calls == [None, "next"]
+
+
+def test_lazy_import():
+    # Nothing is run on import, and the kubernetes client is imported on first use
+    code = "import sys, es_oom_exporter.main; assert 'kubernetes' not in sys.modules, 'kubernetes'"
+    subprocess.run([sys.executable, "-c", code], check=True, timeout=60)  # nosec
+
+
+class _StopWatching(BaseException):
+    """Get out of the endless watch loop."""
+
+
+class _FakeWatch:
+    """Play the given streams, one per call, an exception is raised instead of being yielded."""
+
+    streams = []
+    calls = []
+
+    def __init__(self):
+        self.resource_version = None
+
+    def stream(self, func, *args, **kwargs):
+        _FakeWatch.calls.append(kwargs)
+        for event in _FakeWatch.streams.pop(0):
+            if isinstance(event, BaseException):
+                raise event
+            if isinstance(event, str):
+                self.resource_version = event
+            else:
+                yield event
+
+
+def _event(event_type, uid):
+    return {"type": event_type, "object": V1Pod(metadata=V1ObjectMeta(uid=uid, name=uid, namespace="ns"))}
+
+
+def _patch_watch(monkeypatch, streams):
+    monkeypatch.setattr(kubernetes.watch, "Watch", _FakeWatch)
+    monkeypatch.setattr(_FakeWatch, "streams", streams)
+    monkeypatch.setattr(_FakeWatch, "calls", [])
+    monkeypatch.setattr(
+        kube_module, "get_pod_info", lambda pod: _pod_info(pod.metadata.namespace, pod.metadata.name)
+    )
+
+
+def test_watch(monkeypatch):
+    _patch_watch(
+        monkeypatch,
+        [
+            [_event("ADDED", "pod1"), _event("ADDED", "pod2"), _event("MODIFIED", "pod1"), "5"],
+            [_event("DELETED", "pod2"), ApiException(status=410)],
+            [_event("ADDED", "pod4"), _StopWatching()],
+        ],
+    )
+    kube = _kubernetes()
+    kube._field_selector = None
+    when(kube)._get_list_pods_call().thenReturn((lambda: None, []))
+    kube._index.replace({"pod0": _pod_info("ns", "pod0")})
+
+    def relist():
+        kube._index.replace({"pod3": _pod_info("ns", "pod3")})
+        return "9"
+
+    kube._relist = relist
+
+    with pytest.raises(_StopWatching):
+        kube._watch("1")
+
+    # Resumed from the resource version of the previous watch, re-listed after the 410
+    assert [call["resource_version"] for call in _FakeWatch.calls] == ["1", "5", "9"]
+    assert set(kube._index) == {"pod0", "pod1", "pod2", "pod3", "pod4"}
+    # The PODs that disappeared are kept during the grace period
+    assert kube._index._pods_expiration.keys() == {"pod0", "pod1", "pod2"}
+
+
+def test_relist_timeout(monkeypatch):
+    calls = []
+
+    def list_pods(*args, **kwargs):
+        calls.append(kwargs)
+        return V1PodList(items=[], metadata=V1ListMeta(resource_version="42"))
+
+    kube = _kubernetes()
+    kube._field_selector = None
+    when(kube)._get_list_pods_call().thenReturn((list_pods, []))
+
+    assert kube._relist() == "42"
+    assert calls == [{"field_selector": None, "_request_timeout": kube_module.POD_LIST_TIMEOUT}]
+
+
+class _FakeCoreV1Api:
+    """Record the calls of the POD lists."""
+
+    calls = []
+
+    def __init__(self, api):
+        pass
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        _FakeCoreV1Api.calls.append(("list_pod_for_all_namespaces", kwargs))
+        return V1PodList(items=[], metadata=V1ListMeta(resource_version="42"))
+
+
+def _node_kubernetes(monkeypatch):
+    monkeypatch.setattr(kubernetes.client, "CoreV1Api", _FakeCoreV1Api)
+    monkeypatch.setattr(_FakeCoreV1Api, "calls", [])
+    kube = _kubernetes()
+    kube._node_name = "toto"
+    kube._field_selector = "spec.nodeName=toto"
+    return kube
+
+
+def test_node_list(monkeypatch):
+    monkeypatch.setattr(kube_module, "POD_SOURCE", "list")
+    kube = _node_kubernetes(monkeypatch)
+
+    kube.get_pod_infos()
+
+    assert [(name, kwargs["field_selector"]) for name, kwargs in _FakeCoreV1Api.calls] == [
+        ("list_pod_for_all_namespaces", "spec.nodeName=toto")
+    ]
+
+
+def test_node_watch(monkeypatch):
+    _patch_watch(monkeypatch, [[_StopWatching()]])
+    kube = _node_kubernetes(monkeypatch)
+
+    with pytest.raises(_StopWatching):
+        kube._watch(None)
+
+    # The re-list and the watch
+    assert [(name, kwargs["field_selector"]) for name, kwargs in _FakeCoreV1Api.calls] == [
+        ("list_pod_for_all_namespaces", "spec.nodeName=toto")
+    ]
+    assert [call["field_selector"] for call in _FakeWatch.calls] == ["spec.nodeName=toto"]
+
+
+def test_kubelet(monkeypatch):
+    monkeypatch.setattr(kube_module, "POD_SOURCE", "kubelet")
+    monkeypatch.setattr(kube_module, "KUBELET_URL", "https://10.0.0.1:10250")
+    kube = _node_kubernetes(monkeypatch)
+    kube._api = ApiClient(kubernetes.client.Configuration(host="https://apiserver:6443"))
+    kube._kubelet_api = None
+    monkeypatch.setattr(
+        kube_module, "get_pod_info", lambda pod: _pod_info(pod.metadata.namespace, pod.metadata.name)
+    )
+    requests = []
+
+    def call_api(api, path, method, **kwargs):
+        requests.append((api.configuration.host, method, path))
+        return V1PodList(items=[V1Pod(metadata=V1ObjectMeta(uid="pod1", name="pod1", namespace="ns"))])
+
+    monkeypatch.setattr(ApiClient, "call_api", call_api)
+
+    assert set(kube.get_pod_infos()) == {"pod1"}
+    assert requests == [("https://10.0.0.1:10250", "GET", "/pods")]
+    # Nothing is asked to the API server
+    assert _FakeCoreV1Api.calls == []
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_start(monkeypatch):
+    # The watch thread is stopped after the first list
+    _patch_watch(monkeypatch, [[_StopWatching()]])
+    kube = _node_kubernetes(monkeypatch)
+
+    kube.start()
+
+    # The first OOM waits for the first list of the watch thread
+    assert kube.get_pod_infos() is kube._index
+    assert kube.loaded.is_set()
+    kube._watch_thread.join(10)
+    assert [name for name, _ in _FakeCoreV1Api.calls] == ["list_pod_for_all_namespaces"]
+
+
+def test_watch_forbidden(monkeypatch):
+    _patch_watch(monkeypatch, [[ApiException(status=403)]])
+    kube = _kubernetes()
+    kube._field_selector = None
+    when(kube)._get_list_pods_call().thenReturn((lambda: None, []))
+    when(kube)._list_pod_infos().thenReturn(({"pod1": _pod_info("ns1", "pod1")}, set()))
+
+    # Without the cluster-wide permissions, the PODs are listed by namespace
+    kube._watch("1")
+
+    assert kube._pod_source == "list"
+    assert kube.loaded.is_set()
+    assert set(kube.get_pod_infos()) == {"pod1"}
@@ -0,0 +1,75 @@
+import time
+
+from es_oom_exporter.pod_index import PodIndex, PodInfo
+
+
+def _pod_info(containers):
+    return PodInfo(
+        namespace="my_ns",
+        release="my_release",
+        service="my_service",
+        pod_name="my_pod",
+        containers=tuple(containers.items()),
+    )
+
+
+def test_lookup():
+    index = PodIndex(grace_period=60)
+    index.replace({"pod1": _pod_info({"c1": "my_container"})})
+
+    assert index.get("pod1").pod_name == "my_pod"
+    assert index.get("pod2") is None
+    assert index.get_container("c1") == (index["pod1"], "my_container")
+    assert index.get_container("c2") is None
+    assert list(index) == ["pod1"]
+
+
+def test_grace_period(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    index = PodIndex(grace_period=60)
+    index.update("pod1", _pod_info({"c1": "my_container"}))
+    index.update("pod2", _pod_info({}))
+
+    # The container restarted
+    index.update("pod1", _pod_info({"c2": "my_container"}))
+    index.remove("pod2")
+    assert index.get_container("c1") is not None
+    assert index.get_container("c2") is not None
+    assert "pod2" in index
+
+    now[0] += 61
+    index.update("pod1", _pod_info({"c2": "my_container"}))
+    assert index.get_container("c1") is None
+    assert index.get_container("c2") is not None
+    assert "pod2" not in index
+
+
+def test_replace_keeps_the_missing_pods(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    index = PodIndex(grace_period=60)
+    index.replace({"pod1": _pod_info({"c1": "my_container"})})
+
+    index.replace({"pod2": _pod_info({"c2": "my_container"})})
+    assert index.get_container("c1") is not None
+
+    # The POD is back (e.g. missed event during a re-list)
+    index.replace({"pod1": _pod_info({"c1": "my_container"}), "pod2": _pod_info({})})
+    now[0] += 61
+    index.replace({"pod1": _pod_info({"c1": "my_container"}), "pod2": _pod_info({})})
+    assert index.get_container("c1") is not None
+    assert index.get_container("c2") is None
+
+
+def test_expired_container(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    index = PodIndex(grace_period=60)
+    index.update("pod1", _pod_info({"c1": "my_container"}))
+    index.update("pod1", _pod_info({"c2": "my_container"}))
+    assert index["pod1"].containers == (("c2", "my_container"), ("c1", "my_container"))
+
+    now[0] += 61
+    index.remove("pod2")
+    assert index["pod1"].containers == (("c2", "my_container"),)
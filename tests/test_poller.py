@@ -0,0 +1,53 @@
+import threading
+
+from mockito import mock, verify, when
+from prometheus_client import CollectorRegistry
+
+from es_oom_exporter.exposition import MetricsExposition
+from es_oom_exporter.poller import Poller, PollerOptions
+from es_oom_exporter.store import OomStore
+
+
+def _kube():
+    loaded = threading.Event()
+    loaded.set()
+    return mock({"loaded": loaded})
+
+
+def test_checkpoint_error(store_oom):
+    kube = _kube()
+    reader = mock()
+    when(reader).get_ooms(kube).thenReturn(
+        [store_oom(("my_ns", "my_pod", "my_container", "java", "toto"), 10, 5)]
+    )
+    when(reader).get_state().thenReturn({"last_timestamp": 42})
+    checkpoint = mock()
+    when(checkpoint).save({"last_timestamp": 42}).thenRaise(OSError("Read-only file system"))
+    store = OomStore(retention=60)
+    poller = Poller(kube, reader, PollerOptions(store, interval=10, checkpoint=checkpoint))
+
+    poller.poll()
+
+    assert poller.ready.is_set()
+    assert len(store.get_snapshot()) == 1
+
+
+def test_ready():
+    kube = mock({"loaded": threading.Event()})
+    reader = mock()
+    when(reader).get_ooms(kube).thenReturn([])
+    when(reader).get_state().thenReturn({})
+    store = OomStore(retention=60)
+    poller = Poller(kube, reader, PollerOptions(store, interval=10))
+    exposition = MetricsExposition(store, CollectorRegistry(), ready=poller.ready)
+    assert exposition.get_response("/ready").status == 503
+
+    # The cursor is initialized, but the POD index is still loading
+    poller.poll()
+    assert exposition.get_response("/ready").status == 503
+
+    kube.loaded.set()
+    poller.poll()
+    assert exposition.get_response("/ready").status == 200
+    # Without OOM, the polls don't wait for the PODs
+    verify(kube, times=0).get_pod_infos()
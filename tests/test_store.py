@@ -0,0 +1,27 @@
+import time
+
+from es_oom_exporter.store import OomStore
+
+
+def test_store(monkeypatch, store_oom):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    key1 = ("my_ns", "my_pod", "my_container", "java", "toto")
+    key2 = ("my_ns", "my_pod", "my_container", "ruby", "toto")
+    store = OomStore(retention=60)
+
+    store.add([store_oom(key1, 10, 5), store_oom(key1, 20, 1)])
+    snapshot = store.get_snapshot()
+    assert [(c.key, c.nb_ooms, c.rss, c.rss_killed, c.memcg_stats) for c in snapshot] == [
+        (key1, 2, 20, 5, {"rss": 20, "swap": 5})
+    ]
+
+    now[0] += 30
+    store.add([store_oom(key2, 10, 5)])
+    assert [(c.key, c.nb_ooms) for c in store.get_snapshot()] == [(key1, 2), (key2, 1)]
+    # The previous snapshot is not modified
+    assert len(snapshot) == 1
+
+    now[0] += 31
+    store.add([])
+    assert [(c.key, c.nb_ooms) for c in store.get_snapshot()] == [(key2, 1)]
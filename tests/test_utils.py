@@ -0,0 +1,18 @@
+from es_oom_exporter.metrics import BYTES_READ, LINES_READ
+from es_oom_exporter.utils import count_read, split_lines
+
+
+def test_split_lines():
+    chunks = [b"first\nsec", b"ond", b"\nthird \xff\xfe line\n\nincomplete"]
+
+    assert list(split_lines(chunks)) == ["first", "second", "third �� line", ""]
+
+
+def test_count_read():
+    lines_read = LINES_READ.labels("test")
+    bytes_read = BYTES_READ.labels("test")
+    chunks = [b"first\nsec", b"ond\n"]
+
+    assert list(count_read(chunks, "test")) == chunks
+    assert lines_read._value.get() == 2
+    assert bytes_read._value.get() == 13